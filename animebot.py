@@ -1,7 +1,13 @@
 import asyncio
+import bisect
+import hashlib
 import json
+import mmap
+import os
+import struct
+import sys
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, Iterable, Iterator, Tuple, Union
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
@@ -11,23 +17,545 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
+from delivery import RateLimiter, DeliveryQueue, FileCursorStore, FileDeadLetters
 
 # 🔐 Sozlamalar
 BOT_TOKEN = "BOT_TOKEN"
 ADMINS = [5873723609]  # ← O'zingizning Telegram ID
+FLUSH_DELAY = 2.0  # O'zgarishlarni diskka yozishdan oldin kutish (soniya)
+
+DATA_FILE = Path("data.json")  # /export natijasi: o'qish uchun qulay nusxa
+EXPORT_SEQ_FILE = Path("data.json.seq")  # data.json qaysi jurnal yozuvigacha eksport qilingani
+SNAPSHOT_FILE = Path("data.bin")  # ixcham ikkilik snapshot (mmap orqali o'qiladi)
+JOURNAL_FILE = Path("data.journal")
+COMPACT_EVERY = 500  # Shuncha yozuvdan keyin jurnal snapshotga jamlanadi
+WATCH_INTERVAL = 5.0  # data.json tashqaridan o'zgarganini tekshirish oralig'i (soniya)
+PAGE_SIZE = 10  # /list_seasons va /admin_list sahifasidagi fasllar soni
+DEAD_LETTER_FILE = Path("dead_letters.jsonl")  # Qayta urinib bo'lmaydigan yuborish xatolari
+CURSORS_FILE = Path("cursors.jsonl")  # (foydalanuvchi, fasl) bo'yicha yuborilgan qismlar soni
+
+LEGACY_SNAPSHOT_FILE = Path("data.snapshot.json")  # oldingi JSON snapshot
+
+# 📂 Boshlang'ich ma'lumot: oldingi JSON snapshot yoki eski data.json
+def initial_data() -> Tuple[int, Dict[str, Any]]:
+    if LEGACY_SNAPSHOT_FILE.exists():
+        snapshot = json.loads(LEGACY_SNAPSHOT_FILE.read_text(encoding="utf-8"))
+        return snapshot["seq"], snapshot["data"]
+    if DATA_FILE.exists():
+        with open(DATA_FILE, "r") as f:
+            return 0, json.load(f)
+    return 0, {}
+
+def read_export_seq() -> Optional[int]:
+    """data.json qaysi jurnal yozuvigacha eksport qilingani; belgi bo'lmasa None"""
+    try:
+        return int(EXPORT_SEQ_FILE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+def file_stat(path: Path) -> Optional[Tuple[int, int]]:
+    """Faylning (mtime, hajm) belgisi; fayl bo'lmasa None"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+# 📒 Jurnal: har bir o'zgarish bitta qator bo'lib qo'shiladi, vaqti-vaqti bilan snapshot olinadi
+def write_temp(path: Path, payload: Union[str, bytes]) -> Path:
+    """Yonidagi vaqtinchalik nusxani diskka yozish; joyiga qo'yish (os.replace) chaqiruvchida"""
+    tmp = path.with_name(path.name + ".tmp")
+    if isinstance(payload, bytes):
+        f = open(tmp, "wb")
+    else:
+        f = open(tmp, "w", encoding="utf-8")
+    with f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp
+
+def write_atomic(path: Path, payload: Union[str, bytes]) -> None:
+    """Faylni vaqtinchalik nusxa orqali yozish (uzilishda eski fayl butun qoladi)"""
+    os.replace(write_temp(path, payload), path)
+
+class Journal:
+    """Faqat qo'shiladigan jurnal; snapshotdan keyingi yozuvlar ishga tushishda qayta o'ynaladi"""
+
+    def __init__(self, journal_file: Path):
+        self.journal_file = journal_file
+        self.seq = 0  # oxirgi yozuv raqami
+        self.records = 0  # snapshotdan keyin jurnalda nechta yozuv bor
+
+    def replay(self, apply: Callable[[Dict[str, Any]], None]) -> None:
+        """Snapshotdan keyingi yozuvlarni qo'llash; yarim yozilgan oxirgi qator tashlanadi"""
+        if not self.journal_file.exists():
+            return
+        good = 0
+        with open(self.journal_file, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    break
+                good += len(raw)
+                if record["seq"] > self.seq:
+                    try:
+                        apply(record)
+                    except (KeyError, IndexError, TypeError) as e:
+                        # Masalan, o'chirilgan faslga fayl yoki maydoni yo'q yozuv: tashlanadi, bot ishga tushaveradi
+                        print(f"Jurnal yozuvi o'tkazib yuborildi (seq={record['seq']}): {e!r}")
+                    self.seq = record["seq"]
+                    self.records += 1
+        if good < self.journal_file.stat().st_size:
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(good)
+
+    def encode(self, record: Dict[str, Any]) -> str:
+        self.seq += 1
+        return json.dumps({"seq": self.seq, **record}, ensure_ascii=False) + "\n"
+
+    def append(self, lines: List[str]) -> None:
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            start = f.tell()
+            try:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError:
+                # Yarim yozilgan qator keyingi qo'shishni buzmasin
+                f.truncate(start)
+                raise
+        self.records += len(lines)
+
+    def truncate(self) -> None:
+        with open(self.journal_file, "w", encoding="utf-8"):
+            pass
+        self.records = 0
+
+# 🧊 Ixcham ikkilik snapshot
+# Tuzilishi: sarlavha | satr ofsetlari (u32) | fasllar jadvali (kalit bo'yicha saralangan) |
+# fayllar jadvali | satrlar (UTF-8). Bir xil satrlar (nom, file_id, tavsif) bir marta saqlanadi.
+SNAPSHOT_MAGIC = b"ANIC"
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct("<4sIQIII")  # magic, versiya, seq, fasllar, fayllar, satrlar
+SEASON_ROW = struct.Struct("<IIII")  # kalit, nom, birinchi fayl, fayllar soni
+FILE_ROW = struct.Struct("<III")  # file_id, tavsif, raqam
+OFFSET = struct.Struct("<II")  # satr boshi va oxiri
+
+def build_snapshot(seq: int, seasons: Iterable[Tuple[str, Dict[str, Any]]]) -> bytes:
+    """Fasllardan ikkilik snapshot yasash"""
+    strings: Dict[str, int] = {}
+
+    def intern(text: str) -> int:
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    season_rows = []
+    file_rows = []
+    # Kalitlar UTF-8 baytlari bo'yicha saralanadi: qidiruv ham baytlarni solishtiradi
+    for key, season in sorted(seasons, key=lambda item: item[0].encode("utf-8")):
+        season_rows.append((intern(key), intern(season["title"]), len(file_rows), len(season["files"])))
+        for number, file_info in enumerate(season["files"], 1):
+            if isinstance(file_info, str):
+                file_info = {"file_id": file_info}  # eski data.json: fayllar faqat file_id satrlari
+            file_rows.append((intern(file_info["file_id"]), intern(file_info.get("caption") or ""), file_info.get("number") or number))
+
+    blob = bytearray()
+    offsets = bytearray()
+    for text in strings:
+        encoded = text.encode("utf-8")
+        offsets += OFFSET.pack(len(blob), len(blob) + len(encoded))
+        blob += encoded
+
+    out = bytearray(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, seq, len(season_rows), len(file_rows), len(strings)))
+    out += offsets
+    for row in season_rows:
+        out += SEASON_ROW.pack(*row)
+    for row in file_rows:
+        out += FILE_ROW.pack(*row)
+    out += blob
+    return bytes(out)
+
+class CatalogSnapshot:
+    """data.bin ni mmap qiladi: fasl kalit bo'yicha ikkilik qidiruv bilan, butun katalogni o'qimasdan topiladi.
+    Bir nechta jarayon bitta faylni ochsa, sahifa keshi ular orasida bo'linadi."""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.seq, self.season_count, file_count, string_count = HEADER.unpack_from(self._mm, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} snapshot formati noma'lum")
+        self._offsets = HEADER.size
+        self._seasons = self._offsets + OFFSET.size * string_count
+        self._files = self._seasons + SEASON_ROW.size * self.season_count
+        self._blob = self._files + FILE_ROW.size * file_count
+
+    def _bytes(self, index: int) -> bytes:
+        start, end = OFFSET.unpack_from(self._mm, self._offsets + OFFSET.size * index)
+        return self._mm[self._blob + start:self._blob + end]
+
+    def _str(self, index: int) -> str:
+        return self._bytes(index).decode("utf-8")
+
+    def _row(self, position: int) -> Tuple[int, int, int, int]:
+        return SEASON_ROW.unpack_from(self._mm, self._seasons + SEASON_ROW.size * position)
+
+    def _find(self, season_key: str) -> Optional[Tuple[int, int, int, int]]:
+        target = season_key.encode("utf-8")
+        low, high = 0, self.season_count
+        while low < high:
+            middle = (low + high) // 2
+            row = self._row(middle)
+            probe = self._bytes(row[0])
+            if probe == target:
+                return row
+            if probe < target:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __contains__(self, season_key: str) -> bool:
+        return self._find(season_key) is not None
+
+    def get(self, season_key: str) -> Optional[Dict[str, Any]]:
+        """Faqat shu faslni o'qib, lug'at ko'rinishida qaytarish"""
+        row = self._find(season_key)
+        if row is None:
+            return None
+        _, title, first_file, file_count = row
+        files = []
+        for position in range(first_file, first_file + file_count):
+            file_id, caption, number = FILE_ROW.unpack_from(self._mm, self._files + FILE_ROW.size * position)
+            files.append({"file_id": self._str(file_id), "caption": self._str(caption), "number": number})
+        return {"title": self._str(title), "files": files}
+
+    def titles(self) -> Iterator[Tuple[str, str]]:
+        for position in range(self.season_count):
+            key, title, _, _ = self._row(position)
+            yield self._str(key), self._str(title)
+
+    def close(self) -> None:
+        self._mm.close()
+
+# 📄 Fasllar nom bo'yicha tartiblangan indeksi: ro'yxat sahifalab ko'rsatiladi
+class SeasonIndex:
+    """(nom, kalit) bo'yicha tartiblangan ro'yxat; bitta sahifani olish O(sahifa hajmi)"""
+
+    def __init__(self, titles: Callable[[], Iterable[Tuple[str, str]]]):
+        self._titles = titles  # indeks eskirganda qayta qurish manbai: (kalit, nom) juftliklari
+        self._entries: Optional[List[Tuple[str, str, str]]] = None
+
+    def reset(self) -> None:
+        self._entries = None
+
+    def add(self, season_key: str, title: str) -> None:
+        if self._entries is not None:
+            bisect.insort(self._entries, (title.casefold(), season_key, title))
+
+    def remove(self, season_key: str, title: str) -> None:
+        if self._entries is not None:
+            entry = (title.casefold(), season_key, title)
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+
+    def page(self, number: int, size: int = PAGE_SIZE) -> Tuple[int, List[Tuple[str, str]], bool]:
+        """(sahifa raqami, (kalit, nom) juftliklari, keyingi sahifa bormi); ro'yxat qisqargan bo'lsa 0-sahifa"""
+        if self._entries is None:
+            self._entries = sorted((title.casefold(), key, title) for key, title in self._titles())
+        if number * size >= len(self._entries):
+            number = 0
+        start = number * size
+        chunk = self._entries[start:start + size]
+        return number, [(key, title) for _, key, title in chunk], start + size < len(self._entries)
+
+# 🗂️ Katalog: snapshot mmap'da, undan keyingi o'zgarishlar xotiradagi qatlamda
+class Catalog:
+    """Fasllarni mmap qilingan snapshotdan o'qiydi, o'zgarishlarni jurnalga jamlab yozadi"""
+
+    def __init__(self, flush_delay: float = FLUSH_DELAY):
+        self.flush_delay = flush_delay
+        self.journal = Journal(JOURNAL_FILE)
+        self.snapshot: Optional[CatalogSnapshot] = None
+        # Snapshotdan keyin o'zgargan fasllar (None - o'chirilgan) va ular o'zgargan yozuv raqami
+        self.overlay: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._touched: Dict[str, int] = {}
+        self._pending: List[str] = []  # hali diskka tushmagan jurnal qatorlari
+        self.index = SeasonIndex(self.titles)
+        self._io_lock = asyncio.Lock()  # jurnal va snapshotga bir vaqtda bitta yozuvchi
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._watcher: Optional[asyncio.Task] = None
+        # data.json ning oxirgi ma'lum holati: (mtime, hajm) va sha256
+        self._source_stat: Optional[Tuple[int, int]] = None
+        self._source_hash: Optional[str] = None
+        self.reload()
+
+    def reload(self) -> None:
+        """Snapshot va jurnaldan katalogni tiklash"""
+        self.index.reset()
+        if not SNAPSHOT_FILE.exists():
+            seq, seasons = initial_data()
+            write_atomic(SNAPSHOT_FILE, build_snapshot(seq, seasons.items()))
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.snapshot = CatalogSnapshot(SNAPSHOT_FILE)
+        self.overlay = {}
+        self._touched = {}
+        self.journal.seq = self.snapshot.seq
+        self.journal.records = 0
+        self.journal.replay(self.apply)
+        # Bot to'xtab turganda data.json tahrirlangan bo'lsa, u snapshotdan yangi bo'ladi
+        source, snapshot = file_stat(DATA_FILE), file_stat(SNAPSHOT_FILE)
+        if source is not None and snapshot is not None and source[0] > snapshot[0] and self._source_current():
+            with open(DATA_FILE, "r") as f:
+                data = json.load(f)
+            self._replace_snapshot(write_temp(SNAPSHOT_FILE, build_snapshot(self.journal.seq, data.items())),
+                                   self.journal.seq, keep_newer=False)
+            self.journal.truncate()
+
+    def _replace_snapshot(self, tmp: Path, seq: int, keep_newer: bool = True) -> None:
+        """Yangi snapshotni data.bin o'rniga qo'yib, mmap qilish"""
+        # Windowsda mmap qilingan faylni almashtirib bo'lmaydi: eski xarita avval yopiladi.
+        # Bu yerda await yo'q, shuning uchun hech bir handler yopiq snapshotni ko'rmaydi
+        if self.snapshot is not None:
+            self.snapshot.close()
+        try:
+            os.replace(tmp, SNAPSHOT_FILE)
+        except OSError:
+            self.snapshot = CatalogSnapshot(SNAPSHOT_FILE)  # eski snapshot joyida qoldi
+            raise
+        self._install(CatalogSnapshot(SNAPSHOT_FILE), seq, keep_newer)
+
+    def _install(self, snapshot: "CatalogSnapshot", seq: int, keep_newer: bool = True) -> None:
+        # Bitta almashtirish: jarayondagi yuborishlar allaqachon olingan lug'atlar bilan davom etadi
+        old, self.snapshot = self.snapshot, snapshot
+        if keep_newer:
+            # Snapshot yig'ilgandan keyin o'zgargan fasllar qatlamda qoladi
+            for key in [key for key, touched in self._touched.items() if touched <= seq]:
+                self.overlay.pop(key, None)
+                del self._touched[key]
+        else:
+            self.overlay, self._touched = {}, {}
+            self.index.reset()
+        if old is not None:
+            old.close()
+
+    def _source_current(self) -> bool:
+        """Tashqi data.json faqat oxirgi /export dan keyin katalog o'zgarmagan bo'lsa qabul qilinadi"""
+        export_seq = read_export_seq()
+        if export_seq == self.journal.seq and not self._pending:
+            return True
+        print(f"⚠️ {DATA_FILE} o'zgardi, lekin u eskirgan (eksport seq={export_seq}, katalog seq={self.journal.seq}): "
+              f"o'zgarish qabul qilinmadi. Avval /export qiling, keyin tahrirlang.")
+        return False
+
+    def get(self, season_key: str) -> Optional[Dict[str, Any]]:
+        if season_key in self.overlay:
+            return self.overlay[season_key]
+        return self.snapshot.get(season_key)
+
+    def __contains__(self, season_key: str) -> bool:
+        return self.get(season_key) is not None
+
+    def titles(self) -> List[Tuple[str, str]]:
+        """Barcha fasllarning kaliti va nomi"""
+        result = [(key, title) for key, title in self.snapshot.titles() if key not in self.overlay]
+        result += [(key, season["title"]) for key, season in self.overlay.items() if season is not None]
+        return result
+
+    def seasons(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for key, _ in self.titles():
+            yield key, self.get(key)
+
+    def _editable(self, season_key: str) -> Dict[str, Any]:
+        # Snapshotdagi fasl birinchi o'zgarishda xotiradagi qatlamga ko'chiriladi
+        season = self.get(season_key)
+        if season is None:
+            raise KeyError(season_key)  # fasl yo'q yoki o'chirilgan
+        self.overlay[season_key] = season
+        return season
+
+    def apply(self, record: Dict[str, Any]) -> None:
+        """Jurnal yozuvini katalogga qo'llash; yaroqsiz yozuv hech narsani o'zgartirmay KeyError/IndexError beradi"""
+        op = record["op"]
+        key = record["key"]
+        title = record["title"] if op == "add_season" else None  # indeksga tegishdan oldin tekshiriladi
+        if op in ("add_season", "delete_season"):
+            previous = self.get(key)
+            if previous is not None:
+                self.index.remove(key, previous["title"])
+        if op == "add_season":
+            self.overlay[key] = {"title": title, "files": []}
+            self.index.add(key, title)
+        elif op == "add_file":
+            files = self._editable(key)["files"]
+            files.append({
+                "file_id": record["file_id"],
+                "caption": record["caption"],
+                "number": len(files) + 1
+            })
+        elif op == "update_caption":
+            self._editable(key)["files"][record["index"]]["caption"] = record["caption"]
+        elif op == "delete_season":
+            self.overlay[key] = None
+        self._touched[key] = record.get("seq", self.journal.seq)
+
+    def _commit(self, record: Dict[str, Any]) -> None:
+        self._pending.append(self.journal.encode(record))
+        self.apply(record)
+        self.mark_dirty()
+
+    # ✏️ O'zgartirishlar (xotirada darhol, diskda keyinroq)
+    def add_season(self, season_key: str, title: str) -> None:
+        self._commit({"op": "add_season", "key": season_key, "title": title})
+
+    def add_file(self, season_key: str, file_id: str, caption: str = "") -> bool:
+        if season_key not in self:
+            return False
+        self._commit({"op": "add_file", "key": season_key, "file_id": file_id, "caption": caption})
+        return True
 
-DATA_FILE = Path("data.json")
-if not DATA_FILE.exists():
-    DATA_FILE.write_text(json.dumps({}))
+    def update_caption(self, season_key: str, file_index: int, new_caption: str) -> bool:
+        season = self.get(season_key)
+        if season is None or not 0 <= file_index < len(season["files"]):
+            return False
+        self._commit({"op": "update_caption", "key": season_key, "index": file_index, "caption": new_caption})
+        return True
 
-# 📂 Ma'lumotni o'qish/yozish
-def load_data() -> Dict[str, Any]:
-    with open(DATA_FILE, "r") as f:
-        return json.load(f)
+    def delete_season(self, season_key: str) -> Optional[Dict[str, Any]]:
+        season = self.get(season_key)
+        if season is not None:
+            self._commit({"op": "delete_season", "key": season_key})
+        return season
+
+    # 💾 Diskka yozish
+    def mark_dirty(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _compact(self, seasons: Iterable[Tuple[str, Dict[str, Any]]], keep_newer: bool = True) -> None:
+        """Yangi ikkilik snapshot yozib, uni mmap qilish va jurnalni bo'shatish"""
+        # Snapshot event loop ichida yig'iladi, shuning uchun u izchil bo'ladi
+        seq = self.journal.seq
+        payload = build_snapshot(seq, seasons)
+        tmp = await asyncio.to_thread(write_temp, SNAPSHOT_FILE, payload)
+        self._replace_snapshot(tmp, seq, keep_newer)
+        await asyncio.to_thread(self.journal.truncate)
+
+    async def flush(self) -> None:
+        """Jamlangan yozuvlarni jurnalga bitta yozish bilan qo'shish"""
+        async with self._io_lock:
+            await self._flush_pending()
+            if self.journal.records >= COMPACT_EVERY:
+                await self._compact(self.seasons())
+
+    async def _flush_pending(self) -> None:
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self.journal.append, lines)
+        except Exception:
+            self._pending = lines + self._pending  # keyingi urinishda qayta yoziladi
+            raise
+
+    async def export(self) -> None:
+        """Katalogni o'qish uchun qulay data.json ko'rinishida yozish"""
+        async with self._io_lock:
+            await self._flush_pending()
+            seq, payload = self.journal.seq, json.dumps(dict(self.seasons()), indent=2, ensure_ascii=False)
+            await asyncio.to_thread(write_atomic, DATA_FILE, payload)
+            await asyncio.to_thread(write_atomic, EXPORT_SEQ_FILE, str(seq))
+            # O'zimiz yozgan data.json qayta yuklanmasin; snapshot undan yangiroq bo'lishi kerak
+            self._source_stat = file_stat(DATA_FILE)
+            self._source_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+            await self._compact(self.seasons())
+
+    # 🔄 data.json tashqaridan tahrirlansa, katalog faqat haqiqiy o'zgarishda qayta yuklanadi
+    async def check_source(self) -> bool:
+        stat = file_stat(DATA_FILE)
+        if stat is None or stat == self._source_stat:
+            return False
+        raw = await asyncio.to_thread(DATA_FILE.read_bytes)
+        self._source_stat = stat
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest == self._source_hash:
+            return False  # fayl tegilgan, lekin mazmuni o'zgarmagan
+        data = await asyncio.to_thread(json.loads, raw)
+        self._source_hash = digest
+        async with self._io_lock:
+            # Eksportdan keyingi o'zgarishlar faqat jurnalda: eskirgan data.json ularni o'chirib yubormasin.
+            # Snapshot yozilayotganda (await lar orasida) kelgan o'zgarishlar qatlamda va jurnal navbatida qoladi
+            if not self._source_current():
+                return False
+            await self._compact(data.items())
+            self.index.reset()
+        return True
 
-def save_data(data: Dict[str, Any]) -> None:
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    async def _watch_loop(self) -> None:
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            try:
+                if await self.check_source():
+                    print(f"🔄 {DATA_FILE} o'zgardi, katalog qayta yuklandi.")
+            except Exception as e:
+                print(f"Xato: {e}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Ketma-ket kelgan o'zgarishlarni bitta yozuvga jamlaymiz
+            await asyncio.sleep(self.flush_delay)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Xato: katalog jurnalini yozib bo'lmadi: {e}")
+                self._wakeup.set()  # flush_delay dan keyin qayta uriniladi
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        if self._pending:
+            self._wakeup.set()
+        self._source_stat = file_stat(DATA_FILE)
+        if self._source_stat is not None:
+            raw = await asyncio.to_thread(DATA_FILE.read_bytes)
+            self._source_hash = hashlib.sha256(raw).hexdigest()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._watcher = asyncio.create_task(self._watch_loop())
+
+    async def stop(self) -> None:
+        for task in (self._watcher, self._flusher):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._watcher = self._flusher = None
+        await self.flush()
+
+catalog = Catalog()
+
+# 📄 Sahifa tugmalari: har bir fasl alohida qatorda, pastda oldingi/keyingi
+def seasons_page_markup(seasons: List[Tuple[str, str]], page: int, has_next: bool, item_prefix: str, page_prefix: str) -> InlineKeyboardMarkup:
+    buttons = [[InlineKeyboardButton(text=title, callback_data=f"{item_prefix}{key}")] for key, title in seasons]
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="⬅️ Oldingi", callback_data=f"{page_prefix}{page - 1}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Keyingi ➡️", callback_data=f"{page_prefix}{page + 1}"))
+    if nav:
+        buttons.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # 🤖 Bot va Dispatcher
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
@@ -45,49 +573,41 @@ class EditSeason(StatesGroup):
 # Yangi struktura uchun yordamchi funksiya
 def get_season_info(season_key: str) -> Optional[Dict[str, Any]]:
     """Fasl ma'lumotlarini olish"""
-    data = load_data()
-    return data.get(season_key)
+    return catalog.get(season_key)
 
 def add_file_to_season(season_key: str, file_id: str, caption: str = "") -> None:
     """Faylni faslga qo'shish"""
-    data = load_data()
-    if season_key in data:
-        data[season_key]["files"].append({
-            "file_id": file_id,
-            "caption": caption,
-            "number": len(data[season_key]["files"]) + 1
-        })
-        save_data(data)
+    catalog.add_file(season_key, file_id, caption)
 
 def update_file_caption(season_key: str, file_index: int, new_caption: str) -> bool:
     """Fayl tavsifini yangilash"""
-    data = load_data()
-    if season_key in data and 0 <= file_index < len(data[season_key]["files"]):
-        data[season_key]["files"][file_index]["caption"] = new_caption
-        save_data(data)
-        return True
-    return False
+    return catalog.update_caption(season_key, file_index, new_caption)
+
+# 📬 Fasl yuborish navbati (tezlik cheklovi, kursorlar va dead letterlar delivery.py da)
+delivery_queue = DeliveryQueue(RateLimiter(), FileDeadLetters(DEAD_LETTER_FILE), FileCursorStore(CURSORS_FILE))
+
+def episode_caption(file_info: Dict[str, Any]) -> str:
+    """Albomdagi izoh: {raqam}-qism: tavsif"""
+    caption = file_info.get("caption", "")
+    number = file_info.get("number", "")
+    return f"{number}-qism" + (f": {caption}" if caption else "")
 
 # 🔘 /start (yoki start link bilan)
 @dp.message(CommandStart(deep_link=True))
 async def start_with_param(message: Message, command: CommandObject):
     season_key = command.args
-    data = load_data()
-    season = data.get(season_key)
+    season = catalog.get(season_key)
     if not season:
         await message.answer("❌ Bunday fasl topilmadi.")
         return
 
-    await message.answer(f"🎬 <b>{season['title']}</b>\nYuklanmoqda...")
-    for file_info in season["files"]:
-        file_id = file_info["file_id"]
-        caption = file_info.get("caption", "")
-        number = file_info.get("number", "")
-        
-        caption_text = f"{number}-qism" + (f": {caption}" if caption else "")
-        
-        await message.answer_video(file_id, caption=caption_text)
-        await asyncio.sleep(1)
+    episodes = [(file_info["file_id"], episode_caption(file_info)) for file_info in season["files"]]
+    # Havola har doim faslni boshidan ochadi; to'xtagan joydan davom etish - "Davom ettirish"/"Keyingi" tugmalarida
+    status = await delivery_queue.submit(message.from_user.id, message, season_key, season['title'], episodes, resume=False)
+    if status == "attached":
+        await message.answer("⏳ Bu fasl allaqachon yuborilmoqda, yuqoridagi xabarda jarayonni kuzating.")
+    elif status == "busy":
+        await message.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.")
 
 @dp.message(CommandStart())
 async def start(message: Message):
@@ -107,16 +627,11 @@ async def add_season(message: Message, command: CommandObject, state: FSMContext
 
     season_name = season_name.replace(" ", "_")
     key = f"season_{season_name}"
-    data = load_data()
-    if key in data:
+    if key in catalog:
         await message.answer("❗ Bu fasl allaqachon mavjud.")
         return
 
-    data[key] = {
-        "title": season_name.replace("_", " "),
-        "files": []
-    }
-    save_data(data)
+    catalog.add_season(key, season_name.replace("_", " "))
 
     await state.set_state(AddSeason.waiting_files)
     await state.update_data(season_key=key)
@@ -186,42 +701,44 @@ async def skip_caption(message: Message, state: FSMContext):
 # 🔘 /list_seasons - Barcha mavsumlarni inline tugmalar bilan ko'rsatadi
 @dp.message(Command("list_seasons"))
 async def list_seasons(message: Message):
-    data = load_data()
-    if not data:
+    page, seasons, has_next = catalog.index.page(0)
+    if not seasons:
         await message.answer("❌ Hozircha mavsumlar yo‘q.")
         return
 
-    buttons = []
-    for key, season in data.items():
-        button = InlineKeyboardButton(text=season["title"], callback_data=f"view_{key}")
-        buttons.append([button])
-
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+    markup = seasons_page_markup(seasons, page, has_next, "view_", "list_page:")
     await message.answer("🎬 Mavjud mavsumlar:", reply_markup=markup)
 
+# 📄 /list_seasons sahifalari (oldingi/keyingi)
+@dp.callback_query(F.data.startswith("list_page:"))
+async def list_seasons_page(callback: CallbackQuery):
+    page, seasons, has_next = catalog.index.page(int(callback.data.split(":", 1)[1]))
+    if not seasons:
+        await callback.answer("❌ Hozircha mavsumlar yo‘q.", show_alert=True)
+        return
+
+    markup = seasons_page_markup(seasons, page, has_next, "view_", "list_page:")
+    await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
 # 🎬 Faslni ko'rish (callback orqali)
 @dp.callback_query(F.data.startswith("view_"))
 async def view_season(callback: CallbackQuery):
     key = callback.data.split("_", 1)[1]
-    data = load_data()
-    season = data.get(key)
+    season = catalog.get(key)
 
     if not season:
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
         return
 
-    await callback.message.answer(f"🎬 <b>{season['title']}</b>\nYuklanmoqda...")
-    for file_info in season["files"]:
-        file_id = file_info["file_id"]
-        caption = file_info.get("caption", "")
-        number = file_info.get("number", "")
-        
-        caption_text = f"{number}-qism" + (f": {caption}" if caption else "")
-        
-        await callback.message.answer_video(file_id, caption=caption_text)
-        await asyncio.sleep(1)
-
-    await callback.answer()
+    episodes = [(file_info["file_id"], episode_caption(file_info)) for file_info in season["files"]]
+    status = await delivery_queue.submit(callback.from_user.id, callback.message, key, season['title'], episodes)
+    if status == "queued":
+        await callback.answer()
+    elif status == "attached":
+        await callback.answer("⏳ Bu fasl allaqachon yuborilmoqda.")
+    else:
+        await callback.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.", show_alert=True)
 
 # 🔐 /admin_list - Faqat admin uchun mavsumlar ro'yxati (tahrirlash/o'chirish bilan)
 @dp.message(Command("admin_list"))
@@ -230,25 +747,37 @@ async def admin_list_seasons(message: Message):
         await message.answer("❌ Ruxsat yo‘q.")
         return
 
-    data = load_data()
-    if not data:
+    page, seasons, has_next = catalog.index.page(0)
+    if not seasons:
         await message.answer("❌ Hozircha mavsumlar yo‘q.")
         return
 
-    buttons = []
-    for key, season in data.items():
-        button = InlineKeyboardButton(text=season["title"], callback_data=f"admin_view_{key}")
-        buttons.append([button])
-
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+    markup = seasons_page_markup(seasons, page, has_next, "admin_view_", "admin_page:")
     await message.answer("🔧 Mavjud mavsumlar (admin panel):", reply_markup=markup)
 
+# 🔧 /admin_list sahifalari va fasl amallaridan "Orqaga" tugmasi
+@dp.callback_query((F.data == "admin_list") | F.data.startswith("admin_page:"))
+async def admin_list_page(callback: CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer("❌ Ruxsat yo‘q.", show_alert=True)
+        return
+
+    requested = int(callback.data.split(":", 1)[1]) if ":" in callback.data else 0
+    page, seasons, has_next = catalog.index.page(requested)
+    if not seasons:
+        await callback.message.edit_text("❌ Hozircha mavsumlar yo‘q.")
+        await callback.answer()
+        return
+
+    markup = seasons_page_markup(seasons, page, has_next, "admin_view_", "admin_page:")
+    await callback.message.edit_text("🔧 Mavjud mavsumlar (admin panel):", reply_markup=markup)
+    await callback.answer()
+
 # 🔧 Admin uchun: Mavsum ustida amallar (tahrirlash/o'chirish)
 @dp.callback_query(F.data.startswith("admin_view_"))
 async def admin_view_season(callback: CallbackQuery):
     key = callback.data.split("_", 2)[2]
-    data = load_data()
-    season = data.get(key)
+    season = catalog.get(key)
 
     if not season:
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
@@ -276,8 +805,7 @@ async def edit_season_callback(callback: CallbackQuery, state: FSMContext):
         return
 
     key = callback.data.split("_", 1)[1]
-    data = load_data()
-    season = data.get(key)
+    season = catalog.get(key)
 
     if not season:
         await callback.answer("❌ Bunday fasl topilmadi.", show_alert=True)
@@ -298,22 +826,55 @@ async def delete_season(callback: CallbackQuery):
         return
 
     key = callback.data.split("_", 1)[1]
-    data = load_data()
-    season = data.get(key)
+    season = catalog.get(key)
 
     if not season:
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
         return
 
-    del data[key]
-    save_data(data)
+    catalog.delete_season(key)
 
     await callback.message.edit_text(f"✅ <b>{season['title']}</b> o‘chirildi.")
     await callback.answer()
 
+# 📤 /export - katalogni data.json ga yozish (admin)
+@dp.message(Command("export"))
+async def export(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await catalog.export()
+    await message.answer(f"✅ Katalog {DATA_FILE} fayliga yozildi.")
+
+# 🧯 /dead_letters - yuborib bo'lmagan qismlar (admin)
+@dp.message(Command("dead_letters"))
+async def dead_letters_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.dead_letters.report())
+
+# 🚦 /rate_stats - yuborish navbati statistikasi (admin)
+@dp.message(Command("rate_stats"))
+async def rate_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.report())
+
 # 🚀 Ishga tushirish
 async def main():
+    dp.startup.register(catalog.start)
+    dp.shutdown.register(catalog.stop)
+    dp.startup.register(delivery_queue.start)
+    dp.shutdown.register(delivery_queue.stop)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if sys.argv[1:] == ["export"]:
+        asyncio.run(catalog.export())
+    else:
+        asyncio.run(main())
@@ -1,27 +1,69 @@
+import time
+STARTED_AT = time.perf_counter()  # ishga tushish vaqtini o'lchash: import shu yerdan boshlanadi
+
 import asyncio
+import csv
 import json
+import subprocess
+import sys
 from pathlib import Path
-from typing import Dict, List, Any, Optional
-from functools import wraps
-from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterator, Tuple, Callable, Awaitable
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
 
 # PostgreSQL uchun importlar
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, func, URL
-from sqlalchemy.orm import sessionmaker, relationship, joinedload, declarative_base
-
-from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from sqlalchemy import (
+    event, select, insert, update, delete, bindparam, literal, true, text, inspect, tuple_,
+    Column, Integer, BigInteger, Boolean, String, Text, DateTime, ForeignKey, Index, ARRAY, func, URL
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import relationship, selectinload, aliased, declarative_base
+
+from aiogram import BaseMiddleware, Bot, Dispatcher, F
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, TelegramObject, Chat, ChatMemberUpdated
 from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandStart, CommandObject, StateFilter
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
-from aiogram.exceptions import TelegramForbiddenError
+from aiogram.dispatcher.flags import get_flag
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.exceptions import TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from delivery import RateLimiter, DeliveryQueue, CursorStore, DeadLetters
 
 # 🔐 Sozlamalar
 BOT_TOKEN = "BOT_TOKEN"
 ADMINS = [5873723609]  # ← O'zingizning Telegram ID
+ADMIN_IDS = frozenset(ADMINS)  # obuna darvozasida tez tekshiruv uchun
+
+# Ma'lumotlar bazasi turi: "postgresql" yoki "sqlite" (bitta serverli o'rnatish uchun)
+DB_BACKEND = "postgresql"
+SQLITE_PATH = "anime.db"
+IMPORT_BATCH = 1000  # Import paytida bitta tranzaksiyadagi yozuvlar soni
+DB_POOL_SIZE = 10  # Hovuzda doimiy ochiq turadigan ulanishlar
+DB_MAX_OVERFLOW = 20  # Yuklama oshganda qo'shimcha ochiladigan ulanishlar
+DB_POOL_TIMEOUT = 30  # Bo'sh ulanishni kutish chegarasi (soniya)
+DB_POOL_PRE_PING = True  # Ulanishni berishdan oldin tirikligini tekshirish
+DB_POOL_RECYCLE = 1800  # Ulanishlarni shuncha soniyadan keyin yangilash
+DB_CONNECT_RETRIES = 5  # Ishga tushishda bazaga ulanish urinishlari
+LOOP_LAG_INTERVAL = 0.5  # Event loop kechikishini o'lchash oralig'i (soniya)
+PAGE_SIZE = 10  # /list_seasons va /admin_list sahifasidagi fasllar soni
+MEMBER_TTL = 600.0  # "obuna bo'lgan" natijasi keshda turadigan vaqt (soniya)
+NON_MEMBER_TTL = 30.0  # "obuna emas" natijasi: foydalanuvchi tez obuna bo'lishi mumkin, shuning uchun qisqa
+MEMBERSHIP_CACHE_SIZE = 100_000  # Keshdagi (foydalanuvchi, kanal) juftliklari chegarasi
+MEMBERSHIP_CONCURRENCY = 5  # Bitta tekshiruvda bir vaqtda yuboriladigan get_chat_member so'rovlari
+MEMBERSHIP_TIMEOUT = 5.0  # Bitta get_chat_member javobini kutish chegarasi (soniya)
+BREAKER_FAILURES = 5  # Shuncha ketma-ket xatodan keyin tekshiruvlar to'xtatiladi (breaker ochiladi)
+BREAKER_COOLDOWN = 30.0  # Ochiq breaker sinov so'rovini yuborishdan oldin kutadigan vaqt (soniya)
+DEGRADED_MODE = "last_known"  # Breaker ochiq paytda: "last_known" - oxirgi ma'lum holat, "fail_open" - hammaga ruxsat
+MEMBER_FLUSH_INTERVAL = 2.0  # Kuzatilgan a'zolik o'zgarishlarini bazaga yozish oralig'i (soniya)
+MEMBER_TRACK_MAX_AGE = 3600.0  # Kuzatilgan holat shuncha vaqtdan keyin jonli tekshiruv bilan yangilanadi (o'tkazib yuborilgan chiqish)
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
 
 # PostgreSQL ma'lumotlar bazasi - Xavfsiz ulanish
 # Ma'lumotlaringizni bu yerga kiriting:
@@ -32,17 +74,28 @@ DB_PORT = 5432
 DB_NAME = "db_name"  # Sizning ma'lumotlar bazangiz nomi
 
 # URL obyektini yaratish (maxsus belgilar avtomatik tarzda encode qilinadi)
-database_url = URL.create(
-    drivername="postgresql",
-    username=DB_USER,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT,
-    database=DB_NAME
-)
-
-# Engine yaratish
-engine = create_engine(database_url)
+if DB_BACKEND == "sqlite":
+    database_url = URL.create(drivername="sqlite+aiosqlite", database=SQLITE_PATH)
+else:
+    database_url = URL.create(
+        drivername="postgresql+asyncpg",
+        username=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+        database=DB_NAME
+    )
+
+# Engine ishga tushishda (init_db) yaratiladi: import paytida drayver yuklanmaydi va ulanish ochilmaydi
+engine = None
+
+# WAL rejimi: o'quvchilar yozuvchini kutmaydi
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
 
 # SQLAlchemy 2.0 uchun to'g'ri declarative_base
 Base = declarative_base()
@@ -53,11 +106,15 @@ class Season(Base):
     id = Column(Integer, primary_key=True)
     key = Column(String, unique=True, nullable=False)
     title = Column(String, nullable=False)
+    last_number = Column(Integer, nullable=False, default=0, server_default="0")  # oxirgi berilgan epizod raqami
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationship
     files = relationship("VideoFile", back_populates="season", cascade="all, delete-orphan")
 
+    # Ro'yxat sahifalari (title, id) bo'yicha keyset bilan o'qiladi
+    __table_args__ = (Index("ix_seasons_title_id", "title", "id"),)
+
 class VideoFile(Base):
     __tablename__ = 'video_files'
     
@@ -71,6 +128,9 @@ class VideoFile(Base):
     # Relationship
     season = relationship("Season", back_populates="files")
 
+    # Fasl epizodlari bitta indeks bo'ylab, raqam tartibida o'qiladi; bir faslda raqam takrorlanmaydi
+    __table_args__ = (Index("uq_video_files_season_number", "season_id", "number", unique=True),)
+
 class Channel(Base):
     __tablename__ = 'channels'
     
@@ -79,135 +139,693 @@ class Channel(Base):
     name = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-# Ma'lumotlar bazasi jadvallarini yaratish
-Base.metadata.create_all(engine)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class ChannelMember(Base):
+    """chat_member yangilanishlaridan yig'ilgan kanal a'zoligi holati"""
+    __tablename__ = 'channel_members'
 
-def get_db():
-    return SessionLocal()
+    channel_id = Column(String, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    is_member = Column(Boolean, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
-# Ma'lumotlarni olish funksiyalari
-def load_data():
-    """PostgreSQL dan barcha ma'lumotlarni o'qish"""
-    db = get_db()
+class DeliveryCursor(Base):
+    """Foydalanuvchiga fasldan nechta qism yuborilgani (qayta so'rovda o'sha joydan davom etiladi)"""
+    __tablename__ = 'delivery_cursors'
+
+    user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    season_key = Column(String, primary_key=True)
+    position = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class DeadLetter(Base):
+    """Doimiy xato bilan yuborilmagan (foydalanuvchi, file_id) juftliklari"""
+    __tablename__ = 'dead_letters'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)
+    file_id = Column(String, nullable=False)
+    reason = Column(String, nullable=False)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# expire_on_commit=False: commitdan keyin atributlarni o'qish yana so'rov yubormaydi
+async_session = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+# 📊 Ulanishlar hovuzi statistikasi: navbat bazaning o'zidami yoki tarmoqdami - shuni ko'rsatadi
+class PoolMetrics:
+    """Hovuzdan ulanish olish/qaytarishni hisoblaydi (barcha hodisalar event loop oqimida keladi)"""
+
+    def __init__(self, window: int = 1000):
+        self.capacity = DB_POOL_SIZE + DB_MAX_OVERFLOW
+        self.checkouts = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.holds: deque = deque(maxlen=window)
+
+    def attach(self, engine: AsyncEngine) -> None:
+        event.listen(engine.sync_engine, "connect", self._on_connect)
+        event.listen(engine.sync_engine, "checkout", self._on_checkout)
+        event.listen(engine.sync_engine, "checkin", self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.checkouts += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            self.in_use -= 1
+            self.holds.append(time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, float]:
+        ordered = sorted(self.holds)
+        return {
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "timeouts": self.timeouts,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "capacity": self.capacity,
+            "hold_avg": sum(ordered) / len(ordered) if ordered else 0.0,
+            "hold_p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0
+        }
+
+pool_metrics = PoolMetrics()
+
+def migrate_db(connection) -> None:
+    """Eski bazalarni joriy sxemaga keltirish (create_all mavjud jadvallarga tegmaydi)"""
+    inspector = inspect(connection)
+    if "last_number" not in {column["name"] for column in inspector.get_columns("seasons")}:
+        connection.execute(text("ALTER TABLE seasons ADD COLUMN last_number INTEGER NOT NULL DEFAULT 0"))
+
+    if "uq_video_files_season_number" not in {index["name"] for index in inspector.get_indexes("video_files")}:
+        # Bir vaqtda yuklashda takrorlangan raqamlar bo'lgan fasllar 1..n qilib qayta raqamlanadi
+        rows = connection.execute(text(
+            "SELECT id, ROW_NUMBER() OVER (PARTITION BY season_id ORDER BY number, id) FROM video_files"
+            " WHERE season_id IN (SELECT season_id FROM video_files GROUP BY season_id, number HAVING COUNT(*) > 1)"
+        )).all()
+        if rows:
+            connection.execute(
+                text("UPDATE video_files SET number = :number WHERE id = :id"),
+                [{"id": row_id, "number": number} for row_id, number in rows]
+            )
+        connection.execute(text("DROP INDEX IF EXISTS ix_video_files_season_number"))
+        connection.execute(text(
+            "UPDATE seasons SET last_number = COALESCE("
+            "(SELECT MAX(number) FROM video_files WHERE video_files.season_id = seasons.id), 0)"
+        ))
+
+    for table in (Season.__table__, VideoFile.__table__):
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+async def init_db() -> None:
+    """Engine yaratish va jadvallarni tekshirish (bir marta, ishga tushishda)"""
+    global engine
+    if engine is not None:
+        return
+    new_engine = create_async_engine(
+        database_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_recycle=DB_POOL_RECYCLE
+    )
+    if DB_BACKEND == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", set_sqlite_pragmas)
+    pool_metrics.attach(new_engine)
     try:
-        # Fasllarni va ularning fayllarini olish
-        seasons = db.query(Season).options(joinedload(Season.files)).all()
-        
-        # Kanallarni olish
-        channels = db.query(Channel).all()
-        
-        # Natijani eski formatga o'tkazish
-        data = {"channels": []}
-        
-        # Kanallar
-        for channel in channels:
-            data["channels"].append({
-                "id": channel.channel_id,
-                "name": channel.name
-            })
-        
-        # Fasllar
-        for season in seasons:
-            files_data = []
-            # Fayllarni tartiblab olish
-            sorted_files = sorted(season.files, key=lambda x: x.number)
-            for file in sorted_files:
-                files_data.append({
-                    "file_id": file.file_id,
-                    "caption": file.caption or "",
-                    "number": file.number
-                })
-            
-            data[season.key] = {
-                "title": season.title,
-                "files": files_data
-            }
-        
-        return data
-    finally:
-        db.close()
+        # Ma'lumotlar bazasi jadvallarini yaratish
+        async with new_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(migrate_db)
+    except Exception:
+        await new_engine.dispose()
+        raise
+    async_session.configure(bind=new_engine)
+    engine = new_engine
+
+async def close_db() -> None:
+    """Hovuzdagi barcha ulanishlarni yopish"""
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
 
-def add_file_to_season(season_key: str, file_id: str, caption: str = ""):
-    """Faylni faslga qo'shish"""
-    db = get_db()
+# Ma'lumotlarni olish funksiyalari
+async def get_season(session: AsyncSession, season_key: str) -> Optional[Dict[str, Any]]:
+    """Bitta faslni epizodlari bilan (raqam tartibida) bitta so'rovda olish"""
+    rows = (await session.execute(
+        select(Season.title, VideoFile.file_id, VideoFile.caption, VideoFile.number)
+        .outerjoin(VideoFile, VideoFile.season_id == Season.id)
+        .where(Season.key == season_key)
+        .order_by(VideoFile.number)
+    )).all()
+    if not rows:
+        return None
+    return {
+        "title": rows[0].title,
+        "files": [
+            {"file_id": row.file_id, "caption": row.caption or "", "number": row.number}
+            for row in rows if row.file_id is not None
+        ]
+    }
+
+async def get_season_title(session: AsyncSession, season_key: str) -> Optional[str]:
+    """Faqat fasl nomi (epizodlarsiz)"""
+    return await session.scalar(select(Season.title).where(Season.key == season_key))
+
+async def list_seasons_page(
+    session: AsyncSession, after: Optional[int] = None, before: Optional[int] = None, size: int = PAGE_SIZE
+) -> Tuple[List[Tuple[int, str, str]], bool, bool]:
+    """Nom bo'yicha tartiblangan fasllar sahifasi: ((id, kalit, nom) qatorlari, oldingisi bormi, keyingisi bormi)"""
+    # Keyset: kursor - sahifa chetidagi fasl id si, uning (title, id) qiymati shu so'rovning o'zida olinadi;
+    # istalgan sahifa (title, id) indeksi bo'ylab size + 1 qator o'qiydi
+    stmt = select(Season.id, Season.key, Season.title)
+    cursor_id = after if after is not None else before
+    if cursor_id is not None:
+        cursor = aliased(Season)
+        stmt = stmt.join(cursor, cursor.id == cursor_id)
+        position = tuple_(Season.title, Season.id)
+        boundary = tuple_(cursor.title, cursor.id)
+        stmt = stmt.where(position > boundary if after is not None else position < boundary)
+    if before is not None:
+        stmt = stmt.order_by(Season.title.desc(), Season.id.desc())
+    else:
+        stmt = stmt.order_by(Season.title, Season.id)
+    rows = [tuple(row) for row in await session.execute(stmt.limit(size + 1))]
+    more = len(rows) > size
+    rows = rows[:size]
+    if before is not None:
+        rows.reverse()
+        return rows, more, True
+    return rows, after is not None, more
+
+async def add_files_to_season(session: AsyncSession, season_key: str, files: List[Tuple[str, str]]) -> Optional[List[int]]:
+    """Fasl oxiriga (file_id, caption) epizodlarni qo'shish; raqamlarni baza fasl hisoblagichidan atomar beradi"""
+    count = len(files)
+    counter = (
+        update(Season)
+        .where(Season.key == season_key)
+        .values(last_number=Season.last_number + count)
+        .returning(Season.id, Season.last_number)
+    )
     try:
-        # Fasl mavjudligini tekshirish
-        season = db.query(Season).filter(Season.key == season_key).first()
-        if not season:
+        if DB_BACKEND == "postgresql":
+            # Bitta so'rov: hisoblagich UPDATE ... RETURNING (CTE), epizodlar unnest ... WITH ORDINALITY dan
+            bump = counter.cte("bump")
+            episodes = func.unnest(
+                literal([file_id for file_id, _ in files], ARRAY(String)),
+                literal([caption for _, caption in files], ARRAY(Text))
+            ).table_valued("file_id", "caption", with_ordinality="ord").render_derived()
+            rows = select(
+                bump.c.id,
+                episodes.c.file_id,
+                episodes.c.caption,
+                bump.c.last_number - count + episodes.c.ord,
+                literal(datetime.utcnow())
+            ).select_from(bump).join(episodes, true())
+            stmt = (
+                insert(VideoFile)
+                .from_select(["season_id", "file_id", "caption", "number", "created_at"], rows)
+                .add_cte(bump)
+                .returning(VideoFile.number)
+            )
+            numbers = sorted(await session.scalars(stmt))
+            if not numbers:
+                await session.rollback()
+                return None
+        else:
+            # SQLite: ikki so'rov bitta tranzaksiyada; UPDATE yozuvchi qulfini oladi, raqamlar kesishmaydi
+            bumped = (await session.execute(counter)).first()
+            if bumped is None:
+                await session.rollback()
+                return None
+            season_id, last = bumped
+            numbers = list(range(last - count + 1, last + 1))
+            await session.execute(insert(VideoFile), [
+                {"season_id": season_id, "file_id": file_id, "caption": caption, "number": number}
+                for (file_id, caption), number in zip(files, numbers)
+            ])
+        await session.commit()
+        return numbers
+    except Exception:
+        await session.rollback()
+        raise
+
+async def add_file_to_season(session: AsyncSession, season_key: str, file_id: str, caption: str = "") -> bool:
+    """Faylni faslga qo'shish (fasl topilmasa False, baza xatosi yuqoriga uzatiladi)"""
+    return await add_files_to_season(session, season_key, [(file_id, caption)]) is not None
+
+async def create_season(session: AsyncSession, season_key: str, title: str) -> bool:
+    """Yangi fasl yaratish (mavjud bo'lsa False)"""
+    try:
+        if await session.scalar(select(Season.id).where(Season.key == season_key)):
             return False
-        
-        # Oxirgi fayl raqamini olish
-        max_number = db.query(func.max(VideoFile.number)).filter(VideoFile.season_id == season.id).scalar() or 0
-        
-        # Yangi fayl qo'shish
-        new_file = VideoFile(
-            season_id=season.id,
-            file_id=file_id,
-            caption=caption,
-            number=max_number + 1
-        )
-        
-        db.add(new_file)
-        db.commit()
+        session.add(Season(key=season_key, title=title))
+        await session.commit()
         return True
-    except Exception as e:
-        db.rollback()
-        print(f"Xato: {e}")
-        return False
-    finally:
-        db.close()
+    except Exception:
+        await session.rollback()
+        raise
+
+async def delete_season_db(session: AsyncSession, season_key: str) -> Optional[str]:
+    """Faslni o'chirish; o'chirilgan fasl nomini qaytaradi"""
+    try:
+        season = await session.scalar(
+            select(Season).options(selectinload(Season.files)).where(Season.key == season_key)
+        )
+        if not season:
+            return None
+        title = season.title
+        await session.delete(season)
+        await session.commit()
+        return title
+    except Exception:
+        await session.rollback()
+        raise
 
 # Kanal boshqaruvi funksiyalari
-def add_channel_db(channel_id: str, channel_name: str):
+async def add_channel_db(session: AsyncSession, channel_id: str, channel_name: str):
     """Kanal qo'shish"""
-    db = get_db()
     try:
         # Kanal allaqachon mavjudligini tekshirish
-        existing = db.query(Channel).filter(Channel.channel_id == channel_id).first()
+        existing = await session.scalar(select(Channel).where(Channel.channel_id == channel_id))
         if existing:
             return False
         
         new_channel = Channel(channel_id=channel_id, name=channel_name)
-        db.add(new_channel)
-        db.commit()
+        session.add(new_channel)
+        await session.commit()
         return True
     except Exception as e:
-        db.rollback()
+        await session.rollback()
         print(f"Xato: {e}")
         return False
-    finally:
-        db.close()
 
-def remove_channel_db(channel_id: str):
+async def remove_channel_db(session: AsyncSession, channel_id: str):
     """Kanal o'chirish"""
-    db = get_db()
     try:
-        channel = db.query(Channel).filter(Channel.channel_id == channel_id).first()
+        channel = await session.scalar(select(Channel).where(Channel.channel_id == channel_id))
         if channel:
-            db.delete(channel)
-            db.commit()
+            await session.delete(channel)
+            await session.commit()
             return True
         return False
     except Exception as e:
-        db.rollback()
+        await session.rollback()
         print(f"Xato: {e}")
         return False
-    finally:
-        db.close()
 
-def get_channels():
+async def get_channels(session: AsyncSession):
     """Barcha kanallarni olish"""
-    db = get_db()
+    channels = (await session.scalars(select(Channel))).all()
+    return [{"id": c.channel_id, "name": c.name} for c in channels]
+
+# 📢 Majburiy kanallar xotirada: bazadan bir marta o'qiladi, /add_channel va /remove_channel yangilaydi
+class ChannelCache:
+    """Kanallar ro'yxati va oldindan yasalgan obuna tugmalari"""
+
+    def __init__(self):
+        self.channels: Optional[List[Dict[str, str]]] = None
+        self.markup: Optional[InlineKeyboardMarkup] = None
+
+    async def get(self, session: AsyncSession) -> List[Dict[str, str]]:
+        if self.channels is None:
+            channels = await get_channels(session)
+            self.markup = build_subscribe_markup(channels) if channels else None
+            self.channels = channels
+        return self.channels
+
+    async def keyboard(self, session: AsyncSession) -> Optional[InlineKeyboardMarkup]:
+        """Obuna tugmalari (kanal bo'lmasa None)"""
+        await self.get(session)
+        return self.markup
+
+    def invalidate(self) -> None:
+        self.channels = None
+        self.markup = None
+
+channel_cache = ChannelCache()
+
+# 📥 data.json dan import (bir martalik)
+def iter_json_items(path: Path, chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Any]]:
+    """Katta JSON obyektini butunlay o'qimasdan, kalit-qiymat juftliklari bo'yicha oqim qilib o'qish"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def read_more() -> None:
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def next_char() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                if eof:
+                    raise ValueError("JSON kutilmaganda tugadi")
+                read_more()
+
+        def decode() -> Any:
+            nonlocal pos
+            next_char()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                    # Bufer oxirida tugagan qiymat (masalan, son) to'liq bo'lmasligi mumkin
+                    if end < len(buf) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                read_more()
+
+        if next_char() != "{":
+            raise ValueError("data.json obyekt bo'lishi kerak")
+        pos += 1
+        if next_char() == "}":
+            return
+        while True:
+            key = decode()
+            if next_char() != ":":
+                raise ValueError("':' kutilgan edi")
+            pos += 1
+            yield key, decode()
+            sep = next_char()
+            pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError("',' yoki '}' kutilgan edi")
+
+async def import_json(session: AsyncSession, path: Path) -> Dict[str, int]:
+    """data.json dagi fasllar va kanallarni bazaga ko'chirish (mavjudlari tashlab ketiladi)"""
+    stats = {"seasons": 0, "files": 0, "channels": 0, "skipped": 0}
+    pending = 0
     try:
-        channels = db.query(Channel).all()
-        return [{"id": c.channel_id, "name": c.name} for c in channels]
+        for key, value in iter_json_items(path):
+            if key == "channels":
+                for channel in value:
+                    if await session.scalar(select(Channel.id).where(Channel.channel_id == channel["id"])):
+                        stats["skipped"] += 1
+                        continue
+                    session.add(Channel(channel_id=channel["id"], name=channel.get("name") or channel["id"]))
+                    stats["channels"] += 1
+                continue
+
+            if await session.scalar(select(Season.id).where(Season.key == key)):
+                stats["skipped"] += 1
+                continue
+            rows = []
+            for number, file_info in enumerate(value.get("files", []), 1):
+                # Eski botlarda fayllar oddiy file_id qatori sifatida saqlangan
+                if isinstance(file_info, str):
+                    file_info = {"file_id": file_info}
+                rows.append({
+                    "file_id": file_info["file_id"],
+                    "caption": file_info.get("caption", ""),
+                    "number": file_info.get("number") or number
+                })
+            season = Season(key=key, title=value["title"], last_number=max((row["number"] for row in rows), default=0))
+            session.add(season)
+            await session.flush()
+            for row in rows:
+                row["season_id"] = season.id
+            if rows:
+                await session.execute(insert(VideoFile), rows)
+            stats["seasons"] += 1
+            stats["files"] += len(rows)
+
+            pending += len(rows) + 1
+            if pending >= IMPORT_BATCH:
+                await session.commit()
+                pending = 0
+        await session.commit()
+        return stats
+    except Exception:
+        await session.rollback()
+        raise
+
+# 📦 Ommaviy import: manifestdagi epizodlar partiyalab yoziladi
+def iter_manifest(path: Path) -> Iterator[Dict[str, Any]]:
+    """JSONL yoki CSV manifestdan (season_key, title, file_id, caption, number) qatorlarini o'qish"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            key = row["season_key"]
+            number = row.get("number")
+            yield {
+                "season_key": key,
+                "title": row.get("title") or key.removeprefix("season_").replace("_", " "),
+                "file_id": row["file_id"],
+                "caption": row.get("caption") or "",
+                "number": int(number) if number not in (None, "") else None
+            }
+
+async def import_manifest(session: AsyncSession, path: Path) -> Dict[str, int]:
+    """Manifestdagi epizodlarni bazaga qo'shish: har IMPORT_BATCH qator bitta tranzaksiyada"""
+    stats = {"seasons": 0, "files": 0}
+    seasons: Dict[str, List[int]] = {}  # kalit -> [season_id, oxirgi raqam]
+    batch: List[Dict[str, Any]] = []
+    # Hisoblagich faqat oshadi: import paytida admin qo'shgan epizod raqami qaytib berilmaydi
+    sync_counter = (
+        update(Season.__table__)
+        .where(Season.__table__.c.id == bindparam("season_id"), Season.__table__.c.last_number < bindparam("last"))
+        .values(last_number=bindparam("last"))
+    )
+
+    async def write_batch() -> None:
+        await session.execute(insert(VideoFile), batch)
+        touched = {row["season_id"] for row in batch}
+        await session.execute(sync_counter, [
+            {"season_id": season_id, "last": last} for season_id, last in seasons.values() if season_id in touched
+        ])
+        stats["files"] += len(batch)
+
+    try:
+        for row in iter_manifest(path):
+            key = row["season_key"]
+            state = seasons.get(key)
+            if state is None:
+                season = await session.scalar(select(Season).where(Season.key == key))
+                if season is None:
+                    season = Season(key=key, title=row["title"])
+                    session.add(season)
+                    await session.flush()
+                    stats["seasons"] += 1
+                state = seasons[key] = [season.id, season.last_number or 0]
+
+            number = row["number"] or state[1] + 1
+            state[1] = max(state[1], number)
+            batch.append({
+                "season_id": state[0],
+                "file_id": row["file_id"],
+                "caption": row["caption"],
+                "number": number
+            })
+            if len(batch) >= IMPORT_BATCH:
+                await write_batch()
+                await session.commit()
+                batch = []
+        if batch:
+            await write_batch()
+        await session.commit()
+        return stats
+    except Exception:
+        await session.rollback()
+        raise
+
+async def run_import(source: Path) -> Dict[str, int]:
+    """CLI importi: engine ochiladi, fayl turiga qarab import qilinadi, so'ng hovuz yopiladi"""
+    await init_db()
+    try:
+        async with async_session() as session:
+            if source.suffix.lower() == ".json":
+                return await import_json(session, source)
+            # .jsonl yoki .csv manifest
+            return await import_manifest(session, source)
     finally:
-        db.close()
+        await close_db()
+
+# ⚙️ Bloklanmaydigan DB qatlami: so'rovlar async drayver orqali, har bir update o'z sessiyasida
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Har bir update uchun bitta AsyncSession (ulanish birinchi so'rovda olinadi, oxirida qaytariladi)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with async_session() as session:
+            data["session"] = session
+            try:
+                return await handler(event, data)
+            except PoolTimeoutError:
+                pool_metrics.timeouts += 1
+                raise
+
+# 📈 Event loop kechikishi: uxlash rejadan qancha kech tugaganini o'lchaymiz
+class LoopLagMonitor:
+    """Event loop qancha vaqt bloklanganini kuzatadi"""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, window: int = 600):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def stats(self) -> Dict[str, float]:
+        if not self.samples:
+            return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "avg": sum(ordered) / len(ordered),
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": self.max_lag
+        }
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+loop_monitor = LoopLagMonitor()
+
+# ⏱️ Ishga tushish: baza ulanishi import paytida emas, polling boshlanishidan oldin ochiladi
+startup_timings: Dict[str, float] = {}
+
+async def on_startup() -> None:
+    started = time.perf_counter()
+    for attempt in range(1, DB_CONNECT_RETRIES + 1):
+        try:
+            await init_db()
+            break
+        except Exception as e:
+            if attempt == DB_CONNECT_RETRIES:
+                raise
+            delay = min(2 ** attempt, 30)
+            print(f"Xato: bazaga ulanib bo'lmadi ({e}). {delay} s dan keyin qayta urinamiz...")
+            await asyncio.sleep(delay)
+    startup_timings["db"] = time.perf_counter() - started
+    print(f"🚀 Ishga tushish: import {startup_timings['import']:.2f} s, baza {startup_timings['db']:.2f} s")
+
+class FirstPollTimer(BaseRequestMiddleware):
+    """Birinchi getUpdates so'rovi ketayotganda importdan shu paytgacha o'tgan vaqtni yozadi"""
+
+    async def __call__(self, make_request, bot: Bot, method: TelegramMethod):
+        if isinstance(method, GetUpdates) and "first_poll" not in startup_timings:
+            startup_timings["first_poll"] = time.perf_counter() - STARTED_AT
+            print(f"🚀 Birinchi pollgacha {startup_timings['first_poll']:.2f} s")
+        return await make_request(bot, method)
+
+# Benchmark jarayoni: Telegram o'rniga getMe ga soxta javob beradi va birinchi getUpdates da chiqadi,
+# shuning uchun import, baza, startup handlerlari va dispatcher ishga tushishi to'liq o'lchanadi
+BENCH_SCRIPT = """
+import time
+t = time.perf_counter()
+import {module} as m
+imported = time.perf_counter()
+import asyncio, os
+from aiogram.methods import GetMe, GetUpdates
+from aiogram.types import User
+
+async def fake_telegram(make_request, bot, method):
+    if isinstance(method, GetMe):
+        return User(id=bot.id, is_bot=True, first_name="bench", username="bench_bot")
+    if isinstance(method, GetUpdates):
+        print(imported - t, m.startup_timings["db"], time.perf_counter() - t, flush=True)
+        os._exit(0)
+    return await make_request(bot, method)
+
+m.bot.session.middleware(fake_telegram)
+asyncio.run(m.main())
+"""
+
+def bench_startup(runs: int = 5) -> None:
+    """Yangi jarayonlarda importdan birinchi getUpdates so'rovigacha ketgan vaqtni o'lchash (mediana)"""
+    script = BENCH_SCRIPT.format(module=Path(__file__).stem)
+    imports, dbs, polls = [], [], []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True
+        )
+        imported, db, first_poll = map(float, result.stdout.split()[-3:])
+        imports.append(imported)
+        dbs.append(db)
+        polls.append(first_poll)
+    for samples in (imports, dbs, polls):
+        samples.sort()
+    print(
+        f"📊 {runs} ta urinish (mediana): import {imports[runs // 2]:.3f} s, baza {dbs[runs // 2]:.3f} s, "
+        f"birinchi pollgacha {polls[runs // 2]:.3f} s"
+    )
+
+# 📄 Sahifa tugmalari: har bir fasl alohida qatorda, pastda oldingi/keyingi (kursor - chetdagi fasl id si)
+def seasons_page_markup(rows: List[Tuple[int, str, str]], has_prev: bool, has_next: bool, item_prefix: str, page_prefix: str) -> InlineKeyboardMarkup:
+    buttons = [[InlineKeyboardButton(text=title, callback_data=f"{item_prefix}{key}")] for _, key, title in rows]
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="⬅️ Oldingi", callback_data=f"{page_prefix}p:{rows[0][0]}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Keyingi ➡️", callback_data=f"{page_prefix}n:{rows[-1][0]}"))
+    if nav:
+        buttons.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def seasons_page(session: AsyncSession, callback_data: str) -> Tuple[List[Tuple[int, str, str]], bool, bool]:
+    """"<prefix>n:<id>" / "<prefix>p:<id>" dan sahifa; kursor fasli o'chirilgan bo'lsa birinchi sahifa"""
+    _, direction, cursor_id = callback_data.split(":")
+    if direction == "n":
+        page = await list_seasons_page(session, after=int(cursor_id))
+    else:
+        page = await list_seasons_page(session, before=int(cursor_id))
+    if not page[0]:
+        page = await list_seasons_page(session)
+    return page
 
 # 🤖 Bot va Dispatcher
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher(storage=MemoryStorage())
+dp.update.middleware(DbSessionMiddleware())
 
 # 🧭 Holatlar
 class AddSeason(StatesGroup):
@@ -218,117 +836,527 @@ class EditSeason(StatesGroup):
     editing_files = State()
     waiting_caption = State()
 
+# 📢 Obuna tugmalari: kanallar o'zgarmaguncha bir marta yasalib, qayta ishlatiladi
+def build_subscribe_markup(channels: List[Dict[str, str]]) -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton(text=f"📢 {channel['name']}", url=f"https://t.me/{channel['id'].lstrip('@')}")]
+        for channel in channels
+    ]
+    buttons.append([InlineKeyboardButton(text="✅ Tekshirish", callback_data="check_subscription")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+# 🧠 Obuna natijalari keshi: har bir so'rovda get_chat_member chaqirilmaydi
+class MembershipCache:
+    """(foydalanuvchi, kanal) bo'yicha obuna natijalari; ijobiy va salbiy natija uchun alohida TTL, LRU chiqarish"""
+
+    def __init__(self, max_size: int = MEMBERSHIP_CACHE_SIZE,
+                 member_ttl: float = MEMBER_TTL, non_member_ttl: float = NON_MEMBER_TTL):
+        self.max_size = max_size
+        self.member_ttl = member_ttl
+        self.non_member_ttl = non_member_ttl
+        self._entries: OrderedDict = OrderedDict()  # (foydalanuvchi, kanal) -> (obunami, muddat)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, channel_id: str) -> Optional[bool]:
+        """Keshdagi natija yoki None (yo'q yoki muddati o'tgan)"""
+        key = (user_id, channel_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            # Muddati o'tgan yozuv LRU chiqarguncha oxirgi ma'lum holat sifatida qoladi (peek)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def peek(self, user_id: int, channel_id: str) -> Optional[bool]:
+        """Muddatidan qat'i nazar oxirgi natija (degraded rejim uchun)"""
+        entry = self._entries.get((user_id, channel_id))
+        return entry[0] if entry is not None else None
+
+    def set(self, user_id: int, channel_id: str, is_member: bool) -> None:
+        key = (user_id, channel_id)
+        ttl = self.member_ttl if is_member else self.non_member_ttl
+        self._entries[key] = (is_member, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries)
+        }
+
+membership_cache = MembershipCache()
+
+# 👥 Kanal a'zolari kuzatuvchisi: bot admin bo'lgan kanallardan chat_member yangilanishlari keladi
+class MembershipTracker:
+    """Kanal -> {foydalanuvchi: (a'zomi, ko'rilgan vaqt)} xotirada; o'zgarishlar channel_members jadvaliga
+    fon rejimida yoziladi. max_age dan eski yozuv ishonchsiz: chiqish yangilanishi o'tkazib yuborilgan bo'lishi mumkin"""
+
+    def __init__(self, flush_interval: float = MEMBER_FLUSH_INTERVAL, max_age: float = MEMBER_TRACK_MAX_AGE):
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self.members: Dict[str, Dict[int, Tuple[bool, float]]] = {}
+        self._dirty: Dict[Tuple[str, int], Tuple[bool, float]] = {}
+        self._forgotten: set = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.unknown = 0
+        self.stale = 0
+
+    def get(self, channel_id: str, user_id: int) -> Optional[bool]:
+        """Kuzatilgan natija yoki None (ko'rilmagan yoki eskirgan: chaqiruvchi jonli tekshiradi)"""
+        entry = self.members.get(channel_id, {}).get(user_id)
+        if entry is None:
+            self.unknown += 1
+            return None
+        if time.time() - entry[1] > self.max_age:
+            self.stale += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def last_known(self, channel_id: str, user_id: int) -> Optional[bool]:
+        """Yoshidan qat'i nazar oxirgi kuzatilgan holat (degraded rejim uchun)"""
+        entry = self.members.get(channel_id, {}).get(user_id)
+        return entry[0] if entry is not None else None
+
+    def record(self, channel_id: str, user_id: int, is_member: bool, from_event: bool = True) -> None:
+        """Holatni yozish; jonli tekshiruv natijasi faqat yangilanishlari kelayotgan kanal uchun saqlanadi.
+        Holat o'zgarmasa ham vaqti yangilanadi, shunda qayta ishga tushgandan keyin ham eskirmaydi"""
+        users = self.members.get(channel_id)
+        if users is None:
+            if not from_event:
+                return
+            users = self.members[channel_id] = {}
+        users[user_id] = self._dirty[(channel_id, user_id)] = (is_member, time.time())
+
+    def forget(self, channel_id: str) -> None:
+        """Kanal ro'yxatdan olinganda uning a'zolari ham o'chiriladi"""
+        self.members.pop(channel_id, None)
+        self._dirty = {key: value for key, value in self._dirty.items() if key[0] != channel_id}
+        self._forgotten.add(channel_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "channels": len(self.members),
+            "entries": sum(len(users) for users in self.members.values()),
+            "hits": self.hits,
+            "unknown": self.unknown,
+            "stale": self.stale
+        }
+
+    async def load(self) -> None:
+        async with async_session() as session:
+            rows = await session.execute(select(
+                ChannelMember.channel_id, ChannelMember.user_id, ChannelMember.is_member, ChannelMember.updated_at
+            ))
+            for channel_id, user_id, is_member, updated_at in rows:
+                # updated_at UTC da saqlanadi (datetime.utcnow); vaqti yo'q yozuv darhol eskirgan hisoblanadi
+                seen = updated_at.replace(tzinfo=timezone.utc).timestamp() if updated_at else 0.0
+                self.members.setdefault(channel_id, {})[user_id] = (is_member, seen)
+
+    async def flush(self) -> None:
+        if not self._dirty and not self._forgotten:
+            return
+        dirty, forgotten = self._dirty, self._forgotten
+        self._dirty, self._forgotten = {}, set()
+        try:
+            async with async_session() as session:
+                if forgotten:
+                    await session.execute(delete(ChannelMember).where(ChannelMember.channel_id.in_(forgotten)))
+                if dirty:
+                    stmt = (pg_insert if DB_BACKEND == "postgresql" else sqlite_insert)(ChannelMember)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[ChannelMember.channel_id, ChannelMember.user_id],
+                        set_={"is_member": stmt.excluded.is_member, "updated_at": stmt.excluded.updated_at}
+                    )
+                    await session.execute(stmt, [
+                        {
+                            "channel_id": channel_id,
+                            "user_id": user_id,
+                            "is_member": is_member,
+                            "updated_at": datetime.fromtimestamp(seen, timezone.utc).replace(tzinfo=None)
+                        }
+                        for (channel_id, user_id), (is_member, seen) in dirty.items()
+                    ])
+                await session.commit()
+        except Exception:
+            # Keyingi urinishda qayta yoziladi; oraliqda kelgan yangi holat ustun turadi
+            self._forgotten |= forgotten
+            self._dirty = {**dirty, **self._dirty}
+            raise
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Xato: a'zolarni bazaga yozib bo'lmadi: {e}")
+
+    async def start(self) -> None:
+        await self.load()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+member_tracker = MembershipTracker()
+
+def match_channel(chat: Chat, channels: List[Dict[str, str]]) -> Optional[str]:
+    """Yangilanish kelgan chatga mos majburiy kanal ID si (ID yoki @username bo'yicha)"""
+    names = {str(chat.id)}
+    if chat.username:
+        names.add(f"@{chat.username}".lower())
+    for channel in channels:
+        if channel["id"].lower() in names:
+            return channel["id"]
+    return None
+
+# 🔌 get_chat_member uchun circuit breaker: Bot API sekinlashganda har bir foydalanuvchini bloklamaymiz
+class CircuitBreaker:
+    """closed -> (ketma-ket failure_threshold xato) -> open -> (cooldown) -> half_open: bitta sinov so'rovi"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0  # ketma-ket xatolar
+        self.opened_at = 0.0
+        self._probing = False
+        self.errors = 0
+        self.opens = 0
+        self.rejected = 0
+        self.probes = 0
+        self.degraded = 0
+
+    def allow(self) -> bool:
+        """So'rov yuborish mumkinmi; open holatda darhol rad etiladi, half_open da faqat bitta sinov o'tadi"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+            self.probes += 1
+        return True
+
+    def record(self, ok: bool, probe: bool = False) -> None:
+        """Natijani yozish; sinov belgisini faqat uni qo'ygan so'rov (probe=True) olib tashlaydi"""
+        if probe:
+            self._probing = False
+        if ok:
+            self.failures = 0
+            self.state = "closed"
+            return
+        self.errors += 1
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opens += 1
+
+    def release(self, probe: bool = False) -> None:
+        """Natijasiz tugagan (bekor qilingan) sinov keyingisiga joy bo'shatadi"""
+        if probe:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "errors": self.errors,
+            "opens": self.opens,
+            "rejected": self.rejected,
+            "probes": self.probes,
+            "degraded": self.degraded
+        }
+
+membership_breaker = CircuitBreaker()
+
+def degraded_status(user_id: int, channel_id: str) -> bool:
+    """Telegram javob bermaganda qaror: oxirgi ma'lum holat (eskirgan bo'lsa ham) yoki ruxsat"""
+    if DEGRADED_MODE not in ("last_known", "fail_open"):
+        raise ValueError(f"DEGRADED_MODE noma'lum: {DEGRADED_MODE!r}")
+    membership_breaker.degraded += 1
+    if DEGRADED_MODE == "last_known":
+        known = member_tracker.last_known(channel_id, user_id)
+        if known is None:
+            known = membership_cache.peek(user_id, channel_id)
+        if known is not None:
+            return known
+    return True
+
 # Foydalanuvchi obunasi tekshiruvi
-async def is_user_subscribed(user_id: int) -> bool:
-    """Foydalanuvchi barcha majburiy kanallarga obuna bo'lganini tekshiradi"""
-    channels = get_channels()
+async def check_channel_member(user_id: int, channel_id: str) -> bool:
+    """Bitta kanal: True - o'tkaziladi, False - rad etiladi"""
+    if not membership_breaker.allow():
+        return degraded_status(user_id, channel_id)
+    # allow() dan keyin half_open bo'lsa, sinov so'rovi aynan shu (oraliqda await yo'q)
+    probe = membership_breaker.state == "half_open"
+    try:
+        member = await asyncio.wait_for(bot.get_chat_member(channel_id, user_id), MEMBERSHIP_TIMEOUT)
+    except TelegramForbiddenError:
+        membership_breaker.record(True, probe)
+        # Bot kanalda admin emas: tekshiruv o'tkaziladi (bu ham keshlanadi)
+        membership_cache.set(user_id, channel_id, True)
+        return True
+    except (TelegramNetworkError, TelegramServerError, TelegramRetryAfter, asyncio.TimeoutError):
+        # Bot API sekin yoki ishlamayapti: foydalanuvchi aybdor emas, natija keshlanmaydi
+        membership_breaker.record(False, probe)
+        return degraded_status(user_id, channel_id)
+    except asyncio.CancelledError:
+        membership_breaker.release(probe)
+        raise
+    except Exception:
+        membership_breaker.record(True, probe)  # Telegram javob berdi (masalan, foydalanuvchi topilmadi)
+        return False
+    is_member = member.status in MEMBER_STATUSES
+    membership_breaker.record(True, probe)
+    membership_cache.set(user_id, channel_id, is_member)
+    member_tracker.record(channel_id, user_id, is_member, from_event=False)
+    return is_member
+
+async def first_denial(user_id: int, channel_ids: List[str]) -> bool:
+    """Kanallarni parallel (MEMBERSHIP_CONCURRENCY tadan) tekshirish; birinchi rad javobida qolganlari bekor qilinadi"""
+    semaphore = asyncio.Semaphore(MEMBERSHIP_CONCURRENCY)
+
+    async def limited(channel_id: str) -> bool:
+        async with semaphore:
+            return await check_channel_member(user_id, channel_id)
+
+    tasks = [asyncio.create_task(limited(channel_id)) for channel_id in channel_ids]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            if not await finished:
+                return True
+        return False
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def is_user_subscribed(session: AsyncSession, user_id: int, use_cache: bool = True) -> bool:
+    """Foydalanuvchi barcha majburiy kanallarga obuna bo'lganini tekshiradi: avval kuzatuvchi, keyin kesh,
+    oxirida jonli so'rov (use_cache=False - faqat jonli tekshiruv)"""
+    channels = await channel_cache.get(session)
     
     if not channels:
         return True
         
+    unknown = []
     for channel in channels:
-        try:
-            member = await bot.get_chat_member(channel["id"], user_id)
-            if member.status not in ['member', 'administrator', 'creator']:
-                return False
-        except TelegramForbiddenError:
-            continue
-        except Exception:
+        cached = None
+        if use_cache:
+            cached = member_tracker.get(channel["id"], user_id)
+            if cached is None:
+                cached = membership_cache.get(user_id, channel["id"])
+        if cached is None:
+            unknown.append(channel["id"])
+        elif not cached:
             return False
             
-    return True
-
-def subscription_required(handler):
-    @wraps(handler)
-    async def wrapper(message: Message, *args, **kwargs):
-        if message.from_user.id in ADMINS:
-            return await handler(message, *args, **kwargs)
-            
-        if not await is_user_subscribed(message.from_user.id):
-            channels = get_channels()
-            
-            if not channels:
-                return await handler(message, *args, **kwargs)
-            
-            buttons = [
-                [InlineKeyboardButton(text=f"📢 {channel['name']}", url=f"https://t.me/{channel['id'].lstrip('@')}")]
-                for channel in channels
-            ]
-            buttons.append([InlineKeyboardButton(text="✅ Tekshirish", callback_data="check_subscription")])
-            
-            keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await message.answer(
-                "⚠️ Botdan foydalanish uchun quyidagi kanallarga obuna bo'lishingiz kerak!",
-                reply_markup=keyboard
-            )
-            return
-        return await handler(message, *args, **kwargs)
-    return wrapper
-
-def subscription_required_callback(handler):
-    @wraps(handler)
-    async def wrapper(callback: CallbackQuery, *args, **kwargs):
-        if callback.from_user.id in ADMINS:
-            return await handler(callback, *args, **kwargs)
-            
-        if not await is_user_subscribed(callback.from_user.id):
-            channels = get_channels()
-            
-            if not channels:
-                return await handler(callback, *args, **kwargs)
-            
-            buttons = [
-                [InlineKeyboardButton(text=f"📢 {channel['name']}", url=f"https://t.me/{channel['id'].lstrip('@')}")]
-                for channel in channels
-            ]
-            buttons.append([InlineKeyboardButton(text="✅ Tekshirish", callback_data="check_subscription")])
-            
-            keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await callback.answer("⚠️ Botdan foydalanish uchun kanallarga obuna bo'ling!", show_alert=True)
+    # Kuzatuvchida ham, keshda ham yo'q kanallar bir vaqtda tekshiriladi
+    return not unknown or not await first_denial(user_id, unknown)
+
+# 🚪 Obuna darvozasi: holat har bir update uchun ko'pi bilan bir marta hisoblanadi.
+# Tashqi middleware data["subscription"] ni qo'yadi (handlerlar ham undan foydalanishi mumkin); route flaglari
+# faqat ichki middlewarega ko'rinadi, shuning uchun flags={"subscription": True} li handlerlarni ichki middleware to'sadi.
+class GateMetrics:
+    """Darvoza har bir updatega qancha vaqt qo'shayotganini kuzatadi"""
+
+    def __init__(self, window: int = 1000):
+        self.samples: deque = deque(maxlen=window)
+        self.checks = 0
+        self.admins = 0
+        self.denied = 0
+
+    def observe(self, elapsed: float, allowed: bool) -> None:
+        self.checks += 1
+        if not allowed:
+            self.denied += 1
+        self.samples.append(elapsed)
+
+    def stats(self) -> Dict[str, float]:
+        if not self.samples:
+            return {"checks": self.checks, "admins": self.admins, "denied": self.denied, "avg": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "checks": self.checks,
+            "admins": self.admins,
+            "denied": self.denied,
+            "avg": sum(ordered) / len(ordered),
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1]
+        }
+
+gate_metrics = GateMetrics()
+
+class SubscriptionStatus:
+    """Bitta update uchun obuna holati: birinchi so'rovda hisoblanadi, keyin tayyor natija qaytadi"""
+
+    def __init__(self, user_id: Optional[int], session: AsyncSession):
+        self.user_id = user_id
+        self.session = session
+        self.allowed: Optional[bool] = None
+
+    async def check(self) -> bool:
+        if self.allowed is None:
+            started = time.perf_counter()
+            if self.user_id is None or self.user_id in ADMIN_IDS:
+                self.allowed = True
+                gate_metrics.admins += 1
+            else:
+                self.allowed = await is_user_subscribed(self.session, self.user_id)
+            gate_metrics.observe(time.perf_counter() - started, self.allowed)
+        return self.allowed
+
+class SubscriptionGate(BaseMiddleware):
+    """Tashqi middleware: handler data ga kechiktirilgan obuna holatini qo'yadi"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        data["subscription"] = SubscriptionStatus(user.id if user else None, data["session"])
+        return await handler(event, data)
+
+class SubscriptionGuard(BaseMiddleware):
+    """Ichki middleware: subscription flagi bor handlerga obuna bo'lmagan foydalanuvchini o'tkazmaydi"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not get_flag(data, "subscription") or await data["subscription"].check():
+            return await handler(event, data)
+
+        keyboard = await channel_cache.keyboard(data["session"])
+        if keyboard is None:
+            return await handler(event, data)  # Cheklov yo'q
+
+        if isinstance(event, CallbackQuery):
+            await event.answer("⚠️ Botdan foydalanish uchun kanallarga obuna bo'ling!", show_alert=True)
             try:
-                await callback.message.edit_text(
+                await event.message.edit_text(
                     "⚠️ Botdan foydalanish uchun quyidagi kanallarga obuna bo'lishingiz kerak!",
                     reply_markup=keyboard
                 )
             except:
-                await callback.message.answer(
+                await event.message.answer(
                     "⚠️ Botdan foydalanish uchun quyidagi kanallarga obuna bo'lishingiz kerak!",
                     reply_markup=keyboard
                 )
-            return
-        return await handler(callback, *args, **kwargs)
-    return wrapper
+        else:
+            await event.answer(
+                "⚠️ Botdan foydalanish uchun quyidagi kanallarga obuna bo'lishingiz kerak!",
+                reply_markup=keyboard
+            )
+
+for observer in (dp.message, dp.callback_query):
+    observer.outer_middleware(SubscriptionGate())
+    observer.middleware(SubscriptionGuard())
+
+# 🔖 Foydalanuvchi qayerda to'xtagani delivery_cursors jadvalida saqlanadi
+class DbCursorStore(CursorStore):
+    """Kursorlar delivery_cursors jadvaliga fon rejimida yoziladi"""
+
+    async def load(self) -> None:
+        async with async_session() as session:
+            rows = await session.execute(select(DeliveryCursor.user_id, DeliveryCursor.season_key, DeliveryCursor.position))
+            for user_id, season_key, position in rows:
+                self.positions[(user_id, season_key)] = position
+
+    async def _write(self, dirty: Dict[Tuple[int, str], int]) -> None:
+        async with async_session() as session:
+            stmt = (pg_insert if DB_BACKEND == "postgresql" else sqlite_insert)(DeliveryCursor)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[DeliveryCursor.user_id, DeliveryCursor.season_key],
+                set_={"position": stmt.excluded.position, "updated_at": stmt.excluded.updated_at}
+            )
+            await session.execute(stmt, [
+                {"user_id": user_id, "season_key": season_key, "position": position}
+                for (user_id, season_key), position in dirty.items()
+            ])
+            await session.commit()
+
+# 🧯 Yuborib bo'lmagan qismlar dead_letters jadvalida saqlanadi
+class DbDeadLetters(DeadLetters):
+    """Dead letter yozuvlari dead_letters jadvaliga qo'shiladi"""
+
+    async def load(self) -> None:
+        async with async_session() as session:
+            self.bad_files = set((await session.scalars(
+                select(DeadLetter.file_id).where(DeadLetter.reason == "bad_file").distinct()
+            )).all())
+            rows = (await session.scalars(
+                select(DeadLetter).order_by(DeadLetter.id.desc()).limit(self.recent.maxlen)
+            )).all()
+        for row in reversed(rows):
+            self.recent.append({
+                "ts": int(row.created_at.timestamp()), "user_id": row.user_id, "file_id": row.file_id,
+                "reason": row.reason, "error": row.error
+            })
+
+    async def _write(self, entry: Dict[str, Any]) -> None:
+        async with async_session() as session:
+            session.add(DeadLetter(user_id=entry["user_id"], file_id=entry["file_id"], reason=entry["reason"], error=entry["error"]))
+            await session.commit()
+
+# 📬 Fasl yuborish navbati (tezlik cheklovi va yuborish mantiqi delivery.py da)
+delivery_queue = DeliveryQueue(RateLimiter(), DbDeadLetters(), DbCursorStore())
+
+def episode_caption(file_info: Dict[str, Any]) -> str:
+    """Albomdagi izoh: {raqam}-qism: tavsif"""
+    caption = file_info.get("caption", "")
+    number = file_info.get("number", "")
+    return f"{number}-qism" + (f": {caption}" if caption else "")
 
 # 🔘 /start (yoki start link bilan)
-@dp.message(CommandStart(deep_link=True))
-@subscription_required
-async def start_with_param(message: Message, command: CommandObject):
+@dp.message(CommandStart(deep_link=True), flags={"subscription": True})
+async def start_with_param(message: Message, command: CommandObject, session: AsyncSession):
     season_key = command.args
-    data = load_data()
-    season = data.get(season_key)
+    season = await get_season(session, season_key)
     if not season:
         await message.answer("❌ Bunday fasl topilmadi.")
         return
 
-    await message.answer(f"🎬 <b>{season['title']}</b>\nYuklanmoqda...")
-    for file_info in season["files"]:
-        file_id = file_info["file_id"]
-        caption = file_info.get("caption", "")
-        number = file_info.get("number", "")
-        
-        caption_text = f"{number}-qism" + (f": {caption}" if caption else "")
-        
-        await message.answer_video(file_id, caption=caption_text)
-        await asyncio.sleep(1)
+    episodes = [(file_info["file_id"], episode_caption(file_info)) for file_info in season["files"]]
+    # Havola har doim faslni boshidan ochadi; to'xtagan joydan davom etish - "Davom ettirish"/"Keyingi" tugmalarida
+    status = await delivery_queue.submit(message.from_user.id, message, season_key, season['title'], episodes, resume=False)
+    if status == "attached":
+        await message.answer("⏳ Bu fasl allaqachon yuborilmoqda, yuqoridagi xabarda jarayonni kuzating.")
+    elif status == "busy":
+        await message.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.")
 
-@dp.message(CommandStart())
-@subscription_required
+@dp.message(CommandStart(), flags={"subscription": True})
 async def start(message: Message):
     await message.answer("👋 Anime yuklovchi botga xush kelibsiz!")
 
 # 🔘 /add_season <nom>
 @dp.message(Command("add_season"))
-async def add_season(message: Message, command: CommandObject, state: FSMContext):
+async def add_season(message: Message, command: CommandObject, state: FSMContext, session: AsyncSession):
     if message.from_user.id not in ADMINS:
         await message.answer("❌ Ruxsat yo‘q.")
         return
@@ -342,30 +1370,23 @@ async def add_season(message: Message, command: CommandObject, state: FSMContext
     key = f"season_{season_name}"
     
     # PostgreSQL ga yangi fasl qo'shish
-    db = get_db()
     try:
-        existing_season = db.query(Season).filter(Season.key == key).first()
-        if existing_season:
-            await message.answer("❗ Bu fasl allaqachon mavjud.")
-            db.close()
-            return
-
-        new_season = Season(key=key, title=season_name.replace("_", " "))
-        db.add(new_season)
-        db.commit()
-        
-        await state.set_state(AddSeason.waiting_files)
-        await state.update_data(season_key=key)
-
-        bot_username = (await bot.me()).username
-        link = f"https://t.me/{bot_username}?start={key}"
-        await message.answer(f"📥 Endi fayllarni yuboring. Tugatgach /done deb yozing.\nLink: {link}")
+        created = await create_season(session, key, season_name.replace("_", " "))
     except Exception as e:
-        db.rollback()
         await message.answer("❌ Xatolik yuz berdi.")
         print(f"Xato: {e}")
-    finally:
-        db.close()
+        return
+
+    if not created:
+        await message.answer("❗ Bu fasl allaqachon mavjud.")
+        return
+
+    await state.set_state(AddSeason.waiting_files)
+    await state.update_data(season_key=key)
+
+    bot_username = (await bot.me()).username
+    link = f"https://t.me/{bot_username}?start={key}"
+    await message.answer(f"📥 Endi fayllarni yuboring. Tugatgach /done deb yozing.\nLink: {link}")
 
 # 🔘 Fayl qabul qilish (add/edit)
 @dp.message(StateFilter(AddSeason.waiting_files, EditSeason.editing_files), F.video)
@@ -381,14 +1402,23 @@ async def handle_video(message: Message, state: FSMContext):
 
 # 🔘 Tavsifni qabul qilish
 @dp.message(StateFilter(AddSeason.waiting_caption, EditSeason.waiting_caption))
-async def handle_caption(message: Message, state: FSMContext):
+async def handle_caption(message: Message, state: FSMContext, session: AsyncSession):
     state_data = await state.get_data()
     key = state_data["season_key"]
     file_id = state_data["current_file_id"]
     caption = message.text if message.text and message.text != "/skip" else ""
 
-    add_file_to_season(key, file_id, caption)
-    
+    try:
+        added = await add_file_to_season(session, key, file_id, caption)
+    except Exception as e:
+        print(f"Xato: {e}")
+        await message.answer("❌ Fayl saqlanmadi. Tavsifni qayta yuboring yoki /skip.")
+        return
+    if not added:
+        await state.clear()
+        await message.answer("❌ Bu fasl o‘chirilgan. Jarayon to‘xtatildi.")
+        return
+
     current_state = await state.get_state()
     if current_state == AddSeason.waiting_caption.state:
         await state.set_state(AddSeason.waiting_files)
@@ -405,13 +1435,22 @@ async def done_adding_editing(message: Message, state: FSMContext):
 
 # 🔘 /skip
 @dp.message(StateFilter(AddSeason.waiting_caption, EditSeason.waiting_caption), Command("skip"))
-async def skip_caption(message: Message, state: FSMContext):
+async def skip_caption(message: Message, state: FSMContext, session: AsyncSession):
     state_data = await state.get_data()
     key = state_data["season_key"]
     file_id = state_data["current_file_id"]
 
-    add_file_to_season(key, file_id, "")
-    
+    try:
+        added = await add_file_to_season(session, key, file_id, "")
+    except Exception as e:
+        print(f"Xato: {e}")
+        await message.answer("❌ Fayl saqlanmadi. Tavsifni qayta yuboring yoki /skip.")
+        return
+    if not added:
+        await state.clear()
+        await message.answer("❌ Bu fasl o‘chirilgan. Jarayon to‘xtatildi.")
+        return
+
     current_state = await state.get_state()
     if current_state == AddSeason.waiting_caption.state:
         await state.set_state(AddSeason.waiting_files)
@@ -421,81 +1460,92 @@ async def skip_caption(message: Message, state: FSMContext):
     await message.answer("✅ Fayl qo‘shildi (tavsiz). Davom eting...")
 
 # 🔘 /list_seasons
-@dp.message(Command("list_seasons"))
-@subscription_required
-async def list_seasons(message: Message):
-    data = load_data()
-    if not data or all(key == "channels" for key in data.keys()):
+@dp.message(Command("list_seasons"), flags={"subscription": True})
+async def list_seasons(message: Message, session: AsyncSession):
+    rows, has_prev, has_next = await list_seasons_page(session)
+    if not rows:
         await message.answer("❌ Hozircha mavsumlar yo‘q.")
         return
 
-    buttons = []
-    for key, season in data.items():
-        if key != "channels":
-            button = InlineKeyboardButton(text=season["title"], callback_data=f"view_{key}")
-            buttons.append([button])
-
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+    markup = seasons_page_markup(rows, has_prev, has_next, "view_", "list_page:")
     await message.answer("🎬 Mavjud mavsumlar:", reply_markup=markup)
 
+# 📄 /list_seasons sahifalari (oldingi/keyingi)
+@dp.callback_query(F.data.startswith("list_page:"), flags={"subscription": True})
+async def list_seasons_page_callback(callback: CallbackQuery, session: AsyncSession):
+    rows, has_prev, has_next = await seasons_page(session, callback.data)
+    if not rows:
+        await callback.answer("❌ Hozircha mavsumlar yo‘q.", show_alert=True)
+        return
+
+    markup = seasons_page_markup(rows, has_prev, has_next, "view_", "list_page:")
+    await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
 # 🎬 Faslni ko'rish
-@dp.callback_query(F.data.startswith("view_"))
-@subscription_required_callback
-async def view_season(callback: CallbackQuery):
+@dp.callback_query(F.data.startswith("view_"), flags={"subscription": True})
+async def view_season(callback: CallbackQuery, session: AsyncSession):
     key = callback.data.split("_", 1)[1]
-    data = load_data()
-    season = data.get(key)
+    season = await get_season(session, key)
 
     if not season:
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
         return
 
-    await callback.message.answer(f"🎬 <b>{season['title']}</b>\nYuklanmoqda...")
-    for file_info in season["files"]:
-        file_id = file_info["file_id"]
-        caption = file_info.get("caption", "")
-        number = file_info.get("number", "")
-        
-        caption_text = f"{number}-qism" + (f": {caption}" if caption else "")
-        
-        await callback.message.answer_video(file_id, caption=caption_text)
-        await asyncio.sleep(1)
-
-    await callback.answer()
+    episodes = [(file_info["file_id"], episode_caption(file_info)) for file_info in season["files"]]
+    status = await delivery_queue.submit(callback.from_user.id, callback.message, key, season['title'], episodes)
+    if status == "queued":
+        await callback.answer()
+    elif status == "attached":
+        await callback.answer("⏳ Bu fasl allaqachon yuborilmoqda.")
+    else:
+        await callback.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.", show_alert=True)
 
 # 🔐 /admin_list
 @dp.message(Command("admin_list"))
-async def admin_list_seasons(message: Message):
+async def admin_list_seasons(message: Message, session: AsyncSession):
     if message.from_user.id not in ADMINS:
         await message.answer("❌ Ruxsat yo‘q.")
         return
 
-    data = load_data()
-    if not data or all(key == "channels" for key in data.keys()):
+    rows, has_prev, has_next = await list_seasons_page(session)
+    if not rows:
         await message.answer("❌ Hozircha mavsumlar yo‘q.")
         return
 
-    buttons = []
-    for key, season in data.items():
-        if key != "channels":
-            button = InlineKeyboardButton(text=season["title"], callback_data=f"admin_view_{key}")
-            buttons.append([button])
-
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+    markup = seasons_page_markup(rows, has_prev, has_next, "admin_view_", "admin_page:")
     await message.answer("🔧 Mavjud mavsumlar (admin panel):", reply_markup=markup)
 
+# 🔧 /admin_list sahifalari va fasl amallaridan "Orqaga" tugmasi
+@dp.callback_query((F.data == "admin_list") | F.data.startswith("admin_page:"))
+async def admin_list_page(callback: CallbackQuery, session: AsyncSession):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer("❌ Ruxsat yo‘q.", show_alert=True)
+        return
+
+    if callback.data == "admin_list":
+        rows, has_prev, has_next = await list_seasons_page(session)
+    else:
+        rows, has_prev, has_next = await seasons_page(session, callback.data)
+    if not rows:
+        await callback.message.edit_text("❌ Hozircha mavsumlar yo‘q.")
+        await callback.answer()
+        return
+
+    markup = seasons_page_markup(rows, has_prev, has_next, "admin_view_", "admin_page:")
+    await callback.message.edit_text("🔧 Mavjud mavsumlar (admin panel):", reply_markup=markup)
+    await callback.answer()
+
 # 🔧 Admin uchun: Mavsum ustida amallar
 @dp.callback_query(F.data.startswith("admin_view_"))
-async def admin_view_season(callback: CallbackQuery):
+async def admin_view_season(callback: CallbackQuery, session: AsyncSession):
     key = callback.data.split("_", 2)[2]
-    data = load_data()
-    season = data.get(key)
+    title = await get_season_title(session, key)
 
-    if not season:
+    if title is None:
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
         return
 
-    title = season["title"]
     edit_button = InlineKeyboardButton(text="✏️ Tahrirlash", callback_data=f"edit_{key}")
     delete_button = InlineKeyboardButton(text="🗑️ O‘chirish", callback_data=f"delete_{key}")
     back_button = InlineKeyboardButton(text="🔙 Orqaga", callback_data="admin_list")
@@ -511,28 +1561,27 @@ async def admin_view_season(callback: CallbackQuery):
 
 # ✏️ Tahrirlash tugmasi
 @dp.callback_query(F.data.startswith("edit_"))
-async def edit_season_callback(callback: CallbackQuery, state: FSMContext):
+async def edit_season_callback(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     if callback.from_user.id not in ADMINS:
         await callback.answer("❌ Ruxsat yo‘q.", show_alert=True)
         return
 
     key = callback.data.split("_", 1)[1]
-    data = load_data()
-    season = data.get(key)
+    title = await get_season_title(session, key)
 
-    if not season:
+    if title is None:
         await callback.answer("❌ Bunday fasl topilmadi.", show_alert=True)
         return
 
     await state.set_state(EditSeason.editing_files)
     await state.update_data(season_key=key)
     
-    await callback.message.answer(f"✏️ <b>{season['title']}</b> uchun yangi fayllarni yuboring. Eski fayllar o‘chmaydi. Tugatgach /done deb yozing.")
+    await callback.message.answer(f"✏️ <b>{title}</b> uchun yangi fayllarni yuboring. Eski fayllar o‘chmaydi. Tugatgach /done deb yozing.")
     await callback.answer()
 
 # 🗑️ Mavsumni o'chirish
 @dp.callback_query(F.data.startswith("delete_"))
-async def delete_season(callback: CallbackQuery):
+async def delete_season(callback: CallbackQuery, session: AsyncSession):
     if callback.from_user.id not in ADMINS:
         await callback.answer("❌ Ruxsat yo‘q.", show_alert=True)
         return
@@ -540,30 +1589,23 @@ async def delete_season(callback: CallbackQuery):
     key = callback.data.split("_", 1)[1]
     
     # PostgreSQL dan faslni o'chirish
-    db = get_db()
     try:
-        season = db.query(Season).filter(Season.key == key).first()
-        if not season:
-            await callback.answer("❌ Fasl topilmadi.", show_alert=True)
-            db.close()
-            return
-
-        season_title = season.title
-        db.delete(season)
-        db.commit()
-        
-        await callback.message.edit_text(f"✅ <b>{season_title}</b> o‘chirildi.")
-        await callback.answer()
+        season_title = await delete_season_db(session, key)
     except Exception as e:
-        db.rollback()
         await callback.answer("❌ Xatolik yuz berdi.", show_alert=True)
         print(f"Xato: {e}")
-    finally:
-        db.close()
+        return
+
+    if season_title is None:
+        await callback.answer("❌ Fasl topilmadi.", show_alert=True)
+        return
+
+    await callback.message.edit_text(f"✅ <b>{season_title}</b> o‘chirildi.")
+    await callback.answer()
 
 # Kanal boshqarish buyruqlari
 @dp.message(Command("add_channel"))
-async def add_channel(message: Message, command: CommandObject):
+async def add_channel(message: Message, command: CommandObject, session: AsyncSession):
     if message.from_user.id not in ADMINS:
         await message.answer("❌ Ruxsat yo‘q.")
         return
@@ -577,13 +1619,14 @@ async def add_channel(message: Message, command: CommandObject):
     channel_id = parts[0]
     channel_name = parts[1] if len(parts) > 1 else channel_id
 
-    if add_channel_db(channel_id, channel_name):
+    if await add_channel_db(session, channel_id, channel_name):
+        channel_cache.invalidate()
         await message.answer(f"✅ Kanal {channel_name} ({channel_id}) ro'yxatga qo'shildi.")
     else:
         await message.answer(f"❗ Kanal {channel_id} allaqachon ro'yxatda bor.")
 
 @dp.message(Command("remove_channel"))
-async def remove_channel(message: Message, command: CommandObject):
+async def remove_channel(message: Message, command: CommandObject, session: AsyncSession):
     if message.from_user.id not in ADMINS:
         await message.answer("❌ Ruxsat yo‘q.")
         return
@@ -593,18 +1636,20 @@ async def remove_channel(message: Message, command: CommandObject):
         await message.answer("⚠️ Foydalanish: /remove_channel &lt;kanal_id&gt;")
         return
 
-    if remove_channel_db(channel_id):
+    if await remove_channel_db(session, channel_id):
+        channel_cache.invalidate()
+        member_tracker.forget(channel_id)
         await message.answer(f"✅ Kanal {channel_id} ro'yxatdan o'chirildi.")
     else:
         await message.answer(f"❌ Kanal {channel_id} topilmadi.")
 
 @dp.message(Command("list_channels"))
-async def list_channels(message: Message):
+async def list_channels(message: Message, session: AsyncSession):
     if message.from_user.id not in ADMINS:
         await message.answer("❌ Ruxsat yo‘q.")
         return
 
-    channels = get_channels()
+    channels = await channel_cache.get(session)
     
     if not channels:
         await message.answer("📭 Ro'yxat bo'sh. Hozirda majburiy obuna kanallari yo'q.")
@@ -616,17 +1661,156 @@ async def list_channels(message: Message):
     
     await message.answer(text)
 
+# 📈 /loop_lag - event loop kechikishi (admin)
+@dp.message(Command("loop_lag"))
+async def loop_lag(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    stats = loop_monitor.stats()
+    await message.answer(
+        "📈 Event loop kechikishi:\n"
+        f"O'rtacha: {stats['avg'] * 1000:.1f} ms\n"
+        f"p95: {stats['p95'] * 1000:.1f} ms\n"
+        f"Maksimal: {stats['max'] * 1000:.1f} ms"
+    )
+
+# 📊 /db_pool - ulanishlar hovuzi holati (admin)
+@dp.message(Command("db_pool"))
+async def db_pool(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    stats = pool_metrics.stats()
+    await message.answer(
+        "📊 Ulanishlar hovuzi:\n"
+        f"Band: {stats['in_use']}/{stats['capacity']} (eng ko'pi: {stats['peak_in_use']})\n"
+        f"Olingan: {stats['checkouts']}, yangi ulanishlar: {stats['connects']}\n"
+        f"Kutish muddati tugagan: {stats['timeouts']}\n"
+        f"Ushlab turish: o'rtacha {stats['hold_avg'] * 1000:.1f} ms, p95 {stats['hold_p95'] * 1000:.1f} ms"
+    )
+
+# 🔌 /breaker - get_chat_member circuit breaker holati (admin)
+@dp.message(Command("breaker"))
+async def breaker(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    stats = membership_breaker.stats()
+    await message.answer(
+        "🔌 Obuna tekshiruvi (get_chat_member):\n"
+        f"Holat: {stats['state']}, ochilgan: {stats['opens']} marta\n"
+        f"Xatolar: {stats['errors']}, to'xtatilgan so'rovlar: {stats['rejected']}, sinovlar: {stats['probes']}\n"
+        f"Degraded javoblar ({DEGRADED_MODE}): {stats['degraded']}"
+    )
+
+# 🚪 /gate_stats - obuna darvozasi updatelarga qo'shayotgan vaqt (admin)
+@dp.message(Command("gate_stats"))
+async def gate_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    stats = gate_metrics.stats()
+    await message.answer(
+        "🚪 Obuna darvozasi:\n"
+        f"Tekshiruvlar: {stats['checks']} (adminlar: {stats['admins']}, rad etildi: {stats['denied']})\n"
+        f"Qo'shilgan vaqt: o'rtacha {stats['avg'] * 1000:.2f} ms, p95 {stats['p95'] * 1000:.2f} ms, "
+        f"eng ko'p {stats['max'] * 1000:.2f} ms"
+    )
+
+# 👥 Kanalga qo'shilish/chiqish (bot kanalda admin bo'lsa Telegram yuboradi)
+@dp.chat_member()
+async def track_channel_member(update: ChatMemberUpdated, session: AsyncSession):
+    channel_id = match_channel(update.chat, await channel_cache.get(session))
+    if channel_id is None:
+        return
+    user_id = update.new_chat_member.user.id
+    is_member = update.new_chat_member.status in MEMBER_STATUSES
+    member_tracker.record(channel_id, user_id, is_member)
+    membership_cache.set(user_id, channel_id, is_member)
+
+# 🧠 /sub_cache - obuna keshi statistikasi (admin)
+@dp.message(Command("sub_cache"))
+async def sub_cache(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    stats = membership_cache.stats()
+    tracked = member_tracker.stats()
+    await message.answer(
+        "🧠 Obuna keshi:\n"
+        f"Topildi: {stats['hits']}, topilmadi: {stats['misses']} ({stats['hit_rate'] * 100:.1f}%)\n"
+        f"Yozuvlar: {stats['size']}\n\n"
+        "👥 A'zolar kuzatuvchisi:\n"
+        f"Kanallar: {tracked['channels']}, yozuvlar: {tracked['entries']}\n"
+        f"Topildi: {tracked['hits']}, noma'lum: {tracked['unknown']}, eskirgan: {tracked['stale']}"
+    )
+
 @dp.callback_query(F.data == "check_subscription")
-async def check_subscription_callback(callback: CallbackQuery):
-    if await is_user_subscribed(callback.from_user.id):
+async def check_subscription_callback(callback: CallbackQuery, session: AsyncSession):
+    # "Tekshirish" bosilganda keshga qaramaymiz: foydalanuvchi hozirgina obuna bo'lgan bo'lishi mumkin
+    if await is_user_subscribed(session, callback.from_user.id, use_cache=False):
         await callback.message.edit_text("✅ Obuna tasdiqlandi! Endi botdan foydalanishingiz mumkin.")
         await callback.answer()
     else:
         await callback.answer("❌ Siz hali barcha kanallarga obuna bo'lmagansiz!", show_alert=True)
 
+# 🧯 /dead_letters - yuborib bo'lmagan qismlar (admin)
+@dp.message(Command("dead_letters"))
+async def dead_letters_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.dead_letters.report())
+
+# 🚦 /rate_stats - yuborish navbati statistikasi (admin)
+@dp.message(Command("rate_stats"))
+async def rate_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.report())
+
 # 🚀 Ishga tushirish
+startup_timings["import"] = time.perf_counter() - STARTED_AT
+
 async def main():
+    bot.session.middleware(FirstPollTimer())
+    dp.startup.register(on_startup)
+    dp.startup.register(member_tracker.start)
+    dp.startup.register(loop_monitor.start)
+    dp.startup.register(delivery_queue.start)
+    dp.shutdown.register(delivery_queue.stop)
+    dp.shutdown.register(loop_monitor.stop)
+    dp.shutdown.register(member_tracker.stop)
+    dp.shutdown.register(close_db)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if sys.argv[1:2] == ["bench_startup"]:
+        bench_startup(int(sys.argv[2]) if len(sys.argv) > 2 else 5)
+    elif len(sys.argv) == 3 and sys.argv[1] == "import":
+        source = Path(sys.argv[2])
+        started = time.perf_counter()
+        result = asyncio.run(run_import(source))
+        if source.suffix.lower() == ".json":
+            print(
+                f"✅ Import tugadi: {result['seasons']} fasl, {result['files']} fayl, "
+                f"{result['channels']} kanal ({result['skipped']} tasi mavjud edi), "
+                f"{time.perf_counter() - started:.1f} s"
+            )
+        else:
+            elapsed = time.perf_counter() - started
+            print(
+                f"✅ Import tugadi: {result['seasons']} yangi fasl, {result['files']} epizod, "
+                f"{elapsed:.1f} s ({result['files'] / max(elapsed, 1e-9):.0f} qator/s)"
+            )
+    else:
+        asyncio.run(main())
@@ -1,35 +1,477 @@
 import asyncio
+import bisect
+import csv
+import hashlib
 import json
+import os
+import sys
+import time
 from pathlib import Path
-from typing import Dict, List, Any, Optional
-from functools import wraps
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Iterable, Iterator, Tuple
+from collections import OrderedDict, deque
 
-from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram import BaseMiddleware, Bot, Dispatcher, F
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, TelegramObject, Chat, ChatMemberUpdated
 from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandStart, CommandObject, StateFilter
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
-from aiogram.exceptions import TelegramForbiddenError
+from aiogram.dispatcher.flags import get_flag
+from aiogram.exceptions import TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from delivery import RateLimiter, DeliveryQueue, FileCursorStore, FileDeadLetters
 
 # 🔐 Sozlamalar
 BOT_TOKEN = "BOT_TOKEN"
 ADMINS = [5873723609]  # ← O'zingizning Telegram ID
+ADMIN_IDS = frozenset(ADMINS)  # obuna darvozasida tez tekshiruv uchun
+FLUSH_DELAY = 2.0  # O'zgarishlarni diskka yozishdan oldin kutish (soniya)
+
+DATA_FILE = Path("data.json")  # /export natijasi: o'qish uchun qulay nusxa
+EXPORT_SEQ_FILE = Path("data.json.seq")  # data.json qaysi jurnal yozuvigacha eksport qilingani
+SNAPSHOT_FILE = Path("data.snapshot.json")
+JOURNAL_FILE = Path("data.journal")
+COMPACT_EVERY = 500  # Shuncha yozuvdan keyin jurnal snapshotga jamlanadi
+IMPORT_BATCH = 1000  # Import paytida bitta jurnal yozuviga jamlanadigan qatorlar soni
+WATCH_INTERVAL = 5.0  # data.json tashqaridan o'zgarganini tekshirish oralig'i (soniya)
+PAGE_SIZE = 10  # /list_seasons va /admin_list sahifasidagi fasllar soni
+DEAD_LETTER_FILE = Path("dead_letters.jsonl")  # Qayta urinib bo'lmaydigan yuborish xatolari
+CURSORS_FILE = Path("cursors.jsonl")  # (foydalanuvchi, fasl) bo'yicha yuborilgan qismlar soni
+MEMBER_TTL = 600.0  # "obuna bo'lgan" natijasi keshda turadigan vaqt (soniya)
+NON_MEMBER_TTL = 30.0  # "obuna emas" natijasi: foydalanuvchi tez obuna bo'lishi mumkin, shuning uchun qisqa
+MEMBERSHIP_CACHE_SIZE = 100_000  # Keshdagi (foydalanuvchi, kanal) juftliklari chegarasi
+MEMBERSHIP_CONCURRENCY = 5  # Bitta tekshiruvda bir vaqtda yuboriladigan get_chat_member so'rovlari
+MEMBERSHIP_TIMEOUT = 5.0  # Bitta get_chat_member javobini kutish chegarasi (soniya)
+BREAKER_FAILURES = 5  # Shuncha ketma-ket xatodan keyin tekshiruvlar to'xtatiladi (breaker ochiladi)
+BREAKER_COOLDOWN = 30.0  # Ochiq breaker sinov so'rovini yuborishdan oldin kutadigan vaqt (soniya)
+DEGRADED_MODE = "last_known"  # Breaker ochiq paytda: "last_known" - oxirgi ma'lum holat, "fail_open" - hammaga ruxsat
+MEMBERS_FILE = Path("members.jsonl")  # chat_member yangilanishlaridan yig'ilgan kanal a'zolari
+MEMBER_TRACK_MAX_AGE = 3600.0  # Kuzatilgan holat shuncha vaqtdan keyin jonli tekshiruv bilan yangilanadi (o'tkazib yuborilgan chiqish)
+MEMBER_STATUSES = ('member', 'administrator', 'creator')
+
+# 📂 Eski data.json dan boshlang'ich ma'lumot
+def initial_data() -> Dict[str, Any]:
+    if DATA_FILE.exists():
+        with open(DATA_FILE, "r", encoding='utf-8') as f:
+            return json.load(f)
+    return {"channels": []}
+
+def read_export_seq() -> Optional[int]:
+    """data.json qaysi jurnal yozuvigacha eksport qilingani; belgi bo'lmasa None"""
+    try:
+        return int(EXPORT_SEQ_FILE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+def file_stat(path: Path) -> Optional[Tuple[int, int]]:
+    """Faylning (mtime, hajm) belgisi; fayl bo'lmasa None"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+# 📒 Jurnal: har bir o'zgarish bitta qator bo'lib qo'shiladi, vaqti-vaqti bilan snapshot olinadi
+def write_atomic(path: Path, text: str) -> None:
+    """Faylni vaqtinchalik nusxa orqali yozish (uzilishda eski fayl butun qoladi)"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class Journal:
+    """Snapshot + faqat qo'shiladigan jurnal; ishga tushishda jurnal qayta o'ynaladi"""
+
+    def __init__(self, snapshot_file: Path, journal_file: Path):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.seq = 0  # oxirgi yozuv raqami
+        self.records = 0  # snapshotdan keyin jurnalda nechta yozuv bor
+
+    def load_snapshot(self, initial: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Snapshotni o'qish; birinchi ishga tushishda initial() dan snapshot yaratiladi"""
+        if not self.snapshot_file.exists():
+            write_atomic(self.snapshot_file, json.dumps({"seq": 0, "data": initial()}, ensure_ascii=False))
+        snapshot = json.loads(self.snapshot_file.read_text(encoding="utf-8"))
+        self.seq = snapshot["seq"]
+        return snapshot["data"]
+
+    def replay(self, apply: Callable[[Dict[str, Any]], None]) -> None:
+        """Snapshotdan keyingi yozuvlarni qo'llash; yarim yozilgan oxirgi qator tashlanadi"""
+        if not self.journal_file.exists():
+            return
+        good = 0
+        with open(self.journal_file, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    break
+                good += len(raw)
+                if record["seq"] > self.seq:
+                    try:
+                        apply(record)
+                    except (KeyError, IndexError, TypeError) as e:
+                        # Masalan, o'chirilgan faslga fayl yoki maydoni yo'q yozuv: tashlanadi, bot ishga tushaveradi
+                        print(f"Jurnal yozuvi o'tkazib yuborildi (seq={record['seq']}): {e!r}")
+                    self.seq = record["seq"]
+                    self.records += 1
+        if good < self.journal_file.stat().st_size:
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(good)
+
+    def encode(self, record: Dict[str, Any]) -> str:
+        self.seq += 1
+        return json.dumps({"seq": self.seq, **record}, ensure_ascii=False) + "\n"
+
+    def append(self, lines: List[str]) -> None:
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            start = f.tell()
+            try:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError:
+                # Yarim yozilgan qator keyingi qo'shishni buzmasin
+                f.truncate(start)
+                raise
+        self.records += len(lines)
+
+    def snapshot_payload(self, data: Dict[str, Any]) -> str:
+        return json.dumps({"seq": self.seq, "data": data}, ensure_ascii=False)
+
+    def compact(self, payload: str) -> None:
+        """Snapshotni yangilab, jurnalni bo'shatish"""
+        write_atomic(self.snapshot_file, payload)
+        with open(self.journal_file, "w", encoding="utf-8"):
+            pass
+        self.records = 0
+
+# 📄 Fasllar nom bo'yicha tartiblangan indeksi: ro'yxat sahifalab ko'rsatiladi
+class SeasonIndex:
+    """(nom, kalit) bo'yicha tartiblangan ro'yxat; bitta sahifani olish O(sahifa hajmi)"""
+
+    def __init__(self, titles: Callable[[], Iterable[Tuple[str, str]]]):
+        self._titles = titles  # indeks eskirganda qayta qurish manbai: (kalit, nom) juftliklari
+        self._entries: Optional[List[Tuple[str, str, str]]] = None
+
+    def reset(self) -> None:
+        self._entries = None
+
+    def add(self, season_key: str, title: str) -> None:
+        if self._entries is not None:
+            bisect.insort(self._entries, (title.casefold(), season_key, title))
+
+    def remove(self, season_key: str, title: str) -> None:
+        if self._entries is not None:
+            entry = (title.casefold(), season_key, title)
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+
+    def page(self, number: int, size: int = PAGE_SIZE) -> Tuple[int, List[Tuple[str, str]], bool]:
+        """(sahifa raqami, (kalit, nom) juftliklari, keyingi sahifa bormi); ro'yxat qisqargan bo'lsa 0-sahifa"""
+        if self._entries is None:
+            self._entries = sorted((title.casefold(), key, title) for key, title in self._titles())
+        if number * size >= len(self._entries):
+            number = 0
+        start = number * size
+        chunk = self._entries[start:start + size]
+        return number, [(key, title) for _, key, title in chunk], start + size < len(self._entries)
+
+# 🗂️ Xotiradagi katalog: bir marta yuklanadi, o'zgarishlar jurnalga fon rejimida yoziladi
+class Catalog:
+    """Fasllar va kanallarni xotirada saqlaydi, o'zgarishlarni jurnalga jamlab yozadi"""
+
+    def __init__(self, flush_delay: float = FLUSH_DELAY):
+        self.flush_delay = flush_delay
+        self.journal = Journal(SNAPSHOT_FILE, JOURNAL_FILE)
+        self.seasons: Dict[str, Dict[str, Any]] = {}
+        self.channels: List[Dict[str, str]] = []
+        self._subscribe_markup: Optional[InlineKeyboardMarkup] = None  # kanallar o'zgarganda tashlanadi
+        self._pending: List[str] = []  # hali diskka tushmagan jurnal qatorlari
+        self.index = SeasonIndex(self.titles)
+        self._io_lock = asyncio.Lock()  # jurnal va snapshotga bir vaqtda bitta yozuvchi
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._watcher: Optional[asyncio.Task] = None
+        # data.json ning oxirgi ma'lum holati: (mtime, hajm) va sha256
+        self._source_stat: Optional[Tuple[int, int]] = None
+        self._source_hash: Optional[str] = None
+        self.reload()
+
+    def reload(self) -> None:
+        """Snapshot va jurnaldan katalogni tiklash"""
+        self.index.reset()
+        data = self.journal.load_snapshot(initial_data)
+        self.channels = data.pop("channels", [])
+        self._subscribe_markup = None
+        self.seasons = data
+        self.journal.replay(self.apply)
+        # Bot to'xtab turganda data.json tahrirlangan bo'lsa, u snapshotdan yangi bo'ladi
+        source, snapshot = file_stat(DATA_FILE), file_stat(SNAPSHOT_FILE)
+        if source is not None and snapshot is not None and source[0] > snapshot[0] and self._source_current():
+            self._swap(initial_data())
+            self.journal.compact(self.journal.snapshot_payload(self.to_dict()))
+
+    def _swap(self, data: Dict[str, Any]) -> None:
+        # Bitta almashtirish: jarayondagi yuborishlar eski lug'atlarni ko'rishda davom etadi
+        channels = data.pop("channels", [])
+        self.seasons, self.channels = data, channels
+        self._subscribe_markup = None
+        self.index.reset()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"channels": self.channels, **self.seasons}
+
+    def subscribe_markup(self) -> Optional[InlineKeyboardMarkup]:
+        """Majburiy kanallar tugmalari (kanal bo'lmasa None)"""
+        if self._subscribe_markup is None and self.channels:
+            self._subscribe_markup = build_subscribe_markup(self.channels)
+        return self._subscribe_markup
+
+    def _source_current(self) -> bool:
+        """Tashqi data.json faqat oxirgi /export dan keyin katalog o'zgarmagan bo'lsa qabul qilinadi"""
+        export_seq = read_export_seq()
+        if export_seq == self.journal.seq and not self._pending:
+            return True
+        print(f"⚠️ {DATA_FILE} o'zgardi, lekin u eskirgan (eksport seq={export_seq}, katalog seq={self.journal.seq}): "
+              f"o'zgarish qabul qilinmadi. Avval /export qiling, keyin tahrirlang.")
+        return False
+
+    def get(self, season_key: str) -> Optional[Dict[str, Any]]:
+        return self.seasons.get(season_key)
+
+    def titles(self) -> Iterator[Tuple[str, str]]:
+        for key, season in self.seasons.items():
+            yield key, season["title"]
+
+    def apply(self, record: Dict[str, Any]) -> None:
+        """Jurnal yozuvini xotiradagi katalogga qo'llash; yaroqsiz yozuv hech narsani o'zgartirmay KeyError/IndexError beradi"""
+        op = record["op"]
+        title = record["title"] if op == "add_season" else None  # indeksga tegishdan oldin tekshiriladi
+        if op in ("add_season", "delete_season") and record["key"] in self.seasons:
+            self.index.remove(record["key"], self.seasons[record["key"]]["title"])
+        if op == "add_season":
+            self.seasons[record["key"]] = {"title": title, "files": []}
+            self.index.add(record["key"], title)
+        elif op == "add_file":
+            files = self.seasons[record["key"]]["files"]
+            files.append({
+                "file_id": record["file_id"],
+                "caption": record["caption"],
+                "number": record.get("number") or len(files) + 1
+            })
+        elif op == "update_caption":
+            self.seasons[record["key"]]["files"][record["index"]]["caption"] = record["caption"]
+        elif op == "delete_season":
+            self.seasons.pop(record["key"], None)
+        elif op == "add_channel":
+            self.channels.append({"id": record["id"], "name": record["name"]})
+            self._subscribe_markup = None
+        elif op == "remove_channel":
+            self.channels = [chan for chan in self.channels if chan["id"] != record["id"]]
+            self._subscribe_markup = None
+
+    def _commit(self, record: Dict[str, Any]) -> None:
+        self._pending.append(self.journal.encode(record))
+        self.apply(record)
+        self.mark_dirty()
+
+    # ✏️ O'zgartirishlar (xotirada darhol, diskda keyinroq)
+    def add_season(self, season_key: str, title: str) -> None:
+        self._commit({"op": "add_season", "key": season_key, "title": title})
+
+    def add_file(self, season_key: str, file_id: str, caption: str = "", number: Optional[int] = None) -> bool:
+        if season_key not in self.seasons:
+            return False
+        record = {"op": "add_file", "key": season_key, "file_id": file_id, "caption": caption}
+        if number is not None:
+            record["number"] = number
+        self._commit(record)
+        return True
+
+    def update_caption(self, season_key: str, file_index: int, new_caption: str) -> bool:
+        season = self.seasons.get(season_key)
+        if season is None or not 0 <= file_index < len(season["files"]):
+            return False
+        self._commit({"op": "update_caption", "key": season_key, "index": file_index, "caption": new_caption})
+        return True
+
+    def delete_season(self, season_key: str) -> Optional[Dict[str, Any]]:
+        season = self.seasons.get(season_key)
+        if season is not None:
+            self._commit({"op": "delete_season", "key": season_key})
+        return season
+
+    def add_channel(self, channel_id: str, channel_name: str) -> bool:
+        if any(chan["id"] == channel_id for chan in self.channels):
+            return False
+        self._commit({"op": "add_channel", "id": channel_id, "name": channel_name})
+        return True
+
+    def remove_channel(self, channel_id: str) -> bool:
+        if not any(chan["id"] == channel_id for chan in self.channels):
+            return False
+        self._commit({"op": "remove_channel", "id": channel_id})
+        return True
 
-DATA_FILE = Path("data.json")
-if not DATA_FILE.exists():
-    DATA_FILE.write_text(json.dumps({"channels": []}, ensure_ascii=False))
+    # 💾 Diskka yozish
+    def mark_dirty(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
 
-# 📂 Ma'lumotni o'qish/yozish
-def load_data() -> Dict[str, Any]:
-    with open(DATA_FILE, "r", encoding='utf-8') as f:
-        return json.load(f)
+    async def flush(self, compact: bool = True) -> None:
+        """Jamlangan yozuvlarni jurnalga bitta yozish bilan qo'shish; compact=False da snapshot olinmaydi"""
+        async with self._io_lock:
+            await self._flush_pending()
+            if compact and self.journal.records >= COMPACT_EVERY:
+                await self._compact()
 
-def save_data(data: Dict[str, Any]) -> None:
-    with open(DATA_FILE, "w", encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    async def _flush_pending(self) -> None:
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self.journal.append, lines)
+        except Exception:
+            self._pending = lines + self._pending  # keyingi urinishda qayta yoziladi
+            raise
+
+    async def _compact(self) -> None:
+        # Snapshot event loop ichida olinadi, shuning uchun u izchil bo'ladi
+        payload = self.journal.snapshot_payload(self.to_dict())
+        await asyncio.to_thread(self.journal.compact, payload)
+
+    async def export(self) -> None:
+        """Katalogni o'qish uchun qulay data.json ko'rinishida yozish"""
+        async with self._io_lock:
+            await self._flush_pending()
+            seq, payload = self.journal.seq, json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+            await asyncio.to_thread(write_atomic, DATA_FILE, payload)
+            await asyncio.to_thread(write_atomic, EXPORT_SEQ_FILE, str(seq))
+            # O'zimiz yozgan data.json qayta yuklanmasin; snapshot undan yangiroq bo'lishi kerak
+            self._source_stat = file_stat(DATA_FILE)
+            self._source_hash = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+            await self._compact()
+
+    # 🔄 data.json tashqaridan tahrirlansa, katalog faqat haqiqiy o'zgarishda qayta yuklanadi
+    async def check_source(self) -> bool:
+        stat = file_stat(DATA_FILE)
+        if stat is None or stat == self._source_stat:
+            return False
+        raw = await asyncio.to_thread(DATA_FILE.read_bytes)
+        self._source_stat = stat
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest == self._source_hash:
+            return False  # fayl tegilgan, lekin mazmuni o'zgarmagan
+        data = await asyncio.to_thread(json.loads, raw)
+        self._source_hash = digest
+        async with self._io_lock:
+            # Eksportdan keyingi o'zgarishlar faqat jurnalda: eskirgan data.json ularni o'chirib yubormasin
+            if not self._source_current():
+                return False
+            self._swap(data)
+            await self._compact()
+        return True
+
+    async def _watch_loop(self) -> None:
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            try:
+                if await self.check_source():
+                    print(f"🔄 {DATA_FILE} o'zgardi, katalog qayta yuklandi.")
+            except Exception as e:
+                print(f"Xato: {e}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Ketma-ket kelgan o'zgarishlarni bitta yozuvga jamlaymiz
+            await asyncio.sleep(self.flush_delay)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Xato: katalog jurnalini yozib bo'lmadi: {e}")
+                self._wakeup.set()  # flush_delay dan keyin qayta uriniladi
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        if self._pending:
+            self._wakeup.set()
+        self._source_stat = file_stat(DATA_FILE)
+        if self._source_stat is not None:
+            raw = await asyncio.to_thread(DATA_FILE.read_bytes)
+            self._source_hash = hashlib.sha256(raw).hexdigest()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._watcher = asyncio.create_task(self._watch_loop())
+
+    async def stop(self) -> None:
+        for task in (self._watcher, self._flusher):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._watcher = self._flusher = None
+        await self.flush()
+
+catalog = Catalog()
+
+# 📦 Ommaviy import: manifestdagi epizodlar partiyalab jurnalga yoziladi
+def iter_manifest(path: Path) -> Iterator[Dict[str, Any]]:
+    """JSONL yoki CSV manifestdan (season_key, title, file_id, caption, number) qatorlarini o'qish"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            key = row["season_key"]
+            number = row.get("number")
+            yield {
+                "season_key": key,
+                "title": row.get("title") or key.removeprefix("season_").replace("_", " "),
+                "file_id": row["file_id"],
+                "caption": row.get("caption") or "",
+                "number": int(number) if number not in (None, "") else None
+            }
+
+async def import_manifest(path: Path) -> Dict[str, int]:
+    """Manifestdagi epizodlarni katalogga qo'shish: har IMPORT_BATCH qator bitta jurnal yozuvi.
+    Bot to'xtatilgan holda ishga tushiring, aks holda jurnalga ikki jarayon yozadi."""
+    stats = {"seasons": 0, "files": 0}
+    for row in iter_manifest(path):
+        key = row["season_key"]
+        if key not in catalog.seasons:
+            catalog.add_season(key, row["title"])
+            stats["seasons"] += 1
+        catalog.add_file(key, row["file_id"], row["caption"], row["number"])
+        stats["files"] += 1
+        if stats["files"] % IMPORT_BATCH == 0:
+            # Har partiyada snapshot qayta yozilsa, katta import O(n^2) bo'ladi: oxirida bir marta
+            await catalog.flush(compact=False)
+    await catalog.flush()
+    return stats
+
+# 📄 Sahifa tugmalari: har bir fasl alohida qatorda, pastda oldingi/keyingi
+def seasons_page_markup(seasons: List[Tuple[str, str]], page: int, has_next: bool, item_prefix: str, page_prefix: str) -> InlineKeyboardMarkup:
+    buttons = [[InlineKeyboardButton(text=title, callback_data=f"{item_prefix}{key}")] for key, title in seasons]
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="⬅️ Oldingi", callback_data=f"{page_prefix}{page - 1}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Keyingi ➡️", callback_data=f"{page_prefix}{page + 1}"))
+    if nav:
+        buttons.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # 🤖 Bot va Dispatcher
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
@@ -47,139 +489,486 @@ class EditSeason(StatesGroup):
 # Yangi struktura uchun yordamchi funksiya
 def get_season_info(season_key: str) -> Optional[Dict[str, Any]]:
     """Fasl ma'lumotlarini olish"""
-    data = load_data()
-    return data.get(season_key)
+    return catalog.get(season_key)
 
 def add_file_to_season(season_key: str, file_id: str, caption: str = "") -> None:
     """Faylni faslga qo'shish"""
-    data = load_data()
-    if season_key in data:
-        data[season_key]["files"].append({
-            "file_id": file_id,
-            "caption": caption,
-            "number": len(data[season_key]["files"]) + 1
-        })
-        save_data(data)
+    catalog.add_file(season_key, file_id, caption)
 
 def update_file_caption(season_key: str, file_index: int, new_caption: str) -> bool:
     """Fayl tavsifini yangilash"""
-    data = load_data()
-    if season_key in data and 0 <= file_index < len(data[season_key]["files"]):
-        data[season_key]["files"][file_index]["caption"] = new_caption
-        save_data(data)
+    return catalog.update_caption(season_key, file_index, new_caption)
+
+# 📢 Obuna tugmalari: kanallar o'zgarmaguncha bir marta yasalib, qayta ishlatiladi
+def build_subscribe_markup(channels: List[Dict[str, str]]) -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton(text=f"📢 {channel['name']}", url=f"https://t.me/{channel['id'].lstrip('@')}")]
+        for channel in channels
+    ]
+    buttons.append([InlineKeyboardButton(text="✅ Tekshirish", callback_data="check_subscription")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+# 🧠 Obuna natijalari keshi: har bir so'rovda get_chat_member chaqirilmaydi
+class MembershipCache:
+    """(foydalanuvchi, kanal) bo'yicha obuna natijalari; ijobiy va salbiy natija uchun alohida TTL, LRU chiqarish"""
+
+    def __init__(self, max_size: int = MEMBERSHIP_CACHE_SIZE,
+                 member_ttl: float = MEMBER_TTL, non_member_ttl: float = NON_MEMBER_TTL):
+        self.max_size = max_size
+        self.member_ttl = member_ttl
+        self.non_member_ttl = non_member_ttl
+        self._entries: OrderedDict = OrderedDict()  # (foydalanuvchi, kanal) -> (obunami, muddat)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, channel_id: str) -> Optional[bool]:
+        """Keshdagi natija yoki None (yo'q yoki muddati o'tgan)"""
+        key = (user_id, channel_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            # Muddati o'tgan yozuv LRU chiqarguncha oxirgi ma'lum holat sifatida qoladi (peek)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def peek(self, user_id: int, channel_id: str) -> Optional[bool]:
+        """Muddatidan qat'i nazar oxirgi natija (degraded rejim uchun)"""
+        entry = self._entries.get((user_id, channel_id))
+        return entry[0] if entry is not None else None
+
+    def set(self, user_id: int, channel_id: str, is_member: bool) -> None:
+        key = (user_id, channel_id)
+        ttl = self.member_ttl if is_member else self.non_member_ttl
+        self._entries[key] = (is_member, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries)
+        }
+
+membership_cache = MembershipCache()
+
+# 👥 Kanal a'zolari kuzatuvchisi: bot admin bo'lgan kanallardan chat_member yangilanishlari keladi
+class MembershipTracker:
+    """Kanal -> {foydalanuvchi: (a'zomi, ko'rilgan vaqt)}; o'zgarishlar members.jsonl ga fon rejimida qo'shiladi.
+    max_age dan eski yozuv ishonchsiz: chiqish yangilanishi o'tkazib yuborilgan bo'lishi mumkin"""
+
+    def __init__(self, path: Path, max_age: float = MEMBER_TRACK_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.members: Dict[str, Dict[int, Tuple[bool, float]]] = {}
+        self._dirty: List[Dict[str, Any]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.unknown = 0
+        self.stale = 0
+        self._load()
+
+    def _load(self) -> None:
+        """Faylni qayta o'qish; yarim yozilgan qatorlar tashlanadi, fayl haddan oshsa jamlanadi"""
+        if not self.path.exists():
+            return
+        lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                lines += 1
+                if "u" in record:
+                    # Vaqti yo'q eski yozuvlar darhol eskirgan hisoblanadi
+                    self.members.setdefault(record["c"], {})[record["u"]] = (record["m"], record.get("t", 0.0))
+                else:
+                    self.members.pop(record["c"], None)
+        entries = sum(len(users) for users in self.members.values())
+        if lines > 2 * entries + 1000:
+            write_atomic(self.path, "".join(
+                json.dumps({"c": channel_id, "u": user_id, "m": is_member, "t": seen}) + "\n"
+                for channel_id, users in self.members.items()
+                for user_id, (is_member, seen) in users.items()
+            ))
+
+    def get(self, channel_id: str, user_id: int) -> Optional[bool]:
+        """Kuzatilgan natija yoki None (ko'rilmagan yoki eskirgan: chaqiruvchi jonli tekshiradi)"""
+        entry = self.members.get(channel_id, {}).get(user_id)
+        if entry is None:
+            self.unknown += 1
+            return None
+        if time.time() - entry[1] > self.max_age:
+            self.stale += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def last_known(self, channel_id: str, user_id: int) -> Optional[bool]:
+        """Yoshidan qat'i nazar oxirgi kuzatilgan holat (degraded rejim uchun)"""
+        entry = self.members.get(channel_id, {}).get(user_id)
+        return entry[0] if entry is not None else None
+
+    def record(self, channel_id: str, user_id: int, is_member: bool, from_event: bool = True) -> None:
+        """Holatni yozish; jonli tekshiruv natijasi faqat yangilanishlari kelayotgan kanal uchun saqlanadi.
+        Holat o'zgarmasa ham vaqti yangilanadi, shunda qayta ishga tushgandan keyin ham eskirmaydi"""
+        users = self.members.get(channel_id)
+        if users is None:
+            if not from_event:
+                return
+            users = self.members[channel_id] = {}
+        seen = time.time()
+        users[user_id] = (is_member, seen)
+        self._dirty.append({"c": channel_id, "u": user_id, "m": is_member, "t": seen})
+
+    def forget(self, channel_id: str) -> None:
+        """Kanal ro'yxatdan olinganda uning a'zolari ham o'chiriladi"""
+        if self.members.pop(channel_id, None) is not None:
+            self._dirty.append({"c": channel_id})
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "channels": len(self.members),
+            "entries": sum(len(users) for users in self.members.values()),
+            "hits": self.hits,
+            "unknown": self.unknown,
+            "stale": self.stale
+        }
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, []
+        text = "".join(json.dumps(record) + "\n" for record in dirty)
+        try:
+            await asyncio.to_thread(self._append, text)
+        except Exception:
+            self._dirty = dirty + self._dirty  # keyingi urinishda qayta yoziladi
+            raise
+
+    def _append(self, text: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_DELAY)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Xato: a'zolar faylini yozib bo'lmadi: {e}")
+
+    async def start(self) -> None:
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+member_tracker = MembershipTracker(MEMBERS_FILE)
+
+def match_channel(chat: Chat, channels: List[Dict[str, str]]) -> Optional[str]:
+    """Yangilanish kelgan chatga mos majburiy kanal ID si (ID yoki @username bo'yicha)"""
+    names = {str(chat.id)}
+    if chat.username:
+        names.add(f"@{chat.username}".lower())
+    for channel in channels:
+        if channel["id"].lower() in names:
+            return channel["id"]
+    return None
+
+# 🔌 get_chat_member uchun circuit breaker: Bot API sekinlashganda har bir foydalanuvchini bloklamaymiz
+class CircuitBreaker:
+    """closed -> (ketma-ket failure_threshold xato) -> open -> (cooldown) -> half_open: bitta sinov so'rovi"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0  # ketma-ket xatolar
+        self.opened_at = 0.0
+        self._probing = False
+        self.errors = 0
+        self.opens = 0
+        self.rejected = 0
+        self.probes = 0
+        self.degraded = 0
+
+    def allow(self) -> bool:
+        """So'rov yuborish mumkinmi; open holatda darhol rad etiladi, half_open da faqat bitta sinov o'tadi"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+            self.probes += 1
         return True
-    return False
+
+    def record(self, ok: bool, probe: bool = False) -> None:
+        """Natijani yozish; sinov belgisini faqat uni qo'ygan so'rov (probe=True) olib tashlaydi"""
+        if probe:
+            self._probing = False
+        if ok:
+            self.failures = 0
+            self.state = "closed"
+            return
+        self.errors += 1
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opens += 1
+
+    def release(self, probe: bool = False) -> None:
+        """Natijasiz tugagan (bekor qilingan) sinov keyingisiga joy bo'shatadi"""
+        if probe:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "errors": self.errors,
+            "opens": self.opens,
+            "rejected": self.rejected,
+            "probes": self.probes,
+            "degraded": self.degraded
+        }
+
+membership_breaker = CircuitBreaker()
+
+def degraded_status(user_id: int, channel_id: str) -> bool:
+    """Telegram javob bermaganda qaror: oxirgi ma'lum holat (eskirgan bo'lsa ham) yoki ruxsat"""
+    if DEGRADED_MODE not in ("last_known", "fail_open"):
+        raise ValueError(f"DEGRADED_MODE noma'lum: {DEGRADED_MODE!r}")
+    membership_breaker.degraded += 1
+    if DEGRADED_MODE == "last_known":
+        known = member_tracker.last_known(channel_id, user_id)
+        if known is None:
+            known = membership_cache.peek(user_id, channel_id)
+        if known is not None:
+            return known
+    return True
 
 # Foydalanuvchi obunasi tekshiruvi
-async def is_user_subscribed(user_id: int) -> bool:
-    """Foydalanuvchi barcha majburiy kanallarga obuna bo'lganini tekshiradi"""
-    data = load_data()
-    channels = data.get("channels", [])
+async def check_channel_member(user_id: int, channel_id: str) -> bool:
+    """Bitta kanal: True - o'tkaziladi, False - rad etiladi"""
+    if not membership_breaker.allow():
+        return degraded_status(user_id, channel_id)
+    # allow() dan keyin half_open bo'lsa, sinov so'rovi aynan shu (oraliqda await yo'q)
+    probe = membership_breaker.state == "half_open"
+    try:
+        member = await asyncio.wait_for(bot.get_chat_member(channel_id, user_id), MEMBERSHIP_TIMEOUT)
+    except TelegramForbiddenError:
+        membership_breaker.record(True, probe)
+        # Bot kanalda admin emas, xavfsizlik uchun ruxsat beramiz (bu ham keshlanadi)
+        membership_cache.set(user_id, channel_id, True)
+        return True
+    except (TelegramNetworkError, TelegramServerError, TelegramRetryAfter, asyncio.TimeoutError):
+        # Bot API sekin yoki ishlamayapti: foydalanuvchi aybdor emas, natija keshlanmaydi
+        membership_breaker.record(False, probe)
+        return degraded_status(user_id, channel_id)
+    except asyncio.CancelledError:
+        membership_breaker.release(probe)
+        raise
+    except Exception:
+        membership_breaker.record(True, probe)  # Telegram javob berdi (masalan, foydalanuvchi topilmadi)
+        return False  # Xatolik yuz bersa, obuna emas deb hisoblaymiz
+    is_member = member.status in MEMBER_STATUSES
+    membership_breaker.record(True, probe)
+    membership_cache.set(user_id, channel_id, is_member)
+    member_tracker.record(channel_id, user_id, is_member, from_event=False)
+    return is_member
+
+async def first_denial(user_id: int, channel_ids: List[str]) -> bool:
+    """Kanallarni parallel (MEMBERSHIP_CONCURRENCY tadan) tekshirish; birinchi rad javobida qolganlari bekor qilinadi"""
+    semaphore = asyncio.Semaphore(MEMBERSHIP_CONCURRENCY)
+
+    async def limited(channel_id: str) -> bool:
+        async with semaphore:
+            return await check_channel_member(user_id, channel_id)
+
+    tasks = [asyncio.create_task(limited(channel_id)) for channel_id in channel_ids]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            if not await finished:
+                return True
+        return False
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def is_user_subscribed(user_id: int, use_cache: bool = True) -> bool:
+    """Foydalanuvchi barcha majburiy kanallarga obuna bo'lganini tekshiradi: avval kuzatuvchi, keyin kesh,
+    oxirida jonli so'rov (use_cache=False - faqat jonli tekshiruv)"""
+    channels = catalog.channels
     
     # Agar kanallar ro'yxati bo'sh bo'lsa, cheklov yo'q
     if not channels:
         return True
         
+    unknown = []
     for channel in channels:
-        try:
-            member = await bot.get_chat_member(channel["id"], user_id)
-            if member.status not in ['member', 'administrator', 'creator']:
-                return False  # Agar hech bo'lmaganda bitta kanalga obuna bo'lmasa
-        except TelegramForbiddenError:
-            # Bot kanalda admin emas, xavfsizlik uchun ruxsat beramiz
-            continue
-        except Exception:
-            return False  # Xatolik yuz bersa, obuna emas deb hisoblaymiz
-            
-    return True  # Barcha kanallarga obuna
-
-def subscription_required(handler):
-    @wraps(handler)
-    async def wrapper(message: Message, *args, **kwargs):
-        if message.from_user.id in ADMINS:
-            return await handler(message, *args, **kwargs)
-            
-        if not await is_user_subscribed(message.from_user.id):
-            data = load_data()
-            channels = data.get("channels", [])
-            
-            if not channels:
-                return await handler(message, *args, **kwargs)  # Cheklov yo'q
-            
-            buttons = [
-                [InlineKeyboardButton(text=f"📢 {channel['name']}", url=f"https://t.me/{channel['id'].lstrip('@')}")]
-                for channel in channels
-            ]
-            buttons.append([InlineKeyboardButton(text="✅ Tekshirish", callback_data="check_subscription")])
-            
-            keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await message.answer(
-                "⚠️ Botdan foydalanish uchun quyidagi kanallarga obuna bo'lishingiz kerak!",
-                reply_markup=keyboard
-            )
-            return
-        return await handler(message, *args, **kwargs)
-    return wrapper
-
-def subscription_required_callback(handler):
-    @wraps(handler)
-    async def wrapper(callback: CallbackQuery, *args, **kwargs):
-        if callback.from_user.id in ADMINS:
-            return await handler(callback, *args, **kwargs)
+        cached = None
+        if use_cache:
+            cached = member_tracker.get(channel["id"], user_id)
+            if cached is None:
+                cached = membership_cache.get(user_id, channel["id"])
+        if cached is None:
+            unknown.append(channel["id"])
+        elif not cached:
+            return False  # Agar hech bo'lmaganda bitta kanalga obuna bo'lmasa
             
-        if not await is_user_subscribed(callback.from_user.id):
-            data = load_data()
-            channels = data.get("channels", [])
-            
-            if not channels:
-                return await handler(callback, *args, **kwargs)  # Cheklov yo'q
-            
-            buttons = [
-                [InlineKeyboardButton(text=f"📢 {channel['name']}", url=f"https://t.me/{channel['id'].lstrip('@')}")]
-                for channel in channels
-            ]
-            buttons.append([InlineKeyboardButton(text="✅ Tekshirish", callback_data="check_subscription")])
-            
-            keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-            await callback.answer("⚠️ Botdan foydalanish uchun kanallarga obuna bo'ling!", show_alert=True)
+    # Kuzatuvchida ham, keshda ham yo'q kanallar bir vaqtda tekshiriladi
+    return not unknown or not await first_denial(user_id, unknown)  # Barcha kanallarga obuna
+
+# 🚪 Obuna darvozasi: holat har bir update uchun ko'pi bilan bir marta hisoblanadi.
+# Tashqi middleware data["subscription"] ni qo'yadi (handlerlar ham undan foydalanishi mumkin); route flaglari
+# faqat ichki middlewarega ko'rinadi, shuning uchun flags={"subscription": True} li handlerlarni ichki middleware to'sadi.
+class GateMetrics:
+    """Darvoza har bir updatega qancha vaqt qo'shayotganini kuzatadi"""
+
+    def __init__(self, window: int = 1000):
+        self.samples: deque = deque(maxlen=window)
+        self.checks = 0
+        self.admins = 0
+        self.denied = 0
+
+    def observe(self, elapsed: float, allowed: bool) -> None:
+        self.checks += 1
+        if not allowed:
+            self.denied += 1
+        self.samples.append(elapsed)
+
+    def stats(self) -> Dict[str, float]:
+        if not self.samples:
+            return {"checks": self.checks, "admins": self.admins, "denied": self.denied, "avg": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "checks": self.checks,
+            "admins": self.admins,
+            "denied": self.denied,
+            "avg": sum(ordered) / len(ordered),
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max": ordered[-1]
+        }
+
+gate_metrics = GateMetrics()
+
+class SubscriptionStatus:
+    """Bitta update uchun obuna holati: birinchi so'rovda hisoblanadi, keyin tayyor natija qaytadi"""
+
+    def __init__(self, user_id: Optional[int]):
+        self.user_id = user_id
+        self.allowed: Optional[bool] = None
+
+    async def check(self) -> bool:
+        if self.allowed is None:
+            started = time.perf_counter()
+            if self.user_id is None or self.user_id in ADMIN_IDS:
+                self.allowed = True
+                gate_metrics.admins += 1
+            else:
+                self.allowed = await is_user_subscribed(self.user_id)
+            gate_metrics.observe(time.perf_counter() - started, self.allowed)
+        return self.allowed
+
+class SubscriptionGate(BaseMiddleware):
+    """Tashqi middleware: handler data ga kechiktirilgan obuna holatini qo'yadi"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        data["subscription"] = SubscriptionStatus(user.id if user else None)
+        return await handler(event, data)
+
+class SubscriptionGuard(BaseMiddleware):
+    """Ichki middleware: subscription flagi bor handlerga obuna bo'lmagan foydalanuvchini o'tkazmaydi"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not get_flag(data, "subscription") or await data["subscription"].check():
+            return await handler(event, data)
+
+        keyboard = catalog.subscribe_markup()
+        if keyboard is None:
+            return await handler(event, data)  # Cheklov yo'q
+
+        if isinstance(event, CallbackQuery):
+            await event.answer("⚠️ Botdan foydalanish uchun kanallarga obuna bo'ling!", show_alert=True)
             try:
-                await callback.message.edit_text(
+                await event.message.edit_text(
                     "⚠️ Botdan foydalanish uchun quyidagi kanallarga obuna bo'lishingiz kerak!",
                     reply_markup=keyboard
                 )
             except:
-                await callback.message.answer(
+                await event.message.answer(
                     "⚠️ Botdan foydalanish uchun quyidagi kanallarga obuna bo'lishingiz kerak!",
                     reply_markup=keyboard
                 )
-            return
-        return await handler(callback, *args, **kwargs)
-    return wrapper
+        else:
+            await event.answer(
+                "⚠️ Botdan foydalanish uchun quyidagi kanallarga obuna bo'lishingiz kerak!",
+                reply_markup=keyboard
+            )
+
+for observer in (dp.message, dp.callback_query):
+    observer.outer_middleware(SubscriptionGate())
+    observer.middleware(SubscriptionGuard())
+
+# 📬 Fasl yuborish navbati (tezlik cheklovi, kursorlar va dead letterlar delivery.py da)
+delivery_queue = DeliveryQueue(RateLimiter(), FileDeadLetters(DEAD_LETTER_FILE), FileCursorStore(CURSORS_FILE))
+
+def episode_caption(file_info: Dict[str, Any]) -> str:
+    """Albomdagi izoh: {raqam}-qism: tavsif"""
+    caption = file_info.get("caption", "")
+    number = file_info.get("number", "")
+    return f"{number}-qism" + (f": {caption}" if caption else "")
 
 # 🔘 /start (yoki start link bilan)
-@dp.message(CommandStart(deep_link=True))
-@subscription_required
+@dp.message(CommandStart(deep_link=True), flags={"subscription": True})
 async def start_with_param(message: Message, command: CommandObject):
     season_key = command.args
-    data = load_data()
-    season = data.get(season_key)
+    season = catalog.get(season_key)
     if not season:
         await message.answer("❌ Bunday fasl topilmadi.")
         return
 
-    await message.answer(f"🎬 <b>{season['title']}</b>\nYuklanmoqda...")
-    for file_info in season["files"]:
-        file_id = file_info["file_id"]
-        caption = file_info.get("caption", "")
-        number = file_info.get("number", "")
-        
-        caption_text = f"{number}-qism" + (f": {caption}" if caption else "")
-        
-        await message.answer_video(file_id, caption=caption_text)
-        await asyncio.sleep(1)
+    episodes = [(file_info["file_id"], episode_caption(file_info)) for file_info in season["files"]]
+    # Havola har doim faslni boshidan ochadi; to'xtagan joydan davom etish - "Davom ettirish"/"Keyingi" tugmalarida
+    status = await delivery_queue.submit(message.from_user.id, message, season_key, season['title'], episodes, resume=False)
+    if status == "attached":
+        await message.answer("⏳ Bu fasl allaqachon yuborilmoqda, yuqoridagi xabarda jarayonni kuzating.")
+    elif status == "busy":
+        await message.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.")
 
-@dp.message(CommandStart())
-@subscription_required
+@dp.message(CommandStart(), flags={"subscription": True})
 async def start(message: Message):
     await message.answer("👋 Anime yuklovchi botga xush kelibsiz!")
 
@@ -197,16 +986,11 @@ async def add_season(message: Message, command: CommandObject, state: FSMContext
 
     season_name = season_name.replace(" ", "_")
     key = f"season_{season_name}"
-    data = load_data()
-    if key in data:
+    if key in catalog.seasons:
         await message.answer("❗ Bu fasl allaqachon mavjud.")
         return
 
-    data[key] = {
-        "title": season_name.replace("_", " "),
-        "files": []
-    }
-    save_data(data)
+    catalog.add_season(key, season_name.replace("_", " "))
 
     await state.set_state(AddSeason.waiting_files)
     await state.update_data(season_key=key)
@@ -274,47 +1058,46 @@ async def skip_caption(message: Message, state: FSMContext):
     await message.answer("✅ Fayl qo‘shildi (tavsif). Davom eting...")
 
 # 🔘 /list_seasons - Barcha mavsumlarni inline tugmalar bilan ko'rsatadi
-@dp.message(Command("list_seasons"))
-@subscription_required
+@dp.message(Command("list_seasons"), flags={"subscription": True})
 async def list_seasons(message: Message):
-    data = load_data()
-    if not data or all(key == "channels" for key in data.keys()):
+    page, seasons, has_next = catalog.index.page(0)
+    if not seasons:
         await message.answer("❌ Hozircha mavsumlar yo‘q.")
         return
 
-    buttons = []
-    for key, season in data.items():
-        if key != "channels":  # channels kalitini tashlab ketamiz
-            button = InlineKeyboardButton(text=season["title"], callback_data=f"view_{key}")
-            buttons.append([button])
-
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+    markup = seasons_page_markup(seasons, page, has_next, "view_", "list_page:")
     await message.answer("🎬 Mavjud mavsumlar:", reply_markup=markup)
 
+# 📄 /list_seasons sahifalari (oldingi/keyingi)
+@dp.callback_query(F.data.startswith("list_page:"), flags={"subscription": True})
+async def list_seasons_page(callback: CallbackQuery):
+    page, seasons, has_next = catalog.index.page(int(callback.data.split(":", 1)[1]))
+    if not seasons:
+        await callback.answer("❌ Hozircha mavsumlar yo‘q.", show_alert=True)
+        return
+
+    markup = seasons_page_markup(seasons, page, has_next, "view_", "list_page:")
+    await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
 # 🎬 Faslni ko'rish (callback orqali)
-@dp.callback_query(F.data.startswith("view_"))
-@subscription_required_callback
+@dp.callback_query(F.data.startswith("view_"), flags={"subscription": True})
 async def view_season(callback: CallbackQuery):
     key = callback.data.split("_", 1)[1]
-    data = load_data()
-    season = data.get(key)
+    season = catalog.get(key)
 
     if not season:
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
         return
 
-    await callback.message.answer(f"🎬 <b>{season['title']}</b>\nYuklanmoqda...")
-    for file_info in season["files"]:
-        file_id = file_info["file_id"]
-        caption = file_info.get("caption", "")
-        number = file_info.get("number", "")
-        
-        caption_text = f"{number}-qism" + (f": {caption}" if caption else "")
-        
-        await callback.message.answer_video(file_id, caption=caption_text)
-        await asyncio.sleep(1)
-
-    await callback.answer()
+    episodes = [(file_info["file_id"], episode_caption(file_info)) for file_info in season["files"]]
+    status = await delivery_queue.submit(callback.from_user.id, callback.message, key, season['title'], episodes)
+    if status == "queued":
+        await callback.answer()
+    elif status == "attached":
+        await callback.answer("⏳ Bu fasl allaqachon yuborilmoqda.")
+    else:
+        await callback.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.", show_alert=True)
 
 # 🔐 /admin_list - Faqat admin uchun mavsumlar ro'yxati (tahrirlash/o'chirish bilan)
 @dp.message(Command("admin_list"))
@@ -323,26 +1106,37 @@ async def admin_list_seasons(message: Message):
         await message.answer("❌ Ruxsat yo‘q.")
         return
 
-    data = load_data()
-    if not data or all(key == "channels" for key in data.keys()):
+    page, seasons, has_next = catalog.index.page(0)
+    if not seasons:
         await message.answer("❌ Hozircha mavsumlar yo‘q.")
         return
 
-    buttons = []
-    for key, season in data.items():
-        if key != "channels":  # channels kalitini tashlab ketamiz
-            button = InlineKeyboardButton(text=season["title"], callback_data=f"admin_view_{key}")
-            buttons.append([button])
-
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+    markup = seasons_page_markup(seasons, page, has_next, "admin_view_", "admin_page:")
     await message.answer("🔧 Mavjud mavsumlar (admin panel):", reply_markup=markup)
 
+# 🔧 /admin_list sahifalari va fasl amallaridan "Orqaga" tugmasi
+@dp.callback_query((F.data == "admin_list") | F.data.startswith("admin_page:"))
+async def admin_list_page(callback: CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer("❌ Ruxsat yo‘q.", show_alert=True)
+        return
+
+    requested = int(callback.data.split(":", 1)[1]) if ":" in callback.data else 0
+    page, seasons, has_next = catalog.index.page(requested)
+    if not seasons:
+        await callback.message.edit_text("❌ Hozircha mavsumlar yo‘q.")
+        await callback.answer()
+        return
+
+    markup = seasons_page_markup(seasons, page, has_next, "admin_view_", "admin_page:")
+    await callback.message.edit_text("🔧 Mavjud mavsumlar (admin panel):", reply_markup=markup)
+    await callback.answer()
+
 # 🔧 Admin uchun: Mavsum ustida amallar (tahrirlash/o'chirish)
 @dp.callback_query(F.data.startswith("admin_view_"))
 async def admin_view_season(callback: CallbackQuery):
     key = callback.data.split("_", 2)[2]
-    data = load_data()
-    season = data.get(key)
+    season = catalog.get(key)
 
     if not season:
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
@@ -370,8 +1164,7 @@ async def edit_season_callback(callback: CallbackQuery, state: FSMContext):
         return
 
     key = callback.data.split("_", 1)[1]
-    data = load_data()
-    season = data.get(key)
+    season = catalog.get(key)
 
     if not season:
         await callback.answer("❌ Bunday fasl topilmadi.", show_alert=True)
@@ -392,15 +1185,13 @@ async def delete_season(callback: CallbackQuery):
         return
 
     key = callback.data.split("_", 1)[1]
-    data = load_data()
-    season = data.get(key)
+    season = catalog.get(key)
 
     if not season:
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
         return
 
-    del data[key]
-    save_data(data)
+    catalog.delete_season(key)
 
     await callback.message.edit_text(f"✅ <b>{season['title']}</b> o‘chirildi.")
     await callback.answer()
@@ -422,21 +1213,11 @@ async def add_channel(message: Message, command: CommandObject):
     channel_id = parts[0]
     channel_name = parts[1] if len(parts) > 1 else channel_id
 
-    data = load_data()
-    if "channels" not in data:
-        data["channels"] = []
-
     # Kanal allaqachon mavjudligini tekshirish
-    if any(chan["id"] == channel_id for chan in data["channels"]):
+    if not catalog.add_channel(channel_id, channel_name):
         await message.answer(f"❗ Kanal {channel_id} allaqachon ro'yxatda bor.")
         return
 
-    data["channels"].append({
-        "id": channel_id,
-        "name": channel_name
-    })
-    save_data(data)
-
     await message.answer(f"✅ Kanal {channel_name} ({channel_id}) ro'yxatga qo'shildi.")
 
 # Kanal o'chirish
@@ -451,18 +1232,11 @@ async def remove_channel(message: Message, command: CommandObject):
         await message.answer("⚠️ Foydalanish: /remove_channel &lt;kanal_id&gt;")
         return
 
-    data = load_data()
-    if "channels" not in data:
-        data["channels"] = []
-
     # Kanalni ro'yxatdan o'chirish
-    original_length = len(data["channels"])
-    data["channels"] = [chan for chan in data["channels"] if chan["id"] != channel_id]
-    
-    if len(data["channels"]) == original_length:
+    if not catalog.remove_channel(channel_id):
         await message.answer(f"❌ Kanal {channel_id} topilmadi.")
     else:
-        save_data(data)
+        member_tracker.forget(channel_id)
         await message.answer(f"✅ Kanal {channel_id} ro'yxatdan o'chirildi.")
 
 # Kanallar ro'yxatini ko'rish
@@ -472,8 +1246,7 @@ async def list_channels(message: Message):
         await message.answer("❌ Ruxsat yo‘q.")
         return
 
-    data = load_data()
-    channels = data.get("channels", [])
+    channels = catalog.channels
 
     if not channels:
         await message.answer("📭 Ro'yxat bo'sh. Hozirda majburiy obuna kanallari yo'q.")
@@ -488,15 +1261,120 @@ async def list_channels(message: Message):
 # Callback tekshiruvini yangilash
 @dp.callback_query(F.data == "check_subscription")
 async def check_subscription_callback(callback: CallbackQuery):
-    if await is_user_subscribed(callback.from_user.id):
+    # "Tekshirish" bosilganda keshga qaramaymiz: foydalanuvchi hozirgina obuna bo'lgan bo'lishi mumkin
+    if await is_user_subscribed(callback.from_user.id, use_cache=False):
         await callback.message.edit_text("✅ Obuna tasdiqlandi! Endi botdan foydalanishingiz mumkin.")
         await callback.answer()
     else:
         await callback.answer("❌ Siz hali barcha kanallarga obuna bo'lmagansiz!", show_alert=True)
 
+# 🔌 /breaker - get_chat_member circuit breaker holati (admin)
+@dp.message(Command("breaker"))
+async def breaker(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    stats = membership_breaker.stats()
+    await message.answer(
+        "🔌 Obuna tekshiruvi (get_chat_member):\n"
+        f"Holat: {stats['state']}, ochilgan: {stats['opens']} marta\n"
+        f"Xatolar: {stats['errors']}, to'xtatilgan so'rovlar: {stats['rejected']}, sinovlar: {stats['probes']}\n"
+        f"Degraded javoblar ({DEGRADED_MODE}): {stats['degraded']}"
+    )
+
+# 🚪 /gate_stats - obuna darvozasi updatelarga qo'shayotgan vaqt (admin)
+@dp.message(Command("gate_stats"))
+async def gate_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    stats = gate_metrics.stats()
+    await message.answer(
+        "🚪 Obuna darvozasi:\n"
+        f"Tekshiruvlar: {stats['checks']} (adminlar: {stats['admins']}, rad etildi: {stats['denied']})\n"
+        f"Qo'shilgan vaqt: o'rtacha {stats['avg'] * 1000:.2f} ms, p95 {stats['p95'] * 1000:.2f} ms, "
+        f"eng ko'p {stats['max'] * 1000:.2f} ms"
+    )
+
+# 👥 Kanalga qo'shilish/chiqish (bot kanalda admin bo'lsa Telegram yuboradi)
+@dp.chat_member()
+async def track_channel_member(update: ChatMemberUpdated):
+    channel_id = match_channel(update.chat, catalog.channels)
+    if channel_id is None:
+        return
+    user_id = update.new_chat_member.user.id
+    is_member = update.new_chat_member.status in MEMBER_STATUSES
+    member_tracker.record(channel_id, user_id, is_member)
+    membership_cache.set(user_id, channel_id, is_member)
+
+# 🧠 /sub_cache - obuna keshi statistikasi (admin)
+@dp.message(Command("sub_cache"))
+async def sub_cache(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    stats = membership_cache.stats()
+    tracked = member_tracker.stats()
+    await message.answer(
+        "🧠 Obuna keshi:\n"
+        f"Topildi: {stats['hits']}, topilmadi: {stats['misses']} ({stats['hit_rate'] * 100:.1f}%)\n"
+        f"Yozuvlar: {stats['size']}\n\n"
+        "👥 A'zolar kuzatuvchisi:\n"
+        f"Kanallar: {tracked['channels']}, yozuvlar: {tracked['entries']}\n"
+        f"Topildi: {tracked['hits']}, noma'lum: {tracked['unknown']}, eskirgan: {tracked['stale']}"
+    )
+
+# 📤 /export - katalogni data.json ga yozish (admin)
+@dp.message(Command("export"))
+async def export(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await catalog.export()
+    await message.answer(f"✅ Katalog {DATA_FILE} fayliga yozildi.")
+
+# 🧯 /dead_letters - yuborib bo'lmagan qismlar (admin)
+@dp.message(Command("dead_letters"))
+async def dead_letters_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.dead_letters.report())
+
+# 🚦 /rate_stats - yuborish navbati statistikasi (admin)
+@dp.message(Command("rate_stats"))
+async def rate_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.report())
+
 # 🚀 Ishga tushirish
 async def main():
+    dp.startup.register(catalog.start)
+    dp.shutdown.register(catalog.stop)
+    dp.startup.register(member_tracker.start)
+    dp.shutdown.register(member_tracker.stop)
+    dp.startup.register(delivery_queue.start)
+    dp.shutdown.register(delivery_queue.stop)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if sys.argv[1:] == ["export"]:
+        asyncio.run(catalog.export())
+    elif len(sys.argv) == 3 and sys.argv[1] == "import":
+        started = time.perf_counter()
+        result = asyncio.run(import_manifest(Path(sys.argv[2])))
+        elapsed = time.perf_counter() - started
+        print(
+            f"✅ Import tugadi: {result['seasons']} yangi fasl, {result['files']} epizod, "
+            f"{elapsed:.1f} s ({result['files'] / max(elapsed, 1e-9):.0f} qator/s)"
+        )
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -1,6 +1,10 @@
 import asyncio
+import bisect
 import json
+import os
+import sys
 from pathlib import Path
+from typing import Dict, List, Any, Callable, Iterable, Optional, Tuple
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
@@ -10,23 +14,205 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
+from delivery import RateLimiter, DeliveryQueue, FileCursorStore, FileDeadLetters
 
 # 🔐 Sozlamalar
 BOT_TOKEN = "BOT_TOKEN"
 ADMINS = [5873723609]  # ← O'zingizning Telegram ID
 
-DATA_FILE = Path("data.json")
-if not DATA_FILE.exists():
-    DATA_FILE.write_text(json.dumps({}))
-
-# 📂 Ma'lumotni o'qish/yozish
-def load_data():
-    with open(DATA_FILE, "r") as f:
-        return json.load(f)
-
-def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+DATA_FILE = Path("data.json")  # /export natijasi: o'qish uchun qulay nusxa
+SNAPSHOT_FILE = Path("data.snapshot.json")
+JOURNAL_FILE = Path("data.journal")
+COMPACT_EVERY = 500  # Shuncha yozuvdan keyin jurnal snapshotga jamlanadi
+PAGE_SIZE = 10  # /list_seasons va /admin_list sahifasidagi fasllar soni
+DEAD_LETTER_FILE = Path("dead_letters.jsonl")  # Qayta urinib bo'lmaydigan yuborish xatolari
+CURSORS_FILE = Path("cursors.jsonl")  # (foydalanuvchi, fasl) bo'yicha yuborilgan qismlar soni
+
+# 📒 Jurnal: har bir o'zgarish bitta qator bo'lib qo'shiladi, vaqti-vaqti bilan snapshot olinadi
+def write_atomic(path: Path, text: str) -> None:
+    """Faylni vaqtinchalik nusxa orqali yozish (uzilishda eski fayl butun qoladi)"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class Journal:
+    """Snapshot + faqat qo'shiladigan jurnal; ishga tushishda jurnal qayta o'ynaladi"""
+
+    def __init__(self, snapshot_file: Path, journal_file: Path):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.seq = 0  # oxirgi yozuv raqami
+        self.records = 0  # snapshotdan keyin jurnalda nechta yozuv bor
+
+    def load_snapshot(self, initial: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Snapshotni o'qish; birinchi ishga tushishda initial() dan snapshot yaratiladi"""
+        if not self.snapshot_file.exists():
+            write_atomic(self.snapshot_file, json.dumps({"seq": 0, "data": initial()}, ensure_ascii=False))
+        snapshot = json.loads(self.snapshot_file.read_text(encoding="utf-8"))
+        self.seq = snapshot["seq"]
+        return snapshot["data"]
+
+    def replay(self, apply: Callable[[Dict[str, Any]], None]) -> None:
+        """Snapshotdan keyingi yozuvlarni qo'llash; yarim yozilgan oxirgi qator tashlanadi"""
+        if not self.journal_file.exists():
+            return
+        good = 0
+        with open(self.journal_file, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    break
+                good += len(raw)
+                if record["seq"] > self.seq:
+                    try:
+                        apply(record)
+                    except KeyError as e:
+                        # Masalan, o'chirilgan faslga fayl: yozuv tashlanadi, bot ishga tushaveradi
+                        print(f"Jurnal yozuvi o'tkazib yuborildi (seq={record['seq']}): {e!r}")
+                    self.seq = record["seq"]
+                    self.records += 1
+        if good < self.journal_file.stat().st_size:
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(good)
+
+    def encode(self, record: Dict[str, Any]) -> str:
+        self.seq += 1
+        return json.dumps({"seq": self.seq, **record}, ensure_ascii=False) + "\n"
+
+    def append(self, lines: List[str]) -> None:
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            start = f.tell()
+            try:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError:
+                # Yarim yozilgan qator keyingi qo'shishni buzmasin
+                f.truncate(start)
+                raise
+        self.records += len(lines)
+
+    def snapshot_payload(self, data: Dict[str, Any]) -> str:
+        return json.dumps({"seq": self.seq, "data": data}, ensure_ascii=False)
+
+    def compact(self, payload: str) -> None:
+        """Snapshotni yangilab, jurnalni bo'shatish"""
+        write_atomic(self.snapshot_file, payload)
+        with open(self.journal_file, "w", encoding="utf-8"):
+            pass
+        self.records = 0
+
+# 📄 Fasllar nom bo'yicha tartiblangan indeksi: ro'yxat sahifalab ko'rsatiladi
+class SeasonIndex:
+    """(nom, kalit) bo'yicha tartiblangan ro'yxat; bitta sahifani olish O(sahifa hajmi)"""
+
+    def __init__(self, titles: Callable[[], Iterable[Tuple[str, str]]]):
+        self._titles = titles  # indeks eskirganda qayta qurish manbai: (kalit, nom) juftliklari
+        self._entries: Optional[List[Tuple[str, str, str]]] = None
+
+    def reset(self) -> None:
+        self._entries = None
+
+    def add(self, season_key: str, title: str) -> None:
+        if self._entries is not None:
+            bisect.insort(self._entries, (title.casefold(), season_key, title))
+
+    def remove(self, season_key: str, title: str) -> None:
+        if self._entries is not None:
+            entry = (title.casefold(), season_key, title)
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+
+    def page(self, number: int, size: int = PAGE_SIZE) -> Tuple[int, List[Tuple[str, str]], bool]:
+        """(sahifa raqami, (kalit, nom) juftliklari, keyingi sahifa bormi); ro'yxat qisqargan bo'lsa 0-sahifa"""
+        if self._entries is None:
+            self._entries = sorted((title.casefold(), key, title) for key, title in self._titles())
+        if number * size >= len(self._entries):
+            number = 0
+        start = number * size
+        chunk = self._entries[start:start + size]
+        return number, [(key, title) for _, key, title in chunk], start + size < len(self._entries)
+
+def apply_record(data: Dict[str, Any], record: Dict[str, Any]) -> None:
+    """Jurnal yozuvini xotiradagi ma'lumotga qo'llash"""
+    op = record["op"]
+    if op == "add_season":
+        data[record["key"]] = {"title": record["title"], "files": []}
+    elif op == "add_file":
+        data[record["key"]]["files"].append(record["file_id"])
+    elif op == "delete_season":
+        data.pop(record["key"], None)
+
+def initial_data() -> Dict[str, Any]:
+    # Eski data.json bo'lsa, katalog undan boshlanadi
+    if DATA_FILE.exists():
+        return json.loads(DATA_FILE.read_text())
+    return {}
+
+journal = Journal(SNAPSHOT_FILE, JOURNAL_FILE)
+catalog_data = journal.load_snapshot(initial_data)
+journal.replay(lambda record: apply_record(catalog_data, record))
+season_index = SeasonIndex(lambda: ((key, season["title"]) for key, season in catalog_data.items()))
+
+def load_data() -> Dict[str, Any]:
+    return catalog_data
+
+# Katalog faqat shu qulf ostida o'zgaradi: yozuvlar seq tartibida tushadi, snapshot esa izchil bo'ladi
+journal_lock = asyncio.Lock()
+
+async def save_record(record: Dict[str, Any]) -> bool:
+    """O'zgarishni tekshirib, jurnalga bitta qator qilib yozib, keyin xotiraga qo'llash"""
+    async with journal_lock:
+        if record["op"] == "add_file" and record["key"] not in catalog_data:
+            return False
+        line = journal.encode(record)
+        try:
+            await asyncio.to_thread(journal.append, [line])
+        except Exception:
+            journal.seq -= 1  # yozuv diskka tushmadi, seq da bo'shliq qolmasin
+            raise
+        apply_to_catalog(record)
+        if journal.records >= COMPACT_EVERY:
+            await asyncio.to_thread(compact_catalog)
+    return True
+
+def compact_catalog() -> None:
+    journal.compact(journal.snapshot_payload(catalog_data))
+
+def apply_to_catalog(record: Dict[str, Any]) -> None:
+    previous = catalog_data.get(record["key"])
+    if previous is not None and record["op"] in ("add_season", "delete_season"):
+        season_index.remove(record["key"], previous["title"])
+    apply_record(catalog_data, record)
+    if record["op"] == "add_season":
+        season_index.add(record["key"], record["title"])
+
+async def export_data() -> None:
+    """Katalogni o'qish uchun qulay data.json ko'rinishida yozish (disk ishi alohida oqimda)"""
+    async with journal_lock:
+        await asyncio.to_thread(write_export)
+
+def write_export() -> None:
+    write_atomic(DATA_FILE, json.dumps(catalog_data, indent=2))
+
+# 📄 Sahifa tugmalari: har bir fasl alohida qatorda, pastda oldingi/keyingi
+def seasons_page_markup(seasons: List[Tuple[str, str]], page: int, has_next: bool, item_prefix: str, page_prefix: str) -> InlineKeyboardMarkup:
+    buttons = [[InlineKeyboardButton(text=title, callback_data=f"{item_prefix}{key}")] for key, title in seasons]
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="⬅️ Oldingi", callback_data=f"{page_prefix}{page - 1}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Keyingi ➡️", callback_data=f"{page_prefix}{page + 1}"))
+    if nav:
+        buttons.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # 🤖 Bot va Dispatcher
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
@@ -39,6 +225,9 @@ class AddSeason(StatesGroup):
 class EditSeason(StatesGroup):
     editing_files = State()
 
+# 📬 Fasl yuborish navbati (tezlik cheklovi, kursorlar va dead letterlar delivery.py da)
+delivery_queue = DeliveryQueue(RateLimiter(), FileDeadLetters(DEAD_LETTER_FILE), FileCursorStore(CURSORS_FILE))
+
 # 🔘 /start (yoki start link bilan)
 @dp.message(CommandStart(deep_link=True))
 async def start_with_param(message: Message, command: CommandObject):
@@ -49,10 +238,13 @@ async def start_with_param(message: Message, command: CommandObject):
         await message.answer("❌ Bunday fasl topilmadi.")
         return
 
-    await message.answer(f"🎬 <b>{season['title']}</b>\nYuklanmoqda...")
-    for file_id in season["files"]:
-        await message.answer_video(file_id)
-        await asyncio.sleep(1)
+    episodes = [(file_id, f"{number}-qism") for number, file_id in enumerate(season["files"], 1)]
+    # Havola har doim faslni boshidan ochadi; to'xtagan joydan davom etish - "Davom ettirish"/"Keyingi" tugmalarida
+    status = await delivery_queue.submit(message.from_user.id, message, season_key, season['title'], episodes, resume=False)
+    if status == "attached":
+        await message.answer("⏳ Bu fasl allaqachon yuborilmoqda, yuqoridagi xabarda jarayonni kuzating.")
+    elif status == "busy":
+        await message.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.")
 
 @dp.message(CommandStart())
 async def start(message: Message):
@@ -77,11 +269,7 @@ async def add_season(message: Message, command: CommandObject, state: FSMContext
         await message.answer("❗ Bu fasl allaqachon mavjud.")
         return
 
-    data[key] = {
-        "title": season_name.replace("_", " "),
-        "files": []
-    }
-    save_data(data)
+    await save_record({"op": "add_season", "key": key, "title": season_name.replace("_", " ")})
 
     await state.set_state(AddSeason.waiting_files)
     await state.update_data(season_key=key)
@@ -121,9 +309,10 @@ async def handle_video(message: Message, state: FSMContext):
     state_data = await state.get_data()
     key = state_data["season_key"]
 
-    data = load_data()
-    data[key]["files"].append(file_id)
-    save_data(data)
+    if not await save_record({"op": "add_file", "key": key, "file_id": file_id}):
+        await state.clear()
+        await message.answer("❌ Bu fasl o‘chirilgan. Jarayon to‘xtatildi.")
+        return
 
     await message.answer("✅ Qo‘shildi")
 
@@ -136,19 +325,26 @@ async def done_adding_editing(message: Message, state: FSMContext):
 # 🔘 /list_seasons - Barcha mavsumlarni inline tugmalar bilan ko'rsatadi
 @dp.message(Command("list_seasons"))
 async def list_seasons(message: Message):
-    data = load_data()
-    if not data:
+    page, seasons, has_next = season_index.page(0)
+    if not seasons:
         await message.answer("❌ Hozircha mavsumlar yo‘q.")
         return
 
-    buttons = []
-    for key, season in data.items():
-        button = InlineKeyboardButton(text=season["title"], callback_data=f"view_{key}")
-        buttons.append([button])  # Har bir tugmani alohida qatorga joylashtiramiz
-
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+    markup = seasons_page_markup(seasons, page, has_next, "view_", "list_page:")
     await message.answer("🎬 Mavjud mavsumlar:", reply_markup=markup)
 
+# 📄 /list_seasons sahifalari (oldingi/keyingi)
+@dp.callback_query(F.data.startswith("list_page:"))
+async def list_seasons_page(callback: CallbackQuery):
+    page, seasons, has_next = season_index.page(int(callback.data.split(":", 1)[1]))
+    if not seasons:
+        await callback.answer("❌ Hozircha mavsumlar yo‘q.", show_alert=True)
+        return
+
+    markup = seasons_page_markup(seasons, page, has_next, "view_", "list_page:")
+    await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
 # 🎬 Faslni ko'rish (callback orqali)
 @dp.callback_query(F.data.startswith("view_"))
 async def view_season(callback: CallbackQuery):
@@ -160,12 +356,14 @@ async def view_season(callback: CallbackQuery):
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
         return
 
-    await callback.message.answer(f"🎬 <b>{season['title']}</b>\nYuklanmoqda...")
-    for file_id in season["files"]:
-        await callback.message.answer_video(file_id)
-        await asyncio.sleep(1)
-
-    await callback.answer()
+    episodes = [(file_id, f"{number}-qism") for number, file_id in enumerate(season["files"], 1)]
+    status = await delivery_queue.submit(callback.from_user.id, callback.message, key, season['title'], episodes)
+    if status == "queued":
+        await callback.answer()
+    elif status == "attached":
+        await callback.answer("⏳ Bu fasl allaqachon yuborilmoqda.")
+    else:
+        await callback.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.", show_alert=True)
 
 # 🔐 /admin_list - Faqat admin uchun mavsumlar ro'yxati (tahrirlash/o'chirish bilan)
 @dp.message(Command("admin_list"))
@@ -174,19 +372,32 @@ async def admin_list_seasons(message: Message):
         await message.answer("❌ Ruxsat yo‘q.")
         return
 
-    data = load_data()
-    if not data:
+    page, seasons, has_next = season_index.page(0)
+    if not seasons:
         await message.answer("❌ Hozircha mavsumlar yo‘q.")
         return
 
-    buttons = []
-    for key, season in data.items():
-        button = InlineKeyboardButton(text=season["title"], callback_data=f"admin_view_{key}")
-        buttons.append([button])
-
-    markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+    markup = seasons_page_markup(seasons, page, has_next, "admin_view_", "admin_page:")
     await message.answer("🔧 Mavjud mavsumlar (admin panel):", reply_markup=markup)
 
+# 🔧 /admin_list sahifalari va fasl amallaridan "Orqaga" tugmasi
+@dp.callback_query((F.data == "admin_list") | F.data.startswith("admin_page:"))
+async def admin_list_page(callback: CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        await callback.answer("❌ Ruxsat yo‘q.", show_alert=True)
+        return
+
+    requested = int(callback.data.split(":", 1)[1]) if ":" in callback.data else 0
+    page, seasons, has_next = season_index.page(requested)
+    if not seasons:
+        await callback.message.edit_text("❌ Hozircha mavsumlar yo‘q.")
+        await callback.answer()
+        return
+
+    markup = seasons_page_markup(seasons, page, has_next, "admin_view_", "admin_page:")
+    await callback.message.edit_text("🔧 Mavjud mavsumlar (admin panel):", reply_markup=markup)
+    await callback.answer()
+
 # 🔧 Admin uchun: Mavsum ustida amallar (tahrirlash/o'chirish)
 @dp.callback_query(F.data.startswith("admin_view_"))
 async def admin_view_season(callback: CallbackQuery):
@@ -249,15 +460,47 @@ async def delete_season(callback: CallbackQuery):
         await callback.answer("❌ Fasl topilmadi.", show_alert=True)
         return
 
-    del data[key]
-    save_data(data)
+    await save_record({"op": "delete_season", "key": key})
 
     await callback.message.edit_text(f"✅ <b>{season['title']}</b> o‘chirildi.")
     await callback.answer()
 
+# 📤 /export - katalogni data.json ga yozish (admin)
+@dp.message(Command("export"))
+async def export(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await export_data()
+    await message.answer(f"✅ Katalog {DATA_FILE} fayliga yozildi.")
+
+# 🧯 /dead_letters - yuborib bo'lmagan qismlar (admin)
+@dp.message(Command("dead_letters"))
+async def dead_letters_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.dead_letters.report())
+
+# 🚦 /rate_stats - yuborish navbati statistikasi (admin)
+@dp.message(Command("rate_stats"))
+async def rate_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.report())
+
 # 🚀 Ishga tushirish
 async def main():
+    dp.startup.register(delivery_queue.start)
+    dp.shutdown.register(delivery_queue.stop)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if sys.argv[1:] == ["export"]:
+        asyncio.run(export_data())
+    else:
+        asyncio.run(main())
\ No newline at end of file
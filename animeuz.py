@@ -1,32 +1,191 @@
 import asyncio
 import json
+import os
+import sys
 from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+from collections import OrderedDict
+from urllib.parse import quote
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery
 from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandStart, CommandObject, StateFilter
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
+from delivery import RateLimiter, DeliveryQueue, FileCursorStore, FileDeadLetters
 
 # 🔐 Sozlamalar
 BOT_TOKEN = "BOT_TOKEN"
 ADMINS = [5873723609]  # ← O'zingizning Telegram ID
 
-DATA_FILE = Path("data.json")
-if not DATA_FILE.exists():
-    DATA_FILE.write_text(json.dumps({}))
+DATA_FILE = Path("data.json")  # /export natijasi: o'qish uchun qulay nusxa
+DATA_DIR = Path("data")  # data/manifest.json + data/seasons/<kalit>.jsonl
+SEASON_CACHE_SIZE = 64  # Xotirada ushlab turiladigan fasllar soni
+DEAD_LETTER_FILE = Path("dead_letters.jsonl")  # Qayta urinib bo'lmaydigan yuborish xatolari
+CURSORS_FILE = Path("cursors.jsonl")  # (foydalanuvchi, fasl) bo'yicha yuborilgan qismlar soni
 
-# 📂 Ma'lumotni o'qish/yozish
-def load_data():
-    with open(DATA_FILE, "r") as f:
-        return json.load(f)
+# Oldingi saqlash formati (bir marta ko'chiriladi)
+LEGACY_SNAPSHOT_FILE = Path("data.snapshot.json")
+LEGACY_JOURNAL_FILE = Path("data.journal")
 
-def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+def write_atomic(path: Path, text: str) -> None:
+    """Faylni vaqtinchalik nusxa orqali yozish (uzilishda eski fayl butun qoladi)"""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def legacy_data() -> Dict[str, Any]:
+    """Eski snapshot+jurnal yoki data.json dan butun katalogni o'qish"""
+    if LEGACY_SNAPSHOT_FILE.exists():
+        snapshot = json.loads(LEGACY_SNAPSHOT_FILE.read_text(encoding="utf-8"))
+        data = snapshot["data"]
+        if LEGACY_JOURNAL_FILE.exists():
+            with open(LEGACY_JOURNAL_FILE, "rb") as f:
+                for raw in f:
+                    try:
+                        record = json.loads(raw)
+                    except ValueError:
+                        break
+                    if record["seq"] <= snapshot["seq"]:
+                        continue
+                    if record["op"] == "add_season":
+                        data[record["key"]] = {"title": record["title"], "files": []}
+                    elif record["op"] == "add_file":
+                        data[record["key"]]["files"].append(record["file_id"])
+        return data
+    if DATA_FILE.exists():
+        return json.loads(DATA_FILE.read_text())
+    return {}
+
+# 🗃️ Har bir fasl alohida faylda: ochilganda faqat shu fasl o'qiladi
+class SeasonStore:
+    """Fasllar nomlari manifestda, fayllari esa alohida shard fayllarda saqlanadi"""
+
+    def __init__(self, root: Path, cache_size: int = SEASON_CACHE_SIZE):
+        self.manifest_file = root / "manifest.json"
+        self.seasons_dir = root / "seasons"
+        self.cache_size = cache_size
+        self.titles: Dict[str, str] = {}
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._write_lock = asyncio.Lock()  # shard va manifestga yozishlar navbat bilan
+        self._repaired: set = set()  # uzilgan oxirgi qatori tozalangan shardlar (faqat _write_lock ostida)
+
+        self.seasons_dir.mkdir(parents=True, exist_ok=True)
+        if not self.manifest_file.exists():
+            self._migrate(legacy_data())
+        self.titles = json.loads(self.manifest_file.read_text(encoding="utf-8"))
+
+    def _shard(self, season_key: str) -> Path:
+        return self.seasons_dir / (quote(season_key, safe="") + ".jsonl")
+
+    def _migrate(self, data: Dict[str, Any]) -> None:
+        # Manifest oxirida yoziladi: u mavjud bo'lsa, ko'chirish tugagan
+        for key, season in data.items():
+            lines = "".join(json.dumps(file_id) + "\n" for file_id in season["files"])
+            write_atomic(self._shard(key), lines)
+        titles = {key: season["title"] for key, season in data.items()}
+        write_atomic(self.manifest_file, json.dumps(titles, ensure_ascii=False))
+
+    def _read_shard(self, season_key: str, repair: bool = False) -> List[str]:
+        """Shard qatorlarini o'qish; yarim yozilgan oxirgi qator e'tiborsiz qoldiriladi, repair=True da kesiladi.
+        Kesish faqat _write_lock ostida: aks holda hozir qo'shilayotgan qator ham yarim ko'rinib, o'chib ketishi mumkin"""
+        path = self._shard(season_key)
+        files: List[str] = []
+        if not path.exists():
+            return files
+        good = 0
+        with open(path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # yozish paytida uzilgan qator
+                try:
+                    files.append(json.loads(raw))
+                except ValueError:
+                    break
+                good += len(raw)
+        if repair and good < path.stat().st_size:
+            with open(path, "r+b") as f:
+                f.truncate(good)
+        return files
+
+    def __contains__(self, season_key: str) -> bool:
+        return season_key in self.titles
+
+    async def get(self, season_key: str) -> Optional[Dict[str, Any]]:
+        """Faslni olish: birinchi murojaatda diskdan (alohida oqimda) o'qiladi, keyin keshdan"""
+        if season_key not in self.titles:
+            return None
+        season = self._cache.get(season_key)
+        if season is not None:
+            self._cache.move_to_end(season_key)
+            return season
+        files = await asyncio.to_thread(self._read_shard, season_key)
+        if season_key not in self.titles:
+            return None  # o'qish paytida fasl o'chirilgan
+        season = self._cache.get(season_key)
+        if season is not None:
+            return season  # parallel so'rov shardni bizdan oldin o'qib bo'ldi
+        season = {"title": self.titles[season_key], "files": files}
+        self._cache[season_key] = season
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return season
+
+    async def add_season(self, season_key: str, title: str) -> None:
+        async with self._write_lock:
+            await asyncio.to_thread(write_atomic, self._shard(season_key), "")
+            self._repaired.add(season_key)
+            self.titles[season_key] = title
+            manifest = json.dumps(self.titles, ensure_ascii=False)
+            await asyncio.to_thread(write_atomic, self.manifest_file, manifest)
+
+    async def add_file(self, season_key: str, file_id: str) -> None:
+        """Faylni shard oxiriga bitta qator qilib qo'shish"""
+        async with self._write_lock:
+            season = await self.get(season_key)
+            if season_key not in self._repaired:
+                # Yangi qator uzilgan qator davomiga yopishmasin: birinchi qo'shishdan oldin shard tozalanadi
+                await asyncio.to_thread(self._read_shard, season_key, True)
+                self._repaired.add(season_key)
+            await asyncio.to_thread(self._append, season_key, json.dumps(file_id) + "\n")
+            season["files"].append(file_id)
+
+    def _append(self, season_key: str, line: str) -> None:
+        with open(self._shard(season_key), "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def iter_seasons(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Barcha fasllarni keshni to'ldirmasdan birma-bir o'qish (alohida oqimdan ham chaqiriladi)"""
+        for key, title in list(self.titles.items()):
+            cached = self._cache.get(key)
+            files = list(cached["files"]) if cached is not None else self._read_shard(key)
+            yield key, {"title": title, "files": files}
+
+store = SeasonStore(DATA_DIR)
+
+async def export_data() -> None:
+    """Katalogni data.json ga alohida oqimda yozish: katta katalog event loopni to'xtatmaydi"""
+    await asyncio.to_thread(write_export)
+
+def write_export() -> None:
+    """Katalogni o'qish uchun qulay data.json ko'rinishida yozish (fasllar birma-bir)"""
+    tmp = DATA_FILE.with_name(DATA_FILE.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("{")
+        for i, (key, season) in enumerate(store.iter_seasons()):
+            f.write(("," if i else "") + "\n  " + json.dumps(key) + ": " + json.dumps(season))
+        f.write("\n}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, DATA_FILE)
 
 # 🤖 Bot va Dispatcher
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
@@ -39,25 +198,49 @@ class AddSeason(StatesGroup):
 class EditSeason(StatesGroup):
     editing_files = State()
 
+# 📬 Fasl yuborish navbati (tezlik cheklovi, kursorlar va dead letterlar delivery.py da)
+delivery_queue = DeliveryQueue(RateLimiter(), FileDeadLetters(DEAD_LETTER_FILE), FileCursorStore(CURSORS_FILE))
+
 # 🔘 /start (yoki start link bilan)
 @dp.message(CommandStart(deep_link=True))
 async def start_with_param(message: Message, command: CommandObject):
     season_key = command.args
-    data = load_data()
-    season = data.get(season_key)
+    season = await store.get(season_key)
     if not season:
         await message.answer("❌ Bunday fasl topilmadi.")
         return
 
-    await message.answer(f"🎬 <b>{season['title']}</b>\nYuklanmoqda...")
-    for file_id in season["files"]:
-        await message.answer_video(file_id)
-        await asyncio.sleep(1)
+    episodes = [(file_id, f"{number}-qism") for number, file_id in enumerate(season["files"], 1)]
+    # Havola har doim faslni boshidan ochadi; to'xtagan joydan davom etish - "Davom ettirish"/"Keyingi" tugmalarida
+    status = await delivery_queue.submit(message.from_user.id, message, season_key, season['title'], episodes, resume=False)
+    if status == "attached":
+        await message.answer("⏳ Bu fasl allaqachon yuborilmoqda, yuqoridagi xabarda jarayonni kuzating.")
+    elif status == "busy":
+        await message.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.")
 
 @dp.message(CommandStart())
 async def start(message: Message):
     await message.answer("👋 Anime yuklovchi botga xush kelibsiz!")
 
+# 🎬 Faslni ko'rish ("Keyingi" / "Davom ettirish" tugmalari)
+@dp.callback_query(F.data.startswith("view_"))
+async def view_season(callback: CallbackQuery):
+    key = callback.data.split("_", 1)[1]
+    season = await store.get(key)
+
+    if not season:
+        await callback.answer("❌ Fasl topilmadi.", show_alert=True)
+        return
+
+    episodes = [(file_id, f"{number}-qism") for number, file_id in enumerate(season["files"], 1)]
+    status = await delivery_queue.submit(callback.from_user.id, callback.message, key, season['title'], episodes)
+    if status == "queued":
+        await callback.answer()
+    elif status == "attached":
+        await callback.answer("⏳ Bu fasl allaqachon yuborilmoqda.")
+    else:
+        await callback.answer("⏳ Oldingi so'rovingiz hali yuborilmoqda, biroz kuting.", show_alert=True)
+
 # 🔘 /add_season <nom>
 @dp.message(Command("add_season"))
 async def add_season(message: Message, command: CommandObject, state: FSMContext):
@@ -72,16 +255,11 @@ async def add_season(message: Message, command: CommandObject, state: FSMContext
 
     season_name = season_name.replace(" ", "_")
     key = f"season_{season_name}"
-    data = load_data()
-    if key in data:
+    if key in store:
         await message.answer("❗ Bu fasl allaqachon mavjud.")
         return
 
-    data[key] = {
-        "title": season_name.replace("_", " "),
-        "files": []
-    }
-    save_data(data)
+    await store.add_season(key, season_name.replace("_", " "))
 
     await state.set_state(AddSeason.waiting_files)
     await state.update_data(season_key=key)
@@ -104,8 +282,7 @@ async def edit_season(message: Message, command: CommandObject, state: FSMContex
     season_name = season_name.replace(" ", "_")
     key = f"season_{season_name}"
 
-    data = load_data()
-    if key not in data:
+    if key not in store:
         await message.answer("❌ Bunday fasl topilmadi.")
         return
 
@@ -120,9 +297,7 @@ async def handle_video(message: Message, state: FSMContext):
     state_data = await state.get_data()
     key = state_data["season_key"]
 
-    data = load_data()
-    data[key]["files"].append(file_id)
-    save_data(data)
+    await store.add_file(key, file_id)
 
     await message.answer("✅ Qo‘shildi")
 
@@ -132,9 +307,42 @@ async def done_adding_editing(message: Message, state: FSMContext):
     await state.clear()
     await message.answer("✅ Jarayon tugadi. Endi linkni ulashishingiz mumkin.")
 
+# 📤 /export - katalogni data.json ga yozish (admin)
+@dp.message(Command("export"))
+async def export(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await export_data()
+    await message.answer(f"✅ Katalog {DATA_FILE} fayliga yozildi.")
+
+# 🧯 /dead_letters - yuborib bo'lmagan qismlar (admin)
+@dp.message(Command("dead_letters"))
+async def dead_letters_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.dead_letters.report())
+
+# 🚦 /rate_stats - yuborish navbati statistikasi (admin)
+@dp.message(Command("rate_stats"))
+async def rate_stats(message: Message):
+    if message.from_user.id not in ADMINS:
+        await message.answer("❌ Ruxsat yo‘q.")
+        return
+
+    await message.answer(delivery_queue.report())
+
 # 🚀 Ishga tushirish
 async def main():
+    dp.startup.register(delivery_queue.start)
+    dp.shutdown.register(delivery_queue.stop)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if sys.argv[1:] == ["export"]:
+        asyncio.run(export_data())
+    else:
+        asyncio.run(main())
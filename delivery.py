@@ -0,0 +1,509 @@
+"""Fasllarni yuborish (barcha botlar uchun umumiy): tezlik cheklovi, fon navbati, davom ettirish kursori, dead letter"""
+import asyncio
+import json
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaVideo
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+# 🔐 Sozlamalar
+ALBUM_SIZE = 10  # Bitta albomdagi videolar soni (Telegram chegarasi - 10)
+CHAT_RATE = 1.0  # Bitta chatga soniyasiga xabarlar, albomdagi har bir video alohida (Telegram chegarasi ~1)
+CHAT_BURST = 3  # Bitta chatga ketma-ket kutmasdan yuborish mumkin bo'lgan xabarlar
+GLOBAL_RATE = 25.0  # Butun bot uchun soniyasiga xabarlar, albomdagi har bir video alohida (Telegram chegarasi ~30)
+CHAT_BUCKETS = 10_000  # Xotirada saqlanadigan chat bucketlari (LRU)
+RETRY_AFTER_ATTEMPTS = 3  # TelegramRetryAfter dan keyin qayta urinishlar soni
+DELIVERY_WORKERS = 4  # Fasllarni fon rejimida yuboradigan ishchilar soni
+USER_ACTIVE_JOBS = 1  # Bitta foydalanuvchining navbatdagi va yuborilayotgan fasllari (1 - epizodlar aralashmaydi)
+CHUNK_EPISODES = 10  # Bitta so'rovda yuboriladigan qismlar; qolganlari "Keyingi" tugmasi bilan
+CURSOR_FLUSH_INTERVAL = 2.0  # Foydalanuvchi qayerda to'xtaganini saqlash oralig'i (soniya)
+SEND_ATTEMPTS = 4  # Tarmoq/5xx xatosida bitta yuborish uchun jami urinishlar
+BACKOFF_BASE = 1.0  # Qayta urinishlar orasidagi kutish: BACKOFF_BASE * 2^urinish (jitter bilan)
+BACKOFF_MAX = 30.0  # Bitta kutishning yuqori chegarasi (soniya)
+DEAD_LETTER_RECENT = 50  # /dead_letters da ko'rsatish uchun xotirada turadigan oxirgi yozuvlar
+
+def append_text(path: Path, text: str) -> None:
+    """Fayl oxiriga qo'shib, diskka tushishini kutish"""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+# 🚦 Yuborish tezligi: global va har bir chat uchun token bucket (qat'iy sleep(1) o'rniga)
+class TokenBucket:
+    """Soniyasiga rate token, capacity tagacha yig'iladi; paused_until gacha token berilmaydi"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def wait_time(self, now: float, cost: float = 1.0) -> float:
+        """cost ta token uchun kutish kerak bo'lgan vaqt (0 - hozir bor)"""
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < cost:
+            wait = max(wait, (cost - self.tokens) / self.rate)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """To'xtash tugagach bitta token bilan qayta boshlanadi (yig'ilgan tokenlar bilan sakramaydi)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 1.0
+        self.updated = self.paused_until
+
+class RateLimiter:
+    """Har bir yuborish avval chat va global bucketdan xabarlar soniga teng token oladi; RetryAfter shu chat bucketini to'xtatadi"""
+
+    def __init__(self, chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST,
+                 global_rate: float = GLOBAL_RATE, max_chats: int = CHAT_BUCKETS, window: int = 1000):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chats: OrderedDict = OrderedDict()  # chat_id -> TokenBucket
+        self.waits: deque = deque(maxlen=window)
+        self.sends = 0
+        self.retry_afters = 0
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chats.get(chat_id)
+        if bucket is None:
+            bucket = self.chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            while len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+        self.chats.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id: int, cost: int = 1) -> float:
+        """Ikkala bucketdan cost ta (albomdagi xabarlar) token olish; navbatda kutilgan vaqt qaytadi.
+        Albom capacity dan katta bo'lsa, to'lgan bucket bilan yuborilib, ortig'i qarz bo'lib qoladi:
+        keyingi yuborish qarz qoplanguncha kutadi, shuning uchun o'rtacha tezlik rate dan oshmaydi"""
+        started = time.monotonic()
+        bucket = self._bucket(chat_id)
+        while True:
+            now = time.monotonic()
+            wait = max(bucket.wait_time(now, min(cost, bucket.capacity)),
+                       self.global_bucket.wait_time(now, min(cost, self.global_bucket.capacity)))
+            if wait <= 0:
+                bucket.tokens -= cost
+                self.global_bucket.tokens -= cost
+                break
+            await asyncio.sleep(wait)
+        waited = time.monotonic() - started
+        self.waits.append(waited)
+        return waited
+
+    async def send(self, chat_id: int, call: Callable[[], Awaitable[Any]], cost: int = 1) -> Any:
+        """call() ni limit ichida bajarish; TelegramRetryAfter da bucket to'xtatilib, qayta uriniladi"""
+        for attempt in range(RETRY_AFTER_ATTEMPTS + 1):
+            await self.acquire(chat_id, cost)
+            try:
+                result = await call()
+            except TelegramRetryAfter as e:
+                self.retry_afters += 1
+                if attempt == RETRY_AFTER_ATTEMPTS:
+                    raise
+                self._bucket(chat_id).pause(e.retry_after)
+                continue
+            self.sends += 1
+            return result
+
+    def stats(self) -> Dict[str, float]:
+        ordered = sorted(self.waits)
+        return {
+            "sends": self.sends,
+            "retry_afters": self.retry_afters,
+            "chats": len(self.chats),
+            "wait_avg": sum(ordered) / len(ordered) if ordered else 0.0,
+            "wait_p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0,
+            "wait_max": ordered[-1] if ordered else 0.0
+        }
+
+# 🔖 Foydalanuvchi faslning qayerida to'xtaganini eslab qolish: qayta so'rovda o'sha joydan davom etadi
+class CursorStore:
+    """(foydalanuvchi, fasl) -> yuborilgan qismlar soni xotirada; o'zgarishlar fon rejimida _write() orqali saqlanadi"""
+
+    def __init__(self, flush_interval: float = CURSOR_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.positions: Dict[Tuple[int, str], int] = {}
+        self._dirty: Dict[Tuple[int, str], int] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def load(self) -> None:
+        """Saqlangan kursorlarni o'qish (ishga tushishda bir marta)"""
+
+    async def _write(self, dirty: Dict[Tuple[int, str], int]) -> None:
+        raise NotImplementedError
+
+    def resume(self, user_id: int, season_key: str, total: int) -> int:
+        """Davom etish joyi; fasl oxirigacha yuborilgan bo'lsa boshidan"""
+        position = self.positions.get((user_id, season_key), 0)
+        return position if position < total else 0
+
+    def set(self, user_id: int, season_key: str, position: int) -> None:
+        self.positions[(user_id, season_key)] = position
+        self._dirty[(user_id, season_key)] = position
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            await self._write(dirty)
+        except Exception:
+            self._dirty = {**dirty, **self._dirty}  # keyingi urinishda qayta yoziladi
+            raise
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Xato: cursorlarni saqlab bo'lmadi: {e}")
+
+    async def start(self) -> None:
+        await self.load()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+class FileCursorStore(CursorStore):
+    """Kursorlar cursors.jsonl ga qator qilib qo'shiladi; ishga tushishda oxirgi qiymatlar olinadi"""
+
+    def __init__(self, path: Path, flush_interval: float = CURSOR_FLUSH_INTERVAL):
+        super().__init__(flush_interval)
+        self.path = path
+
+    async def load(self) -> None:
+        await asyncio.to_thread(self._load)
+
+    def _load(self) -> None:
+        """Faylni qayta o'qish; yarim yozilgan qatorlar tashlanadi, fayl haddan oshsa jamlanadi"""
+        if not self.path.exists():
+            return
+        lines = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                lines += 1
+                self.positions[(record["u"], record["s"])] = record["p"]
+        if lines > 2 * len(self.positions) + 1000:
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.unlink(missing_ok=True)
+            append_text(tmp, self._encode(self.positions))
+            os.replace(tmp, self.path)
+
+    @staticmethod
+    def _encode(positions: Dict[Tuple[int, str], int]) -> str:
+        return "".join(
+            json.dumps({"u": user_id, "s": season_key, "p": position}, ensure_ascii=False) + "\n"
+            for (user_id, season_key), position in positions.items()
+        )
+
+    async def _write(self, dirty: Dict[Tuple[int, str], int]) -> None:
+        await asyncio.to_thread(append_text, self.path, self._encode(dirty))
+
+# 🧯 Yuborish xatolari: vaqtinchalik (tarmoq, 5xx) - qayta urinamiz; doimiy (bloklangan, yaroqsiz fayl) - dead letter
+# Faylning o'zi yaroqsizligini bildiradigan Telegram xato matnlari (kichik harflarda); boshqa BadRequest lar
+# (masalan, chat topilmadi yoki izoh juda uzun) fayl uchun doimiy belgi qo'ymaydi
+BAD_FILE_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "wrong padding in the string",
+    "file is too big",
+    "can't use file of type",
+    "type of file mismatch",
+    "failed to get http url content",
+    "wrong type of the web page content",
+)
+
+def classify_send_error(error: Exception) -> str:
+    """retry_after | transient | forbidden | bad_file | bad_request | other"""
+    if isinstance(error, TelegramRetryAfter):
+        return "retry_after"
+    if isinstance(error, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError)):
+        return "transient"
+    if isinstance(error, TelegramForbiddenError):
+        return "forbidden"
+    if isinstance(error, TelegramBadRequest):
+        text = error.message.lower()
+        return "bad_file" if any(marker in text for marker in BAD_FILE_ERRORS) else "bad_request"
+    return "other"
+
+class DeadLetters:
+    """Doimiy xato bilan yuborilmagan (foydalanuvchi, file_id) juftliklari; har bir yozuv _write() orqali saqlanadi"""
+
+    def __init__(self, recent: int = DEAD_LETTER_RECENT):
+        self.recent: deque = deque(maxlen=recent)
+        self.bad_files: set = set()  # yaroqsiz file_id lar keyingi yuborishlarda o'tkazib yuboriladi
+        self.counts: Dict[str, int] = {}
+        self.retries = 0
+
+    async def load(self) -> None:
+        """Oxirgi yozuvlar va yaroqsiz file_id larni o'qish (ishga tushishda bir marta)"""
+
+    async def _write(self, entry: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def record(self, user_id: int, file_id: str, error: Exception) -> None:
+        reason = classify_send_error(error)
+        entry = {"ts": int(time.time()), "user_id": user_id, "file_id": file_id, "reason": reason, "error": str(error)[:200]}
+        self.recent.append(entry)
+        self.counts[reason] = self.counts.get(reason, 0) + 1
+        if reason == "bad_file":
+            self.bad_files.add(file_id)
+        try:
+            await self._write(entry)
+        except Exception as e:
+            print(f"Xato: dead letter yozilmadi: {e}")
+
+    def report(self) -> str:
+        """/dead_letters javobi"""
+        counts = ", ".join(f"{reason}: {count}" for reason, count in sorted(self.counts.items())) or "yo'q"
+        lines = [
+            "🧯 Yuborish xatolari:",
+            f"Qayta urinishlar (tarmoq/5xx): {self.retries}",
+            f"Dead letter (ishga tushgandan beri): {counts}",
+            f"Yaroqsiz file_id lar: {len(self.bad_files)}"
+        ]
+        for entry in list(self.recent)[-10:]:
+            lines.append(f"• {entry['user_id']} | {entry['reason']} | <code>{entry['file_id']}</code>")
+        return "\n".join(lines)
+
+class FileDeadLetters(DeadLetters):
+    """Dead letter yozuvlari dead_letters.jsonl ga qo'shiladi"""
+
+    def __init__(self, path: Path, recent: int = DEAD_LETTER_RECENT):
+        super().__init__(recent)
+        self.path = path
+
+    async def load(self) -> None:
+        await asyncio.to_thread(self._load)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.recent.append(entry)
+                if entry["reason"] == "bad_file":
+                    self.bad_files.add(entry["file_id"])
+
+    async def _write(self, entry: Dict[str, Any]) -> None:
+        await asyncio.to_thread(append_text, self.path, json.dumps(entry, ensure_ascii=False) + "\n")
+
+def continue_markup(season_key: str, text: str) -> InlineKeyboardMarkup:
+    """Faslni to'xtagan joyidan davom ettiruvchi tugma"""
+    return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=text, callback_data=f"view_{season_key}")]])
+
+# 📬 Fasl yuborish navbati: handler darhol qaytadi, yuborishni fon ishchilari bajaradi
+class DeliveryQueue:
+    """Ishlar navbati va ishchilar havzasi; bitta foydalanuvchi bir vaqtda per_user tagacha ish qo'ya oladi"""
+
+    def __init__(self, rate_limiter: RateLimiter, dead_letters: DeadLetters, cursors: CursorStore,
+                 workers: int = DELIVERY_WORKERS, per_user: int = USER_ACTIVE_JOBS):
+        self.rate_limiter = rate_limiter
+        self.dead_letters = dead_letters
+        self.cursors = cursors
+        self.workers = workers
+        self.per_user = per_user
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.active: Dict[int, int] = {}  # foydalanuvchi -> navbatdagi va yuborilayotgan ishlar
+        self.inflight: Dict[Tuple[int, str], int] = {}  # (foydalanuvchi, fasl) -> ishda yuboriladigan qismlar
+        self._tasks: List[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0  # allaqachon ketayotgan ishga qo'shilgan takroriy so'rovlar
+        self.saved_sends = 0  # takroriy so'rovlar yubormay qolgan qismlar
+
+    async def send_with_retry(self, chat_id: int, call: Callable[[], Awaitable[Any]], cost: int = 1) -> Any:
+        """Tezlik cheklovi ichida yuborish; tarmoq va 5xx xatolarida cheklangan eksponensial kutish (full jitter) bilan
+        qayta urinadi. RetryAfter ni rate_limiter o'zi kutadi, doimiy xatolar darhol chaqiruvchiga qaytadi"""
+        for attempt in range(SEND_ATTEMPTS):
+            try:
+                return await self.rate_limiter.send(chat_id, call, cost)
+            except Exception as e:
+                if classify_send_error(e) != "transient" or attempt == SEND_ATTEMPTS - 1:
+                    raise
+                self.dead_letters.retries += 1
+                await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+    # 📦 Epizodlar media-group albomlar bilan yuboriladi (bitta so'rovda ALBUM_SIZE tagacha video)
+    async def send_episodes(self, message: Message, episodes: List[Tuple[str, str]],
+                            progress: Optional[Callable[[int], Awaitable[None]]] = None) -> None:
+        """(file_id, izoh) juftliklarini tartibni saqlab ALBUM_SIZE tadan albom qilib yuborish;
+        har bir qismdan keyin progress(yuborilganlar_soni) chaqiriladi"""
+        dead_letters = self.dead_letters
+        for start in range(0, len(episodes), ALBUM_SIZE):
+            # Avval yaroqsiz deb topilgan fayllar albomni buzmasligi uchun chiqarib tashlanadi
+            chunk = [(file_id, caption) for file_id, caption in episodes[start:start + ALBUM_SIZE] if file_id not in dead_letters.bad_files]
+            sent = False
+            if len(chunk) > 1:  # albomda kamida 2 ta element bo'lishi kerak
+                media = [InputMediaVideo(media=file_id, caption=caption or None) for file_id, caption in chunk]
+                try:
+                    await self.send_with_retry(message.chat.id, lambda: message.answer_media_group(media), len(media))
+                    sent = True
+                except TelegramBadRequest:
+                    pass  # Bitta yaroqsiz fayl butun albomni rad ettiradi: bu qism bittalab yuboriladi
+                except TelegramForbiddenError as e:
+                    await dead_letters.record(message.chat.id, chunk[0][0], e)
+                    raise  # Foydalanuvchi botni bloklagan: qolganini yuborishdan foyda yo'q
+            if not sent:
+                for file_id, caption in chunk:
+                    try:
+                        await self.send_with_retry(message.chat.id, lambda: message.answer_video(file_id, caption=caption or None))
+                    except TelegramBadRequest as e:
+                        await dead_letters.record(message.chat.id, file_id, e)  # bitta qism tushib qoladi, qolganlari ketadi
+                    except TelegramForbiddenError as e:
+                        await dead_letters.record(message.chat.id, file_id, e)
+                        raise
+            if progress is not None:
+                await progress(min(start + ALBUM_SIZE, len(episodes)))
+
+    async def edit_progress(self, progress: Message, text: str, markup: Optional[InlineKeyboardMarkup] = None) -> None:
+        """Jarayon xabarini joyida yangilash; xabar o'chirilgan, o'zgarmagan yoki bot bloklangan bo'lsa e'tiborsiz qoldiriladi"""
+        try:
+            await self.rate_limiter.send(progress.chat.id, lambda: progress.edit_text(text, reply_markup=markup))
+        except (TelegramBadRequest, TelegramForbiddenError):
+            pass
+
+    async def submit(self, user_id: int, message: Message, season_key: str, title: str,
+                     episodes: List[Tuple[str, str]], resume: bool = True) -> str:
+        """Foydalanuvchi to'xtagan joydan (resume=False bo'lsa 1-qismdan) CHUNK_EPISODES ta qismni navbatga qo'yish.
+        "queued" - navbatga qo'yildi, "attached" - shu fasl allaqachon yuborilmoqda, "busy" - foydalanuvchi chegarasida"""
+        flight = (user_id, season_key)
+        if flight in self.inflight:
+            # Takroriy bosish yangi ish ochmaydi: ketayotgan ishning jarayon xabari ikkalasiga ham javob
+            self.coalesced += 1
+            self.saved_sends += self.inflight[flight]
+            return "attached"
+        if self.active.get(user_id, 0) >= self.per_user:
+            return "busy"
+        self.active[user_id] = self.active.get(user_id, 0) + 1
+        start = self.cursors.resume(user_id, season_key, len(episodes)) if resume else 0
+        self.inflight[flight] = min(CHUNK_EPISODES, len(episodes) - start)
+        note = f" ({start + 1}-qismdan davom etamiz)" if start else ""
+        try:
+            progress = await message.answer(f"🎬 <b>{title}</b>\nNavbatda...{note}")
+        except Exception:
+            self._release(user_id)
+            self.inflight.pop(flight, None)
+            raise
+        self.queue.put_nowait((user_id, message, season_key, title, episodes, start, progress))
+        return "queued"
+
+    def _release(self, user_id: int) -> None:
+        left = self.active.pop(user_id, 1) - 1
+        if left > 0:
+            self.active[user_id] = left
+
+    async def _deliver(self, user_id: int, message: Message, season_key: str, title: str,
+                       episodes: List[Tuple[str, str]], start: int, progress: Message) -> None:
+        total = len(episodes)
+        end = min(start + CHUNK_EPISODES, total)
+        done = start
+
+        async def report(sent: int) -> None:
+            nonlocal done
+            done = start + sent
+            self.cursors.set(user_id, season_key, done)  # uzilishda shu joydan davom etiladi
+            if done < end:
+                await self.edit_progress(progress, f"🎬 <b>{title}</b>\nYuklanmoqda... {done}/{total}")
+
+        if not episodes:
+            await self.edit_progress(progress, f"🎬 <b>{title}</b>\n❌ Bu faslda hali qismlar yo‘q.")
+            return
+        try:
+            await self.send_episodes(message, episodes[start:end], report)
+        except Exception:
+            await self.edit_progress(
+                progress,
+                f"🎬 <b>{title}</b>\n❌ Yuborish to'xtadi: {done}/{total}. Tugma shu joydan davom ettiradi.",
+                continue_markup(season_key, "🔁 Davom ettirish")
+            )
+            raise
+        if end < total:
+            await self.edit_progress(
+                progress,
+                f"🎬 <b>{title}</b>\n✅ {start + 1}–{end}-qismlar yuborildi ({total} tadan).",
+                continue_markup(season_key, f"▶️ Keyingi {min(CHUNK_EPISODES, total - end)} ta")
+            )
+        else:
+            await self.edit_progress(progress, f"🎬 <b>{title}</b>\n✅ {start + 1}–{total}-qismlar yuborildi, fasl tugadi.")
+
+    async def _worker(self) -> None:
+        while True:
+            user_id, message, season_key, title, episodes, start, progress = await self.queue.get()
+            try:
+                await self._deliver(user_id, message, season_key, title, episodes, start, progress)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Xato: {title} yuborilmadi: {e}")
+            finally:
+                self._release(user_id)
+                self.inflight.pop((user_id, season_key), None)
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queue.qsize(),
+            "active": sum(self.active.values()),
+            "completed": self.completed,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "saved_sends": self.saved_sends
+        }
+
+    def report(self) -> str:
+        """/rate_stats javobi: tezlik cheklovi va navbat holati"""
+        stats = self.rate_limiter.stats()
+        jobs = self.stats()
+        return (
+            "🚦 Yuborish navbati:\n"
+            f"Yuborilgan: {stats['sends']}, RetryAfter: {stats['retry_afters']}, faol chatlar: {stats['chats']}\n"
+            f"Navbatda kutish: o'rtacha {stats['wait_avg'] * 1000:.0f} ms, p95 {stats['wait_p95'] * 1000:.0f} ms, "
+            f"eng ko'p {stats['wait_max'] * 1000:.0f} ms\n"
+            f"Fasllar: navbatda {jobs['queued']}, jarayonda {jobs['active']}, "
+            f"tugadi {jobs['completed']}, xato {jobs['failed']}\n"
+            f"Takroriy so'rovlar birlashtirildi: {jobs['coalesced']} (yuborilmagan qismlar: {jobs['saved_sends']})"
+        )
+
+    async def start(self) -> None:
+        """Kursor va dead letterlarni yuklab, ishchilarni ishga tushirish"""
+        await self.dead_letters.load()
+        await self.cursors.start()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.cursors.stop()
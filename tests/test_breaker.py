@@ -0,0 +1,142 @@
+"""animeprobot va animebotpost: circuit breaker va obuna tekshiruvining soxta Bot API ustidagi testlari"""
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+from aiogram.client import bot as aiogram_bot
+from aiogram.exceptions import TelegramServerError
+from aiogram.methods import GetChatMember
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(params=["animeprobot", "animebotpost"])
+def bot_module(request, tmp_path, monkeypatch):
+    """Botni vaqtinchalik papkada yuklash (katalog va jurnal fayllari shu yerda yaratiladi).
+    animebotpost bazaga faqat startup da ulanadi, breaker va degraded rejim esa xotirada ishlaydi"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(ROOT))  # delivery.py
+    monkeypatch.setattr(aiogram_bot, "validate_token", lambda token: True)
+    spec = importlib.util.spec_from_file_location(f"{request.param}_under_test", ROOT / f"{request.param}.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "MEMBERSHIP_TIMEOUT", 0.05)
+    return module
+
+
+class Member:
+    def __init__(self, status: str):
+        self.status = status
+
+
+class FakeBot:
+    """get_chat_member javoblari navbat bilan: status satri, istisno yoki "hang" (javob kelmaydi)"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls += 1
+        reply = self.replies.pop(0) if self.replies else "member"
+        if reply == "hang":
+            await asyncio.sleep(3600)
+        if isinstance(reply, Exception):
+            raise reply
+        return Member(reply)
+
+
+def server_error() -> TelegramServerError:
+    return TelegramServerError(GetChatMember(chat_id="@kanal", user_id=1), "Internal Server Error")
+
+
+def test_breaker_opens_after_consecutive_failures(bot_module):
+    breaker = bot_module.CircuitBreaker(failure_threshold=3, cooldown=60)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_breaker_half_open_probe_closes_on_success(bot_module):
+    breaker = bot_module.CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # sinov davomida ikkinchisi o'tmaydi
+    breaker.record(True, probe=True)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_breaker_half_open_probe_failure_reopens(bot_module):
+    breaker = bot_module.CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.allow()
+    breaker.record(False, probe=True)
+    assert breaker.state == "open"
+    assert breaker.stats()["opens"] == 2
+
+
+def test_late_response_does_not_release_probe(bot_module):
+    breaker = bot_module.CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.allow()  # sinov boshlandi
+    breaker.record(True)  # breaker yopiq paytda yuborilgan sekin so'rov javobi
+    breaker.state = "half_open"
+    assert not breaker.allow()
+    breaker.record(True, probe=True)
+    assert breaker.allow()
+
+
+def test_timeout_counts_as_failure_and_degrades(bot_module):
+    bot_module.bot = FakeBot("hang")
+    allowed = asyncio.run(bot_module.check_channel_member(1, "@kanal"))
+    assert allowed is True  # oxirgi ma'lum holat yo'q: ruxsat beriladi
+    assert bot_module.membership_breaker.failures == 1
+    assert bot_module.membership_breaker.degraded == 1
+    assert bot_module.membership_cache.peek(1, "@kanal") is None
+
+
+def test_server_errors_open_breaker_then_probe_recovers(bot_module, monkeypatch):
+    breaker = bot_module.CircuitBreaker(failure_threshold=2, cooldown=60)
+    monkeypatch.setattr(bot_module, "membership_breaker", breaker)
+    bot_module.bot = FakeBot(server_error(), server_error(), "left")
+
+    async def scenario():
+        await bot_module.check_channel_member(1, "@kanal")
+        await bot_module.check_channel_member(1, "@kanal")
+        assert breaker.state == "open"
+        await bot_module.check_channel_member(1, "@kanal")
+        assert bot_module.bot.calls == 2  # open holatda Bot API ga so'rov ketmaydi
+        breaker.opened_at -= 60
+        return await bot_module.check_channel_member(1, "@kanal")
+
+    assert asyncio.run(scenario()) is False
+    assert breaker.state == "closed"
+    assert breaker.stats()["probes"] == 1
+
+
+def test_degraded_status_uses_last_known_state(bot_module, monkeypatch):
+    bot_module.membership_cache.set(1, "@kanal", False)
+    assert bot_module.degraded_status(1, "@kanal") is False
+    bot_module.member_tracker.record("@kanal", 1, True)
+    assert bot_module.degraded_status(1, "@kanal") is True
+    assert bot_module.degraded_status(2, "@kanal") is True  # hech narsa ma'lum emas
+    bot_module.membership_cache.set(3, "@kanal", False)
+    monkeypatch.setattr(bot_module, "DEGRADED_MODE", "fail_open")
+    assert bot_module.degraded_status(3, "@kanal") is True
+    assert bot_module.membership_breaker.degraded == 4
+
+
+def test_degraded_status_rejects_unknown_mode(bot_module, monkeypatch):
+    monkeypatch.setattr(bot_module, "DEGRADED_MODE", "allow")
+    with pytest.raises(ValueError):
+        bot_module.degraded_status(1, "@kanal")